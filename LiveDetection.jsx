@@ -88,10 +88,20 @@ export default function LiveDetection() {
         try {
             const res = await fetch(`${BACKEND}/train`, { method: "POST" });
             const data = await res.json();
-            setTrainingResult(data);
-            // Refresh model info after training
-            const infoRes = await fetch(`${BACKEND}/model_info`);
-            if (infoRes.ok) setModelInfo(await infoRes.json());
+            if (!res.ok) {
+                setTrainingResult(data);
+            } else {
+                // Training runs in the background - poll model info until it finishes
+                let info;
+                do {
+                    await new Promise((resolve) => setTimeout(resolve, 2000));
+                    info = await (await fetch(`${BACKEND}/model_info`)).json();
+                } while (info.training?.state === "running");
+                setModelInfo(info);
+                setTrainingResult(info.training?.state === "done"
+                    ? { metrics: info.training.metrics }
+                    : { error: info.training?.error || "Training failed" });
+            }
         } catch (err) {
             setTrainingResult({ error: err.message });
         }
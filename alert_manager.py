@@ -1,65 +1,109 @@
 """
 Alert Management System
 Handles logging, notifications, and video clip saving
+Alerts go to the shared SQLite alert store; clips are encoded by a background
+ClipWriter - the detection thread only queues frames. With continuous
+recording on, alerts just reference a time range of the camera's segments
 """
-import cv2
 import os
+import time
 from datetime import datetime
-from collections import deque
 import config
+from preroll import PrerollBuffer
+from clip_writer import ClipWriter
+from alert_store import alert_store
+from recorder import SegmentRecorder
 
 
 class AlertManager:
-    def __init__(self):
-        """Initialize alert manager"""
+    def __init__(self, camera_id=None, store=None):
+        """
+        Initialize alert manager
+        camera_id: optional camera name, used to keep alerts and clips apart per camera
+        store: AlertStore to record alerts in (None = the shared alert_store)
+        """
+        self.camera_id = camera_id
+        self.store = store or alert_store
+        self.store.open()  # Before any clip is written - a new store imports existing clips
         self.alert_count = 0
-        self.last_alert_frame = -config.ALERT_COOLDOWN
-        self.frame_buffer = deque(maxlen=150)  # Store last 5 seconds at 30fps
-        self.is_recording_alert = False
-        self.alert_writer = None
-        self.alert_frames_remaining = 0
+        self.last_alert_time = None  # Capture time of the last alert
+        self.frame_buffer = PrerollBuffer()  # Last ALERT_CLIP_DURATION seconds, JPEG, every frame
+        self.last_capture_time = None
+        self._wall_offset = None  # Capture time -> recording clock (epoch seconds), set on the first frame
+        self.clip_writer = ClipWriter(name=f"clips-{camera_id}" if camera_id else "clips")
+        self.recordings = []  # [clip id, capture time to stop at] per clip taking live frames
+        self.recorder = SegmentRecorder(camera_id) if config.ENABLE_RECORDING else None
         
         # Create output directories
         self._create_directories()
-        
-        # Open log file
-        self.log_file = self._open_log_file()
     
     def _create_directories(self):
         """Create necessary output directories"""
         os.makedirs(config.OUTPUT_DIR, exist_ok=True)
         os.makedirs(config.ALERTS_DIR, exist_ok=True)
-        os.makedirs(config.LOGS_DIR, exist_ok=True)
     
-    def _open_log_file(self):
-        """Open log file for this session"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        log_path = os.path.join(config.LOGS_DIR, f"log_{timestamp}.txt")
-        log_file = open(log_path, 'w')
-        log_file.write(f"=== Violence Detection Log - {datetime.now()} ===\n\n")
-        return log_file
+    @property
+    def is_recording_alert(self):
+        return len(self.recordings) > 0
     
-    def update_buffer(self, frame):
-        """Add frame to circular buffer"""
-        self.frame_buffer.append(frame.copy())
+    def update_buffer(self, frame, capture_time=None):
+        """
+        Add frame to the pre-roll buffer (JPEG-compressed) - call for every frame
+        With continuous recording the frame goes to the current segment instead
+        capture_time: frame timestamp in seconds (None = now, monotonic clock)
+        """
+        previous = self.last_capture_time
+        self.last_capture_time = capture_time if capture_time is not None else time.monotonic()
+        if self.recorder:
+            if self._wall_offset is None or self.last_capture_time < previous:
+                # Anchor capture time to the epoch once (again if the source restarts)
+                self._wall_offset = time.time() - self.last_capture_time
+            self.recorder.write(frame, self.recording_time())
+        else:
+            self.frame_buffer.append(frame, self.last_capture_time)
     
-    def can_trigger_alert(self, current_frame):
-        """Check if enough time has passed since last alert"""
-        return (current_frame - self.last_alert_frame) >= config.ALERT_COOLDOWN
+    def can_trigger_alert(self, capture_time=None):
+        """
+        Check if ALERT_COOLDOWN seconds of capture time have passed since the last alert
+        capture_time: None = the last frame given to update_buffer() (or now)
+        """
+        if self.last_alert_time is None:
+            return True
+        now = self._capture_time(capture_time)
+        # Clock went back (restarted source) - the old alert doesn't count
+        return now - self.last_alert_time >= config.ALERT_COOLDOWN or now < self.last_alert_time
     
-    def trigger_alert(self, current_frame, alert_type="MOTION", details=None):
+    def recording_time(self, capture_time=None):
+        """
+        Position of a capture time in the continuous recording (epoch seconds)
+        Segments and alert clip ranges both use it, so media time of uploaded
+        files lines up with the frames actually written
+        """
+        if self._wall_offset is None:
+            return time.time()  # No frame recorded yet
+        return self._capture_time(capture_time) + self._wall_offset
+    
+    def _capture_time(self, capture_time=None):
+        if capture_time is not None:
+            return capture_time
+        return self.last_capture_time if self.last_capture_time is not None else time.monotonic()
+    
+    def trigger_alert(self, current_frame, alert_type="MOTION", details=None,
+                      score=None, people=None, reason=None):
         """
         Trigger an alert
         alert_type: type of alert ('MOTION', 'INTENSITY', 'VIOLENCE')
         details: additional information dictionary
+        score, people, reason: indexed / listed columns in the alert store
         """
-        if not self.can_trigger_alert(current_frame):
+        if not self.can_trigger_alert():
             return False
         
         self.alert_count += 1
-        self.last_alert_frame = current_frame
+        self.last_alert_time = self._capture_time()
         
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        now = datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
         
         # Log to console
         print(f"\n{'='*60}")
@@ -71,87 +115,83 @@ class AlertManager:
                 print(f"{key}: {value}")
         print(f"{'='*60}\n")
         
-        # Log to file
-        self.log_file.write(f"\n{'='*60}\n")
-        self.log_file.write(f"ALERT #{self.alert_count} - {alert_type}\n")
-        self.log_file.write(f"Time: {timestamp}\n")
-        self.log_file.write(f"Frame: {current_frame}\n")
-        if details:
-            for key, value in details.items():
-                self.log_file.write(f"{key}: {value}\n")
-        self.log_file.write(f"{'='*60}\n")
-        self.log_file.flush()
+        # Save video clip if enabled - or just reference the continuous recording
+        clip = clip_start = clip_end = None
+        if self.recorder:
+            alert_time = self.recording_time()
+            clip_start = alert_time - config.ALERT_CLIP_DURATION
+            clip_end = alert_time + config.ALERT_CLIP_DURATION
+        elif config.SAVE_ALERT_CLIPS:
+            clip = self._start_alert_recording(timestamp)
         
-        # Save video clip if enabled
-        if config.SAVE_ALERT_CLIPS:
-            self._start_alert_recording(timestamp)
+        # Record in the alert store (batched commit on its writer thread)
+        self.store.add(self.camera_id, alert_type, score=score, people=people, reason=reason,
+                       frame=current_frame, clip=clip, details=details, timestamp=now.timestamp(),
+                       clip_start=clip_start, clip_end=clip_end)
         
         return True
     
     def _start_alert_recording(self, timestamp):
-        """Start recording alert video clip"""
+        """
+        Start recording alert video clip
+        Returns: clip filename (None when there is nothing buffered yet)
+        """
         if len(self.frame_buffer) == 0:
-            return
+            return None
         
         # Generate filename
         safe_timestamp = timestamp.replace(':', '-').replace(' ', '_')
-        filename = f"alert_{self.alert_count}_{safe_timestamp}.avi"
+        if self.camera_id:
+            filename = f"alert_{self.camera_id}_{self.alert_count}_{safe_timestamp}.avi"
+        else:
+            filename = f"alert_{self.alert_count}_{safe_timestamp}.avi"
         filepath = os.path.join(config.ALERTS_DIR, filename)
         
-        # Get frame dimensions
-        height, width = self.frame_buffer[0].shape[:2]
+        # Buffered frames (before alert) are decoded on the writer thread, not here
+        clip_id = self.clip_writer.open_clip(filepath, config.ALERT_CLIP_FPS, self.frame_buffer.snapshot())
         
-        # Create video writer
-        fourcc = cv2.VideoWriter_fourcc(*'XVID')
-        self.alert_writer = cv2.VideoWriter(
-            filepath,
-            fourcc,
-            30.0,
-            (width, height)
-        )
-        
-        # Write buffered frames (before alert)
-        for frame in self.frame_buffer:
-            self.alert_writer.write(frame)
-        
-        # Set flag to continue recording
-        self.is_recording_alert = True
-        self.alert_frames_remaining = int(config.ALERT_CLIP_DURATION * 30)  # frames after alert
+        # Keep recording - overlapping alerts each get their own clip
+        self.recordings.append([clip_id, self.last_capture_time + config.ALERT_CLIP_DURATION])
         
         print(f"📹 Recording alert clip: {filename}")
+        return filename
     
-    def update_recording(self, frame):
-        """Continue recording alert clip if active"""
-        if self.is_recording_alert and self.alert_writer:
-            self.alert_writer.write(frame)
-            self.alert_frames_remaining -= 1
-            
-            if self.alert_frames_remaining <= 0:
-                self._stop_alert_recording()
-    
-    def _stop_alert_recording(self):
-        """Stop recording alert clip"""
-        if self.alert_writer:
-            self.alert_writer.release()
-            self.alert_writer = None
-            self.is_recording_alert = False
-            print("✓ Alert clip saved")
+    def update_recording(self, frame, capture_time=None):
+        """
+        Queue a frame for every alert clip still recording (never blocks)
+        capture_time: same clock as update_buffer (None = now, monotonic clock)
+        """
+        if not self.recordings:
+            return
+        
+        capture_time = capture_time if capture_time is not None else time.monotonic()
+        self.clip_writer.write([clip_id for clip_id, _ in self.recordings], frame, capture_time)
+        
+        for clip_id, end_time in self.recordings:
+            if capture_time >= end_time:
+                self.clip_writer.close_clip(clip_id)
+        self.recordings = [recording for recording in self.recordings if capture_time < recording[1]]
     
     def get_stats(self):
         """Get current statistics"""
-        return {
+        stats = {
             'total_alerts': self.alert_count,
             'buffer_size': len(self.frame_buffer)
         }
+        stats.update(self.frame_buffer.get_stats())
+        stats.update(self.clip_writer.get_stats())
+        if self.recorder:
+            stats.update(self.recorder.get_stats())
+        return stats
     
     def close(self):
         """Clean up resources"""
-        if self.log_file:
-            self.log_file.write(f"\n=== Session ended - {datetime.now()} ===\n")
-            self.log_file.write(f"Total alerts: {self.alert_count}\n")
-            self.log_file.close()
-        
-        if self.alert_writer:
-            self._stop_alert_recording()
+        # Finish open clips (queued frames are still written)
+        for clip_id, _ in self.recordings:
+            self.clip_writer.close_clip(clip_id)
+        self.recordings = []
+        self.clip_writer.close(timeout=config.CLIP_WRITER_CLOSE_TIMEOUT)
+        if self.recorder:
+            self.recorder.close()
         
         print(f"\n✓ Session complete. Total alerts: {self.alert_count}")
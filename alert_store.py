@@ -0,0 +1,248 @@
+"""
+Alert Store
+Every alert from every camera in one embedded SQLite database (WAL mode):
+inserts are batched by a writer thread, queries use indexes on camera, time
+and score - so listing alerts stays fast with years of history
+"""
+import atexit
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import config
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    camera_id TEXT,
+    time REAL NOT NULL,
+    alert_type TEXT,
+    score REAL,
+    people INTEGER,
+    reason TEXT,
+    frame INTEGER,
+    clip TEXT,
+    clip_start REAL,
+    clip_end REAL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_camera_time ON alerts (camera_id, time);
+CREATE INDEX IF NOT EXISTS alerts_time ON alerts (time);
+CREATE INDEX IF NOT EXISTS alerts_score ON alerts (score);
+"""
+
+COLUMNS = ('camera_id', 'time', 'alert_type', 'score', 'people', 'reason', 'frame', 'clip',
+           'clip_start', 'clip_end', 'details')
+# Added after the first release - ALTERed into older databases
+ADDED_COLUMNS = (('clip_start', 'REAL'), ('clip_end', 'REAL'))
+
+# Clip names written before the store existed: alert_<camera>_<n>_<YYYY-MM-DD_HH-MM-SS>.avi
+LEGACY_CLIP = re.compile(r'^alert_(?:(.+)_)?\d+_(\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d)\.avi$')
+
+
+def parse_time(value):
+    """Epoch seconds from a number or an ISO / 'YYYY-MM-DD HH:MM:SS' string (None passes through)"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+def page_limit(limit=None):
+    """Rows per page: 1..ALERT_PAGE_MAX (None = config.ALERT_PAGE_SIZE)"""
+    if limit is None:
+        return config.ALERT_PAGE_SIZE
+    return max(1, min(int(limit), config.ALERT_PAGE_MAX))
+
+
+class AlertStore:
+    def __init__(self, path=None):
+        """
+        path: SQLite file (None = config.ALERT_DB_PATH) - opened on first use
+        """
+        self.path = path or config.ALERT_DB_PATH
+        self._queue = queue.Queue()
+        self._local = threading.local()  # One read connection per thread
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ready = False
+        self.rows_written = 0
+        self.batches = 0
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10.0)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def open(self):
+        """Create the schema (once, importing clips already on disk) and start the writer thread"""
+        with self._lock:
+            if self._ready:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = self._connect()
+            connection.execute("PRAGMA journal_mode=WAL")
+            created = connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='alerts'"
+            ).fetchone() is None
+            connection.executescript(SCHEMA)
+            existing = {row['name'] for row in connection.execute("PRAGMA table_info(alerts)")}
+            for name, kind in ADDED_COLUMNS:
+                if name not in existing:
+                    connection.execute(f"ALTER TABLE alerts ADD COLUMN {name} {kind}")
+            if created:
+                self._import_clips(connection, config.ALERTS_DIR)
+            connection.commit()
+            connection.close()
+
+            self._thread = threading.Thread(target=self._run, name='alert-store', daemon=True)
+            self._thread.start()
+            self._ready = True
+
+    def _import_clips(self, connection, alerts_dir):
+        """New database: keep clips saved before the store existed listed"""
+        if not os.path.isdir(alerts_dir):
+            return
+        rows = []
+        for filename in os.listdir(alerts_dir):
+            match = LEGACY_CLIP.match(filename)
+            if match:
+                filepath = os.path.join(alerts_dir, filename)
+                rows.append((match.group(1), os.path.getmtime(filepath), 'VIOLENCE DETECTED',
+                             None, None, None, None, filename, None, None, None))
+        connection.executemany(
+            f"INSERT INTO alerts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+        )
+        if rows:
+            print(f"✓ Imported {len(rows)} saved alert clips into {self.path}")
+
+    def add(self, camera_id, alert_type, score=None, people=None, reason=None,
+            frame=None, clip=None, details=None, timestamp=None, clip_start=None, clip_end=None):
+        """
+        Queue an alert for the writer thread (never waits for the disk)
+        timestamp: epoch seconds (None = now)
+        clip: saved clip filename, or clip_start/clip_end: epoch range in the camera's recording
+        """
+        self.open()
+        self._queue.put((
+            camera_id,
+            timestamp if timestamp is not None else time.time(),
+            alert_type,
+            score,
+            people,
+            reason,
+            frame,
+            clip,
+            clip_start,
+            clip_end,
+            json.dumps(details, default=str) if details else None
+        ))
+
+    def _run(self):
+        """Writer thread: one transaction per batch of queued alerts"""
+        connection = self._connect()
+        connection.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, no fsync per commit
+        insert = f"INSERT INTO alerts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        while True:
+            rows = [self._queue.get()]
+            # Collect whatever else arrives within the batch window
+            deadline = time.monotonic() + config.ALERT_DB_BATCH_SECONDS
+            while len(rows) < config.ALERT_DB_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            stop = None in rows
+            rows = [row for row in rows if row is not None]
+            if rows:
+                connection.executemany(insert, rows)
+                connection.commit()
+                self.rows_written += len(rows)
+                self.batches += 1
+            for _ in range(len(rows) + stop):
+                self._queue.task_done()
+            if stop:
+                break
+        connection.close()
+
+    def flush(self):
+        """Wait until every queued alert is committed"""
+        if self._ready:
+            self._queue.join()
+
+    def query(self, camera_id=None, since=None, until=None, min_score=None, max_score=None,
+              alert_type=None, before_id=None, limit=None):
+        """
+        Newest alerts first, filtered
+        since/until: epoch seconds
+        before_id: cursor - only alerts after this one in the listing (id of the last alert on the previous page)
+        Returns: list of alert dicts
+        """
+        self.open()
+        where, params = [], []
+        for clause, value in (("camera_id = ?", camera_id), ("time >= ?", since), ("time < ?", until),
+                              ("score >= ?", min_score), ("score <= ?", max_score),
+                              ("alert_type = ?", alert_type),
+                              ("(time, id) < (SELECT time, id FROM alerts WHERE id = ?)", before_id)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        limit = page_limit(limit)
+
+        sql = "SELECT * FROM alerts"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # Order by time (indexed), id breaks ties so the cursor is stable
+        sql += " ORDER BY time DESC, id DESC LIMIT ?"
+        rows = self._reader().execute(sql, params + [limit]).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def get(self, alert_id):
+        """One alert by id (None if unknown)"""
+        self.open()
+        row = self._reader().execute("SELECT * FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def _reader(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def _to_dict(self, row):
+        alert = dict(row)
+        alert['timestamp'] = alert['time']
+        alert['time'] = datetime.fromtimestamp(alert['time']).strftime('%Y-%m-%d %H:%M:%S')
+        alert['details'] = json.loads(alert['details']) if alert['details'] else {}
+        return alert
+
+    def get_stats(self):
+        """Get queued and written row counts"""
+        return {
+            'alert_db_queue': self._queue.qsize(),
+            'alert_db_rows_written': self.rows_written,
+            'alert_db_batches': self.batches
+        }
+
+    def close(self):
+        """Commit queued alerts and stop the writer thread"""
+        if self._ready:
+            self._queue.put(None)
+            self._thread.join()
+            self._ready = False
+
+
+# Shared by all cameras
+alert_store = AlertStore()
+atexit.register(alert_store.close)
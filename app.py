@@ -2,22 +2,27 @@
 Web-Based CCTV Violence Detection System
 Flask server with real-time video streaming, alerts, and VIDEO UPLOAD
 """
-from flask import Flask, render_template, Response, jsonify, request
+import time
+PROCESS_START = time.time()  # For the server startup time report
+
+from flask import Flask, render_template, Response, jsonify, request, send_file
 from flask_socketio import SocketIO, emit
 import cv2
 import numpy as np
 import threading
-import time
+import socket
 from datetime import datetime
 import json
 import os
+import re
 from werkzeug.utils import secure_filename
 
-from video_input import VideoInput
-from motion_detector import MotionDetector
-from person_detector import PersonDetector
-from alert_manager import AlertManager
-from smart_detector import RealAdvancedDetector
+from camera_manager import CameraManager, make_stats
+from tracker import TrackingPersonDetector
+from model_pool import model_pool
+from alert_store import alert_store, page_limit, parse_time
+from recorder import clip_exports, list_segments
+import violence_model
 import config
 
 app = Flask(__name__)
@@ -35,42 +40,16 @@ ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'flv', 'wmv', 'webm'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Global state
-class DetectionState:
-    def __init__(self):
-        self.running = False
-        self.mode = 'advanced'
-        self.video_source = 0
-        
-        # Detection system components
-        self.video_input = None
-        self.detector = None
-        self.person_detector = None
-        self.alert_manager = None
-        self.advanced_detector = None  # NEW: Advanced violence analysis
-        
-        # Current frame and stats
-        self.current_frame = None
-        self.frame_lock = threading.Lock()
-        
-        # Statistics
-        self.stats = {
-            'total_alerts': 0,
-            'people_count': 0,
-            'violence_score': 0.0,
-            'is_monitoring': False,
-            'current_mode': 'advanced',
-            'fps': 0,
-            'frame_count': 0,
-            'motion_detected': False,
-            'last_alert_time': None,
-            'video_source_type': 'camera'  # 'camera' or 'uploaded'
-        }
-        
-        # Detection thread
-        self.detection_thread = None
+# Global camera registry (one session per camera, shared YOLO model)
+cameras = CameraManager()
+
+CAMERA_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
 
-state = DetectionState()
+def valid_camera_id(camera_id):
+    return bool(CAMERA_ID_PATTERN.match(str(camera_id)))
+
+# Seconds from process start until the server accepted connections
+server_startup_time = None
 
 
 @app.route('/')
@@ -132,172 +111,351 @@ def get_uploaded_videos():
     return jsonify(videos)
 
 
-@app.route('/api/start', methods=['POST'])
-def start_monitoring():
-    """Start the violence detection system"""
-    if state.running:
+def start_camera(camera_id, data):
+    """Start detection on one camera from a JSON request body"""
+    if not valid_camera_id(camera_id):
+        return jsonify({'status': 'error', 'message': 'Invalid camera ID'})
+    
+    if cameras.is_running(camera_id):
         return jsonify({'status': 'error', 'message': 'Already running'})
     
     try:
-        data = request.get_json()
-        state.mode = data.get('mode', 'advanced')
+        mode = data.get('mode', 'advanced')
         source = data.get('source', 0)
         
         # Check if source is uploaded video path or camera
         if isinstance(source, str) and source.startswith('uploads/'):
-            state.stats['video_source_type'] = 'uploaded'
+            source_type = 'uploaded'
         else:
-            state.stats['video_source_type'] = 'camera'
+            source_type = 'camera'
         
         # Try to convert to int for camera ID
         try:
-            state.video_source = int(source)
+            video_source = int(source)
         except ValueError:
-            state.video_source = source
+            video_source = source
         
-        # Initialize components
-        state.video_input = VideoInput(state.video_source)
-        state.detector = MotionDetector(state.mode)
-        state.person_detector = PersonDetector() if state.mode == 'advanced' else None
-        # REAL advanced detector that actually works!
-        state.advanced_detector = RealAdvancedDetector() if state.mode == 'advanced' else None
-        state.alert_manager = AlertManager()
+        # Uploaded videos: optional frame stride and time range
+        stride, start_time, end_time = 1, None, None
+        if source_type == 'uploaded':
+            try:
+                stride = int(data.get('stride', config.UPLOAD_FRAME_STRIDE))
+                start_time = float(data['start_time']) if data.get('start_time') is not None else None
+                end_time = float(data['end_time']) if data.get('end_time') is not None else None
+            except (TypeError, ValueError):
+                return jsonify({'status': 'error', 'message': 'stride, start_time and end_time must be numbers'}), 400
+            if stride < 1:
+                return jsonify({'status': 'error', 'message': 'stride must be at least 1'}), 400
+            if (start_time is not None and start_time < 0) or (end_time is not None and end_time < 0):
+                return jsonify({'status': 'error', 'message': 'start_time and end_time must not be negative'}), 400
+            if end_time is not None and end_time <= (start_time or 0):
+                return jsonify({'status': 'error', 'message': 'end_time must be after start_time'}), 400
         
-        # Start detection in background thread
-        state.running = True
-        state.detection_thread = threading.Thread(target=run_detection, daemon=True)
-        state.detection_thread.start()
+        # Processing rate the quality controller holds (None = config.TARGET_FPS)
+        target_fps = data.get('target_fps')
+        if target_fps is not None:
+            try:
+                target_fps = float(target_fps)
+            except (TypeError, ValueError):
+                return jsonify({'status': 'error', 'message': 'target_fps must be a number'}), 400
+            if not target_fps > 0:
+                return jsonify({'status': 'error', 'message': 'target_fps must be positive'}), 400
         
-        state.stats['is_monitoring'] = True
-        state.stats['current_mode'] = state.mode
+        # Start detection in background thread
+        cameras.start_camera(
+            camera_id,
+            video_source,
+            run_detection,
+            mode=mode,
+            source_type=source_type,
+            stride=stride,
+            start_time=start_time,
+            end_time=end_time,
+            target_fps=target_fps
+        )
         
-        return jsonify({'status': 'success', 'message': 'Monitoring started'})
+        return jsonify({'status': 'success', 'message': 'Monitoring started', 'camera_id': camera_id})
     
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)})
 
 
+def stop_camera(camera_id):
+    """Stop detection on one camera"""
+    if not cameras.stop_camera(camera_id):
+        return jsonify({'status': 'error', 'message': 'Not running'})
+    
+    return jsonify({'status': 'success', 'message': 'Stopping...', 'camera_id': camera_id})
+
+
+@app.route('/api/start', methods=['POST'])
+def start_monitoring():
+    """Start the violence detection system (camera_id optional, defaults to the main camera)"""
+    data = request.get_json(silent=True) or {}
+    return start_camera(data.get('camera_id', config.DEFAULT_CAMERA_ID), data)
+
+
 @app.route('/api/stop', methods=['POST'])
 def stop_monitoring():
     """Stop the violence detection system"""
-    if not state.running:
-        return jsonify({'status': 'error', 'message': 'Not running'})
-    
-    # Set flag to stop (background thread will clean up)
-    state.running = False
-    state.stats['is_monitoring'] = False
-    
-    # Quick cleanup in background
-    def cleanup():
-        time.sleep(0.5)  # Give thread time to finish
-        if state.video_input:
-            try:
-                state.video_input.release()
-            except:
-                pass
-        if state.alert_manager:
-            try:
-                state.alert_manager.close()
-            except:
-                pass
-    
-    threading.Thread(target=cleanup, daemon=True).start()
-    
-    return jsonify({'status': 'success', 'message': 'Stopping...'})
+    data = request.get_json(silent=True) or {}
+    return stop_camera(data.get('camera_id', config.DEFAULT_CAMERA_ID))
 
 
 @app.route('/api/stats')
 def get_stats():
-    """Get current statistics"""
-    return jsonify(state.stats)
+    """Get current statistics (main camera)"""
+    session = cameras.get(request.args.get('camera_id', config.DEFAULT_CAMERA_ID))
+    if session is None:
+        return jsonify(make_stats(config.DEFAULT_CAMERA_ID))
+    return jsonify(session.stats)
+
+
+@app.route('/api/cameras')
+def list_cameras():
+    """Get statistics for every registered camera"""
+    return jsonify(cameras.list_stats())
+
+
+@app.route('/api/system')
+def system_stats():
+    """Get server startup time, model load status, alert store writes and per-camera time-to-first-detection"""
+    return jsonify({
+        'server_startup_time': server_startup_time,
+        'uptime': round(time.time() - PROCESS_START, 1),
+        'models': model_pool.get_stats(),
+        'alert_store': alert_store.get_stats(),
+        'time_to_first_detection': {
+            stats['camera_id']: stats['time_to_first_detection'] for stats in cameras.list_stats()
+        }
+    })
+
+
+@app.route('/api/inference')
+def inference_stats():
+    """Get shared person detector batching metrics (batch size, latency, throughput)"""
+    return jsonify(cameras.get_inference_stats())
+
+
+@app.route('/api/cameras/<camera_id>/start', methods=['POST'])
+def start_camera_route(camera_id):
+    """Start detection on a specific camera"""
+    return start_camera(camera_id, request.get_json(silent=True) or {})
+
+
+@app.route('/api/cameras/<camera_id>/stop', methods=['POST'])
+def stop_camera_route(camera_id):
+    """Stop detection on a specific camera"""
+    return stop_camera(camera_id)
+
+
+@app.route('/api/cameras/<camera_id>/stats')
+def camera_stats(camera_id):
+    """Get statistics for a specific camera"""
+    session = cameras.get(camera_id)
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'Unknown camera'}), 404
+    return jsonify(session.stats)
 
 
 @app.route('/api/alerts')
 def get_alerts():
-    """Get list of saved alert videos"""
-    alerts_dir = config.ALERTS_DIR
-    alerts = []
+    """
+    Alerts from the alert store, newest first, one page at a time
+    Query: camera, type, since, until (epoch seconds or ISO time), min_score, max_score,
+           limit, before (cursor: 'next_before' from the previous page)
+    """
+    args = request.args
+    limit = page_limit(args.get('limit', type=int))
+    try:
+        alerts = alert_store.query(
+            camera_id=args.get('camera') or None,
+            alert_type=args.get('type') or None,
+            since=parse_time(args.get('since')),
+            until=parse_time(args.get('until')),
+            min_score=args.get('min_score', type=float),
+            max_score=args.get('max_score', type=float),
+            before_id=args.get('before', type=int),
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f"Invalid filter: {e}"}), 400
     
-    if os.path.exists(alerts_dir):
-        for filename in sorted(os.listdir(alerts_dir), reverse=True):
-            if filename.endswith('.avi'):
-                filepath = os.path.join(alerts_dir, filename)
-                alerts.append({
-                    'filename': filename,
-                    'size': os.path.getsize(filepath),
-                    'time': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S')
-                })
+    # Clip sizes for this page only (clips still recording show their size so far)
+    for alert in alerts:
+        filepath = os.path.join(config.ALERTS_DIR, alert['clip']) if alert['clip'] else None
+        alert['filename'] = alert['clip']
+        alert['size'] = os.path.getsize(filepath) if filepath and os.path.exists(filepath) else None
+        has_clip = alert['clip'] or alert['clip_start'] is not None
+        alert['clip_url'] = f"/api/alerts/{alert['id']}/clip" if has_clip else None
+    
+    return jsonify({
+        'alerts': alerts,
+        'next_before': alerts[-1]['id'] if len(alerts) == limit else None
+    })
+
+
+@app.route('/api/alerts/<int:alert_id>/clip')
+def download_alert_clip(alert_id):
+    """
+    Download an alert's clip
+    Alerts on continuously recorded cameras only reference a time range - the clip
+    is cut from the recording segments in the background on the first request
+    (202 until it is ready) and kept afterwards
+    """
+    alert = alert_store.get(alert_id)
+    if alert is None:
+        return jsonify({'status': 'error', 'message': 'Unknown alert'}), 404
+    
+    if alert['clip']:
+        filepath = os.path.join(config.ALERTS_DIR, alert['clip'])
+    elif alert['clip_start'] is not None:
+        filepath = os.path.join(config.ALERTS_DIR, f"alert_{alert_id}.avi")
+        if not os.path.exists(filepath):
+            # The segment holding the end may not be finished yet
+            segments = list_segments(alert['camera_id'])
+            recording = time.time() < alert['clip_end'] + 2 * config.SEGMENT_SECONDS
+            if recording and (not segments or segments[-1][1] < alert['clip_end']):
+                return jsonify({'status': 'error', 'message': 'Clip is still being recorded, try again shortly'}), 409
+            state, error = clip_exports.request(alert['camera_id'], alert['clip_start'],
+                                                alert['clip_end'], filepath)
+            if state == 'running':
+                return (jsonify({'status': 'exporting', 'message': 'Clip is being cut from the recording, try again shortly'}),
+                        202, {'Retry-After': '2'})
+            if state == 'failed':
+                if isinstance(error, RuntimeError):
+                    return jsonify({'status': 'error', 'message': f"Recording expired: {error}"}), 410
+                return jsonify({'status': 'error', 'message': f"Clip export failed: {error}"}), 500
+    else:
+        return jsonify({'status': 'error', 'message': 'No clip saved for this alert'}), 404
+    
+    if not os.path.exists(filepath):
+        return jsonify({'status': 'error', 'message': 'Clip file missing'}), 404
+    return send_file(os.path.abspath(filepath), as_attachment=True)
+
+
+@app.route('/train', methods=['POST'])
+def train_model():
+    """
+    Start training the learned violence scorer on the listed videos (background job)
+    Features are cached per video, so only new videos are decoded
+    Progress and the final metrics are in /model_info under 'training'
+    """
+    try:
+        training = violence_model.start_training(cameras.get_person_detector,
+                                                 on_trained=cameras.set_violence_scorer)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': f"Unusable training data: {e}"}), 400
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 409
     
-    return jsonify(alerts[:10])  # Return last 10 alerts
+    return jsonify({'status': 'started', 'training': training}), 202
 
 
-def run_detection():
-    """Main detection loop running in background"""
+@app.route('/model_info')
+def model_info():
+    """Learned violence scorer: whether it is loaded, plus its last training report"""
+    return jsonify(violence_model.model_info(model_pool.peek('violence_scorer')))
+
+
+def run_detection(session):
+    """Main detection loop for one camera, running in its own background thread"""
     try:
-        state.video_input.open()
+        session.video_input.open()
         
-        ret, prev_frame = state.video_input.read_frame()
+        ret, _ = session.video_input.read_frame()
         if not ret:
-            socketio.emit('error', {'message': 'Cannot read from video source'})
-            state.running = False
+            socketio.emit('error', {'message': 'Cannot read from video source', 'camera_id': session.camera_id})
+            session.running = False
             return
         
         frame_count = 0
         start_time = time.time()
         violence_alert_active = False
         
-        while state.running:
+        while session.running:
             # Quick exit check at start of loop
-            if not state.running:
+            if not session.running:
                 break
                 
-            ret, curr_frame = state.video_input.read_frame()
+            ret, curr_frame = session.video_input.read_frame()
             if not ret:
                 # Video ended (for uploaded videos)
-                if state.stats['video_source_type'] == 'uploaded':
-                    socketio.emit('video_ended', {'message': 'Video analysis complete'})
+                if session.stats['video_source_type'] == 'uploaded':
+                    socketio.emit('video_ended', {'message': 'Video analysis complete', 'camera_id': session.camera_id})
                 break
             
             frame_count += 1
+            frame_start = time.perf_counter()
+            # Capture time drives the time-based scoring (frame gaps from skips/strides are real gaps)
+            capture_time = session.video_input.get_timestamp()
             
             # Quick exit check during processing
-            if not state.running:
+            if not session.running:
                 break
             
             # Calculate FPS
             elapsed = time.time() - start_time
             fps = frame_count / elapsed if elapsed > 0 else 0
             
-            # FORCE SMALL RESOLUTION for maximum speed
-            curr_frame = cv2.resize(curr_frame, (480, 360))
-            prev_frame = cv2.resize(prev_frame, (480, 360)) if frame_count > 1 else curr_frame
+            # VideoInput delivers frames at the quality controller's size (resized once from
+            # the decoder); only the few frames buffered before a size change still need it
+            # Resized frames alternate between two pooled buffers so the previous one stays valid
+            width, height = session.frame_size
+            if curr_frame.shape[:2] != (height, width):
+                curr_frame = session.frame_pool.resize(f"frame{frame_count % 2}", curr_frame, (width, height))
             
-            # Update buffer less frequently (every 10 frames)
-            if frame_count % 10 == 0:
-                state.alert_manager.update_buffer(curr_frame)
+            # Pre-roll for alert clips - every frame, JPEG-compressed with its capture time
+            session.alert_manager.update_buffer(curr_frame, capture_time)
             
-            display_frame = curr_frame.copy()
+            # Display buffers rotate - the stream thread may still be encoding the last one
+            display_frame = session.frame_pool.copy('display', curr_frame, ring=3)
             
-            if state.mode == 'advanced' and state.person_detector:
-                # Person detection
-                people_detected, person_boxes = state.person_detector.detect_people(curr_frame)
+            if session.mode == 'advanced' and session.person_detector:
+                # Person detection - on crops around full-frame motion, or on the whole frame
+                motion_result = None
+                # The tracker predicts forward by the real gap between captures
+                track_time = {'timestamp': capture_time} if isinstance(session.person_detector, TrackingPersonDetector) else {}
+                if config.YOLO_ON_MOTION_ROIS:
+                    motion_result = session.detector.detect_motion_next(curr_frame, timestamp=capture_time)
+                    people_detected, person_boxes = session.person_detector.detect_people_in_rois(
+                        curr_frame, motion_result[1], **track_time
+                    )
+                else:
+                    people_detected, person_boxes = session.person_detector.detect_people(
+                        curr_frame, imgsz=session.detect_imgsz, **track_time
+                    )
                 
                 if people_detected:
                     # Draw person boxes
-                    display_frame = state.person_detector.draw_person_boxes(display_frame, person_boxes)
+                    display_frame = session.person_detector.draw_person_boxes(display_frame, person_boxes)
+                    
+                    # Motion detection in person regions (only the person crops are processed)
+                    if motion_result is not None:
+                        motion_detected, boxes, motion_mask = motion_result
+                    elif config.MOTION_IN_PERSON_ROIS:
+                        motion_detected, boxes, motion_mask = session.detector.detect_motion_rois(
+                            curr_frame, person_boxes, timestamp=capture_time
+                        )
+                    else:
+                        motion_detected, boxes, motion_mask = session.detector.detect_motion_next(
+                            curr_frame, timestamp=capture_time
+                        )
+                    session.detector.record_people_count(len(person_boxes))
                     
-                    # Motion detection in person regions
-                    person_mask = state.person_detector.create_person_mask(curr_frame, person_boxes)
-                    motion_detected, boxes, motion_mask = state.detector.detect_motion(prev_frame, curr_frame)
+                    # Budgeted optical flow inside the person boxes (speed / impact / chaos)
+                    flow = None
+                    if session.flow_extractor:
+                        flow = session.flow_extractor.update(curr_frame, person_boxes, timestamp=capture_time)
                     
                     # USE REAL ADVANCED VIOLENCE ANALYSIS
-                    if state.advanced_detector:
-                        violence_score, explanation = state.advanced_detector.analyze_violence(
-                            person_boxes, boxes, curr_frame.shape
+                    if session.advanced_detector:
+                        violence_score, explanation = session.advanced_detector.analyze_violence(
+                            person_boxes, boxes, curr_frame.shape, flow=flow, timestamp=capture_time
                         )
                     else:
                         # Fallback
-                        violence_score, _ = state.detector.calculate_violence_score()
+                        violence_score, _ = session.detector.calculate_violence_score()
                         explanation = "Basic analysis"
                     
                     # Draw motion boxes - THICK and VISIBLE
@@ -347,10 +505,10 @@ def run_detection():
                     if violence_score >= alert_threshold:
                         # FLASHING RED BACKGROUND
                         if frame_count % 10 < 5:  # Flash every 5 frames
-                            # Draw red semi-transparent overlay
-                            overlay = display_frame.copy()
-                            cv2.rectangle(overlay, (0, 0), (display_frame.shape[1], 100), (0, 0, 255), -1)
-                            cv2.addWeighted(overlay, 0.3, display_frame, 0.7, 0, display_frame)
+                            # Draw red semi-transparent overlay (blend only the top band in place)
+                            band = display_frame[:100]
+                            red = session.frame_pool.constant('alert_band', band.shape, (0, 0, 255))
+                            cv2.addWeighted(red, 0.3, band, 0.7, 0, band)
                         
                         # BIG VIOLENCE TEXT
                         cv2.putText(display_frame, "!!! VIOLENCE DETECTED !!!", (30, 150),
@@ -358,6 +516,7 @@ def run_detection():
                         
                         if not violence_alert_active:
                             alert_data = {
+                                'camera_id': session.camera_id,
                                 'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                                 'violence_score': violence_score,
                                 'people_count': len(person_boxes),
@@ -374,34 +533,43 @@ def run_detection():
                                 'Reason': explanation
                             }
                             
-                            state.alert_manager.trigger_alert(
+                            session.alert_manager.trigger_alert(
                                 frame_count,
                                 "VIOLENCE DETECTED",
-                                alert_details
+                                alert_details,
+                                score=violence_score,
+                                people=len(person_boxes),
+                                reason=explanation
                             )
                             
-                            state.stats['total_alerts'] += 1
-                            state.stats['last_alert_time'] = alert_data['time']
+                            session.stats['total_alerts'] += 1
+                            session.stats['last_alert_time'] = alert_data['time']
                             violence_alert_active = True
                     else:
                         violence_alert_active = False
                     
                     # Update stats EVERY FRAME for real-time display
-                    state.stats['people_count'] = len(person_boxes)
-                    state.stats['violence_score'] = violence_score
-                    state.stats['motion_detected'] = motion_detected
+                    session.stats['people_count'] = len(person_boxes)
+                    session.stats['violence_score'] = violence_score
+                    session.stats['motion_detected'] = motion_detected
                 else:
-                    # No people detected
+                    # No people detected - motion detector only keeps a reference to this frame
+                    if motion_result is None:
+                        session.detector.skip_frame(curr_frame)
+                    if session.flow_extractor:
+                        session.flow_extractor.skip_frame(curr_frame, timestamp=capture_time)
                     cv2.putText(display_frame, "No People Detected", (30, 30),
                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (100, 100, 100), 2)
                     
-                    state.stats['people_count'] = 0
-                    state.stats['violence_score'] = 0.0
-                    state.stats['motion_detected'] = False
+                    session.stats['people_count'] = 0
+                    session.stats['violence_score'] = 0.0
+                    session.stats['motion_detected'] = False
             
             else:
                 # Basic/Intermediate mode
-                motion_detected, boxes, motion_mask = state.detector.detect_motion(prev_frame, curr_frame)
+                motion_detected, boxes, motion_mask = session.detector.detect_motion_next(
+                    curr_frame, timestamp=capture_time
+                )
                 
                 for (x, y, w, h) in boxes:
                     cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
@@ -410,7 +578,12 @@ def run_detection():
                     cv2.putText(display_frame, "Motion Detected", (30, 30),
                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
                 
-                state.stats['motion_detected'] = motion_detected
+                session.stats['motion_detected'] = motion_detected
+            
+            # First analysed frame (includes waiting for the model to load)
+            if session.stats['time_to_first_detection'] is None:
+                session.stats['time_to_first_detection'] = round(time.time() - session.started_at, 3)
+                print(f"⏱ {session.camera_id}: first detection after {session.stats['time_to_first_detection']:.2f}s")
             
             # Add timestamp
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -418,49 +591,86 @@ def run_detection():
                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
             
             # Add source type indicator
-            source_text = "📹 Live Camera" if state.stats['video_source_type'] == 'camera' else "📁 Uploaded Video"
+            source_text = "📹 Live Camera" if session.stats['video_source_type'] == 'camera' else "📁 Uploaded Video"
             cv2.putText(display_frame, source_text, (30, display_frame.shape[0] - 20),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
             
-            # Update alert recording
-            state.alert_manager.update_recording(display_frame)
+            # Update alert recording (queued for the clip writer thread)
+            session.alert_manager.update_recording(display_frame, capture_time)
+            if session.alert_manager.is_recording_alert or frame_count % 30 == 0:
+                session.stats.update(session.alert_manager.clip_writer.get_stats())
+                session.stats.update(session.alert_manager.frame_buffer.get_stats())
+                if session.alert_manager.recorder:
+                    session.stats.update(session.alert_manager.recorder.get_stats())
             
             # Update stats
-            state.stats['fps'] = round(fps, 1)
-            state.stats['frame_count'] = frame_count
+            session.stats['fps'] = round(fps, 1)
+            session.stats['frame_count'] = frame_count
+            
+            # Capture backlog - shows when detection falls behind the camera
+            capture_stats = session.video_input.get_capture_stats()
+            session.stats['frames_dropped'] = capture_stats['frames_dropped']
+            session.stats['queue_depth'] = capture_stats['queue_depth']
+            session.stats['reconnects'] = capture_stats['reconnects']
+            
+            # Motion backend cost (pick the cheapest one that still gives stable boxes)
+            backend_stats = session.detector.get_backend_stats()
+            session.stats['motion_backend'] = backend_stats['backend']
+            session.stats['motion_backend_ms'] = backend_stats['avg_ms']
+            
+            # Optical flow cost and current point budget
+            if session.flow_extractor:
+                flow_stats = session.flow_extractor.get_stats()
+                session.stats['flow_ms'] = flow_stats['avg_ms']
+                session.stats['flow_points'] = flow_stats['last_points']
+            
+            # Detection stride (YOLO runs every N frames, tracker fills the gaps)
+            if isinstance(session.person_detector, TrackingPersonDetector):
+                stride_stats = session.person_detector.get_stats()
+                session.stats['detection_stride'] = stride_stats['stride']
+                session.stats['detect_ratio'] = stride_stats['detect_ratio']
+            
+            # Adaptive quality - step settings down/up to hold the camera's FPS target
+            if session.quality:
+                if session.quality.update((time.perf_counter() - frame_start) * 1000):
+                    session.apply_quality()
+                elif frame_count % 30 == 0:
+                    session.stats.update(session.quality.get_stats())
             
             # Store frame for streaming
-            with state.frame_lock:
-                state.current_frame = display_frame
+            with session.frame_lock:
+                session.current_frame = display_frame
             
             # Send stats update VERY FREQUENTLY (every 3 frames!)
             if frame_count % 3 == 0:
-                socketio.emit('stats_update', state.stats)
-            
-            prev_frame = curr_frame
+                socketio.emit('stats_update', session.stats)
             
             # NO delay for maximum speed!
     
     except Exception as e:
-        socketio.emit('error', {'message': str(e)})
-        print(f"Detection error: {e}")
+        socketio.emit('error', {'message': str(e), 'camera_id': session.camera_id})
+        print(f"Detection error ({session.camera_id}): {e}")
     
     finally:
-        state.running = False
-        # Cleanup is now handled in background by stop endpoint
+        session.running = False
+        session.stats['is_monitoring'] = False
+        # Source and alert resources are released by the session when this returns
 
 
-def generate_frames():
+def generate_frames(camera_id):
     """Generator function for video streaming - ULTRA OPTIMIZED"""
     while True:
-        with state.frame_lock:
-            if state.current_frame is None:
-                # Send placeholder frame
-                frame = np.zeros((360, 480, 3), dtype=np.uint8)
-                cv2.putText(frame, "No Video Feed", (150, 180),
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            else:
-                frame = state.current_frame
+        frame = None
+        session = cameras.get(camera_id)
+        if session is not None:
+            with session.frame_lock:
+                frame = session.current_frame
+        
+        if frame is None:
+            # Send placeholder frame
+            frame = np.zeros((360, 480, 3), dtype=np.uint8)
+            cv2.putText(frame, "No Video Feed", (150, 180),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
         
         # ULTRA FAST encoding - lowest quality for maximum speed
         ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 40])  # 40% quality for max speed
@@ -478,9 +688,10 @@ def generate_frames():
 
 
 @app.route('/video_feed')
-def video_feed():
-    """Video streaming route"""
-    return Response(generate_frames(),
+@app.route('/video_feed/<camera_id>')
+def video_feed(camera_id=None):
+    """Video streaming route (main camera unless a camera ID is given)"""
+    return Response(generate_frames(camera_id or config.DEFAULT_CAMERA_ID),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
@@ -488,7 +699,8 @@ def video_feed():
 def handle_connect():
     """Handle client connection"""
     print('Client connected')
-    emit('stats_update', state.stats)
+    for stats in cameras.list_stats():
+        emit('stats_update', stats)
 
 
 @socketio.on('disconnect')
@@ -497,6 +709,24 @@ def handle_disconnect():
     print('Client disconnected')
 
 
+def preload_when_listening(port, timeout=60.0):
+    """Wait until the server accepts connections, report startup time, then load models"""
+    global server_startup_time
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                break
+        except OSError:
+            time.sleep(0.05)
+    
+    server_startup_time = round(time.time() - PROCESS_START, 3)
+    print(f"✓ Server listening after {server_startup_time:.2f}s")
+    
+    if config.PRELOAD_MODELS:
+        cameras.preload_models()
+
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🌐 CCTV Violence Detection Web System")
@@ -506,4 +736,5 @@ if __name__ == '__main__':
     print("\n Press Ctrl+C to stop the server")
     print("="*60 + "\n")
     
+    threading.Thread(target=preload_when_listening, args=(5000,), daemon=True).start()
     socketio.run(app, host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,373 @@
+"""
+Performance Benchmarks
+Run: python benchmark.py <name> [--source video.mp4] [--frames N]
+Uses synthetic frames when no source video is given
+"""
+import argparse
+import time
+import tracemalloc
+import cv2
+import numpy as np
+import config
+
+
+def load_frames(source=None, count=300, size=(640, 480)):
+    """Load frames from a video file, or generate moving synthetic ones"""
+    frames = []
+    if source:
+        cap = cv2.VideoCapture(source)
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+        if not frames:
+            raise RuntimeError(f"No frames read from {source}")
+        return frames
+
+    width, height = size
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    for i in range(count):
+        frame = background.copy()
+        # Two "people" moving towards each other
+        x1 = 50 + (i * 3) % (width // 2)
+        x2 = width - 100 - (i * 4) % (width // 2)
+        cv2.rectangle(frame, (x1, 100), (x1 + 60, 300), (200, 180, 160), -1)
+        cv2.rectangle(frame, (x2, 120), (x2 + 60, 320), (160, 200, 180), -1)
+        frames.append(frame)
+    return frames
+
+
+def measure(step, frames, label):
+    """
+    Run step(frame, i) over all frames
+    Reports ms/frame and peak transient allocation per frame
+    """
+    # Warm up (first call allocates pooled buffers)
+    step(frames[0], 0)
+
+    tracemalloc.start()
+    peak_total = 0
+    start = time.perf_counter()
+    for i, frame in enumerate(frames):
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step(frame, i)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - base
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    ms = elapsed * 1000 / len(frames)
+    kb = peak_total / len(frames) / 1024
+    print(f"  {label:<10} {ms:8.2f} ms/frame   {kb:10.1f} KB allocated/frame")
+    return ms, kb
+
+
+def bench_frame_pool(frames):
+    """Legacy per-frame copies vs pooled dst= buffers (resize, display, overlay)"""
+    from frame_pool import FramePool
+    from motion_detector import MotionDetector
+
+    size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)
+
+    legacy_state = {'prev': None, 'detector': MotionDetector()}
+
+    def legacy(frame, i):
+        curr = cv2.resize(frame, size)
+        curr = cv2.resize(curr, (480, 360))
+        prev = legacy_state['prev'] if legacy_state['prev'] is not None else curr
+        prev = cv2.resize(prev, (480, 360))
+        display = curr.copy()
+        overlay = display.copy()
+        cv2.rectangle(overlay, (0, 0), (display.shape[1], 100), (0, 0, 255), -1)
+        cv2.addWeighted(overlay, 0.3, display, 0.7, 0, display)
+        legacy_state['detector'].detect_motion(prev, curr)
+        legacy_state['prev'] = curr
+
+    pool = FramePool()
+    pooled_state = {'prev': None, 'detector': MotionDetector()}
+
+    def pooled(frame, i):
+        curr = pool.resize(f"frame{i % 2}", frame, size)
+        prev = pooled_state['prev'] if pooled_state['prev'] is not None else curr
+        display = pool.copy('display', curr, ring=3)
+        band = display[:100]
+        cv2.addWeighted(pool.constant('band', band.shape, (0, 0, 255)), 0.3, band, 0.7, 0, band)
+        pooled_state['detector'].detect_motion(prev, curr)
+        pooled_state['prev'] = curr
+
+    print("frame_pool: per-frame pipeline allocations")
+    legacy_ms, legacy_kb = measure(legacy, frames, 'legacy')
+    pooled_ms, pooled_kb = measure(pooled, frames, 'pooled')
+    print(f"  speedup {legacy_ms / pooled_ms:.2f}x, allocations -{legacy_kb - pooled_kb:.0f} KB/frame")
+
+
+def bench_motion_stream(frames):
+    """Two-frame detect_motion vs streaming detect_motion_next (cached previous blur)"""
+    from motion_detector import MotionDetector
+
+    size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)
+    frames = [cv2.resize(frame, size) for frame in frames]
+
+    pair_detector = MotionDetector()
+
+    def pair(frame, i):
+        pair_detector.detect_motion(frames[i - 1] if i else frame, frame)
+
+    stream_detector = MotionDetector()
+
+    def stream(frame, i):
+        stream_detector.detect_motion_next(frame)
+
+    print("motion_stream: preprocessing each frame once")
+    pair_ms, _ = measure(pair, frames, 'two-frame')
+    stream_detector.reset_stream()
+    stream_ms, _ = measure(stream, frames, 'streaming')
+    print(f"  speedup {pair_ms / stream_ms:.2f}x")
+
+
+def bench_motion_backends(frames):
+    """Per-frame cost and box stability of each streaming motion backend"""
+    from motion_detector import MotionDetector
+    from motion_backends import BACKENDS
+
+    size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)
+    frames = [cv2.resize(frame, size) for frame in frames]
+
+    print("motion_backends: cost and stability (fewer, steadier regions is better)")
+    for name in BACKENDS:
+        detector = MotionDetector(backend=name)
+        regions = []
+        start = time.perf_counter()
+        for frame in frames:
+            _, boxes, _ = detector.detect_motion_next(frame)
+            regions.append(len(boxes))
+        total_ms = (time.perf_counter() - start) * 1000 / len(frames)
+        stats = detector.get_backend_stats()
+        print(f"  {name:<12} backend {stats['avg_ms']:6.2f} ms  total {total_ms:6.2f} ms/frame"
+              f"   regions {np.mean(regions):5.2f} +/- {np.std(regions):4.2f}")
+
+
+def box_iou(a, b):
+    """IoU of two (x, y, w, h) boxes"""
+    ix = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+def bench_motion_pyramid(frames):
+    """Full-resolution motion vs pyrDown levels: throughput and box agreement"""
+    from motion_detector import MotionDetector
+
+    size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)
+    frames = [cv2.resize(frame, size) for frame in frames]
+
+    results = {}
+    print("motion_pyramid: detection scale vs full resolution")
+    for level in (0, 1, 2):
+        detector = MotionDetector(pyramid_level=level)
+        boxes = []
+
+        def step(frame, i):
+            boxes.append(detector.detect_motion_next(frame)[1])
+
+        ms, _ = measure(step, frames, f'1/{2 ** level}')
+        results[level] = (ms, boxes[1:])  # Drop the warm-up call
+
+    base_ms, base_boxes = results[0]
+    for level in (1, 2):
+        ms, level_boxes = results[level]
+        ious = []
+        missed = extra = 0
+        for reference, found in zip(base_boxes, level_boxes):
+            # Best match for every full-resolution box
+            for box in reference:
+                best = max((box_iou(box, other) for other in found), default=0.0)
+                ious.append(best)
+                missed += best < 0.5
+            extra += sum(1 for other in found
+                         if max((box_iou(other, box) for box in reference), default=0.0) < 0.5)
+        total = len(ious)
+        print(f"  1/{2 ** level}: speedup {base_ms / ms:.2f}x   mean IoU {np.mean(ious) if ious else 0:.3f}"
+              f"   missed {missed}/{total}   extra {extra}")
+
+
+def bench_person_backends(frames):
+    """PyTorch vs ONNX Runtime (fp32, INT8) person detection: latency and agreement"""
+    from person_detector import PersonDetector
+    from tracker import iou_matrix, greedy_match
+    import onnx_backend
+
+    size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)
+    frames = [cv2.resize(frame, size) for frame in frames[:100]]
+
+    detectors = {'torch': PersonDetector('torch'), 'onnx': PersonDetector('onnx')}
+    int8 = PersonDetector('onnx')
+    # Calibrate on the benchmark frames unless a calibrated model is already cached
+    int8.model = onnx_backend.OnnxYOLO(onnx_backend.quantize_int8(int8.model.model_path, frames))
+    detectors['onnx-int8'] = int8
+
+    print("person_backends: latency and agreement with the PyTorch path")
+    results = {}
+    for name, detector in detectors.items():
+        people = []
+
+        def step(frame, i):
+            people.append(detector.detect_people(frame)[1])
+
+        ms, _ = measure(step, frames, name)
+        results[name] = (ms, people[1:])  # Drop the warm-up call
+
+    base_ms, base_people = results['torch']
+    for name in ('onnx', 'onnx-int8'):
+        ms, people = results[name]
+        matched = total = extra = 0
+        ious, conf_diffs = [], []
+        for reference, found in zip(base_people, people):
+            iou = iou_matrix([p['box'] for p in reference], [p['box'] for p in found])
+            matches = greedy_match(iou, 0.5)
+            matched += len(matches)
+            total += len(reference)
+            extra += len(found) - len(matches)
+            for r, c, value in matches:
+                ious.append(value)
+                conf_diffs.append(abs(reference[r]['confidence'] - found[c]['confidence']))
+        print(f"  {name}: speedup {base_ms / ms:.2f}x   matched {matched}/{total}   extra {extra}"
+              f"   mean IoU {np.mean(ious) if ious else 0:.3f}"
+              f"   mean |conf diff| {np.mean(conf_diffs) if conf_diffs else 0:.3f}")
+
+
+def _strike(t, period=0.55):
+    """Punch displacement at time t: 60 px lunge in 0.1 s, hold (the hit), slow pull back"""
+    phase = t % period
+    if phase < 0.1:
+        return 600 * phase
+    if phase < 0.25:
+        return 60.0
+    return 60 * (period - phase) / (period - 0.25)
+
+
+def synthetic_fight(count=300, size=(640, 480), fps=30):
+    """
+    Two people closing in, then trading blows
+    Returns: frames, true person boxes per frame (so replays don't depend on a detector)
+    """
+    width, height = size
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    frames, people = [], []
+    for i in range(count):
+        t = i / fps
+        # Approach at 150 px/s until 80 px apart, then alternate strikes
+        gap = max(80.0, width / 2 - 150 * t)
+        fighting = gap == 80.0
+        x1 = int(width / 2 - gap - 60 + (_strike(t) if fighting else 0))
+        x2 = int(width / 2 + gap - (_strike(t + 0.27) if fighting else 0))
+        y1 = int(100 + (20 * np.sin(2 * np.pi * 1.3 * t) if fighting else 0))
+        y2 = int(120 - (20 * np.sin(2 * np.pi * 1.7 * t) if fighting else 0))
+
+        frame = background.copy()
+        boxes = [(x1, y1, x1 + 60, y1 + 200), (x2, y2, x2 + 60, y2 + 200)]
+        for (bx1, by1, bx2, by2), color in zip(boxes, ((200, 180, 160), (160, 200, 180))):
+            cv2.rectangle(frame, (bx1, by1), (bx2, by2), color, -1)
+        frames.append(frame)
+        people.append([{'box': box, 'confidence': 0.9} for box in boxes])
+    return frames, people
+
+
+def replay_scores(frames, people, step, fps=30):
+    """
+    Score every step-th frame with its true capture timestamp (i / fps), as a
+    camera running at fps / step would deliver them
+    Returns: {frame index: (violence score, indicator scores, motion score)}
+    """
+    from motion_detector import MotionDetector
+    from optical_flow import FlowFeatureExtractor
+    from smart_detector import RealAdvancedDetector, FEATURE_NAMES
+    from detections import Detections
+
+    motion = MotionDetector('advanced')
+    flow_extractor = FlowFeatureExtractor() if config.OPTICAL_FLOW_ENABLED else None
+    detector = RealAdvancedDetector()
+
+    results = {}
+    for i in range(0, len(frames), step):
+        frame, persons, timestamp = frames[i], Detections.from_dicts(people[i]), i / fps
+        if not len(persons):
+            motion.skip_frame(frame)
+            if flow_extractor:
+                flow_extractor.skip_frame(frame, timestamp)
+            continue
+        _, boxes, _ = motion.detect_motion_rois(frame, persons, timestamp)
+        flow = flow_extractor.update(frame, persons, timestamp) if flow_extractor else None
+        score, _ = detector.analyze_violence(persons, boxes, frame.shape, flow=flow, timestamp=timestamp)
+        indicators = dict(zip(FEATURE_NAMES[:6], detector.features.last_row()[:6]))
+        results[i] = (score, indicators, motion.calculate_violence_score()[0])
+    return results
+
+
+def bench_replay(frames):
+    """Same footage replayed at 30 / 15 / 10 effective FPS: do the time-based scores agree?"""
+    from person_detector import PersonDetector
+
+    size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)
+    frames = [cv2.resize(frame, size) for frame in frames]
+
+    # Detect people once at the full rate - every replay sees the same boxes
+    detector = PersonDetector()
+    people = [detector.detect_people(frame)[1] for frame in frames]
+    if not any(len(persons) for persons in people):
+        print("replay: no people detected - using a synthetic fight scene")
+        frames, people = synthetic_fight(len(frames), size)
+
+    print("replay: scores at reduced FPS vs 30 FPS (frames treated as 30 FPS footage)")
+    base = replay_scores(frames, people, 1)
+    for step in (2, 3):
+        reduced = replay_scores(frames, people, step)
+        # Compare on the timeline both share (every 6th frame is on the 10 FPS grid too)
+        common = [i for i in reduced if i in base and i % 6 == 0]
+        if not common:
+            print(f"  {30 // step} FPS: no common scored frames")
+            continue
+        score_diff = np.mean([abs(reduced[i][0] - base[i][0]) for i in common])
+        motion_diff = np.mean([abs(reduced[i][2] - base[i][2]) for i in common])
+        agreement = []
+        for name in base[common[0]][1]:
+            same = np.mean([(reduced[i][1][name] > 0.5) == (base[i][1][name] > 0.5) for i in common])
+            agreement.append(f"{name} {same:.0%}")
+        alerts = np.mean([(reduced[i][0] >= 0.65) == (base[i][0] >= 0.65) for i in common])
+        print(f"  {30 // step} FPS: mean |score diff| {score_diff:.3f}   alert agreement {alerts:.0%}"
+              f"   motion |score diff| {motion_diff:.3f}   ({len(common)} frames)")
+        print(f"         indicators > 0.5 agree: {', '.join(agreement)}")
+
+
+BENCHMARKS = {
+    'frame_pool': bench_frame_pool,
+    'motion_stream': bench_motion_stream,
+    'motion_backends': bench_motion_backends,
+    'motion_pyramid': bench_motion_pyramid,
+    'person_backends': bench_person_backends,
+    'replay': bench_replay,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Violence detection pipeline benchmarks")
+    parser.add_argument('name', choices=sorted(BENCHMARKS) + ['all'])
+    parser.add_argument('--source', help="video file to benchmark on (default: synthetic frames)")
+    parser.add_argument('--frames', type=int, default=300, help="number of frames to use")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.frames)
+    names = sorted(BENCHMARKS) if args.name == 'all' else [args.name]
+    for name in names:
+        BENCHMARKS[name](frames)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+Multi-Camera Ingest Manager
+Runs many video sources at once in one process
+Each camera keeps its own motion/violence state, the YOLO model is shared
+"""
+import threading
+import time
+import config
+from video_input import VideoInput
+from motion_detector import MotionDetector
+from alert_manager import AlertManager
+from frame_pool import FramePool
+from person_detector import PersonDetector, BatchedPersonDetector
+from smart_detector import RealAdvancedDetector
+from optical_flow import FlowFeatureExtractor
+from tracker import TrackingPersonDetector
+from model_pool import model_pool
+from quality_controller import QualityController
+from violence_model import load_scorer
+
+
+def load_person_detector():
+    """Build the shared YOLO person detector (behind the batching front-end if enabled)"""
+    detector = PersonDetector()
+    if config.YOLO_BATCHING:
+        detector = BatchedPersonDetector(detector)
+    return detector
+
+
+def make_stats(camera_id, mode='advanced', source_type='camera'):
+    """Initial statistics for a camera (also reported for cameras not started yet)"""
+    return {
+        'camera_id': camera_id,
+        'total_alerts': 0,
+        'people_count': 0,
+        'violence_score': 0.0,
+        'is_monitoring': False,
+        'current_mode': mode,
+        'fps': 0,
+        'frame_count': 0,
+        'motion_detected': False,
+        'last_alert_time': None,
+        'video_source_type': source_type,  # 'camera' or 'uploaded'
+        'frames_dropped': 0,
+        'queue_depth': 0,
+        'reconnects': 0,
+        'motion_backend': None,
+        'motion_backend_ms': 0.0,
+        'flow_ms': 0.0,
+        'flow_points': 0,
+        'detection_stride': 1,
+        'detect_ratio': 0.0,
+        'time_to_first_detection': None,  # Seconds from start request to first analysed frame
+        'quality_level': 0,
+        'quality_max_level': len(config.QUALITY_LADDER) - 1,
+        'target_fps': config.TARGET_FPS,
+        'frame_ms': None,
+        'quality_settings': dict(config.QUALITY_LADDER[0]),
+        'quality_changes': 0,
+        'clip_queue': 0,  # Frames waiting for the alert clip writer (backpressure)
+        'clip_queue_max': config.CLIP_QUEUE_FRAMES,
+        'clip_queue_peak': 0,
+        'clips_recording': 0,
+        'clips_saved': 0,
+        'clip_frames_dropped': 0,
+        'clip_encode_ms': 0.0,
+        'preroll_frames': 0,
+        'preroll_seconds': 0.0,
+        'preroll_mb': 0.0,
+        'preroll_budget_mb': config.PREROLL_BUDGET_MB,
+        'preroll_budget_evictions': 0
+    }
+
+
+class CameraSession:
+    def __init__(self, camera_id, source, mode='advanced', source_type='camera',
+                 stride=1, start_time=None, end_time=None, target_fps=None):
+        """
+        Per-camera detection state
+        camera_id: registry key (e.g. 'cam1')
+        source: camera ID (int), video file path (str), or RTSP URL (str)
+        target_fps: processing rate the quality controller holds (None = config.TARGET_FPS)
+        """
+        self.camera_id = camera_id
+        self.video_source = source
+        self.mode = mode
+        self.running = False
+        self.started_at = time.time()
+        self.finished_at = None  # Set when the detection loop has exited and cleaned up
+
+        # Detection system components (person_detector is a shared handle)
+        self.video_input = VideoInput(
+            source,
+            threaded=config.THREADED_CAPTURE,
+            stride=stride,
+            start_time=start_time,
+            end_time=end_time
+        )
+        self.detector = MotionDetector(
+            mode,
+            backend=config.CAMERA_MOTION_BACKENDS.get(camera_id, config.MOTION_BACKEND)
+        )
+        self.person_detector = None  # Shared detector, or a per-camera TrackingPersonDetector around it
+        self.advanced_detector = RealAdvancedDetector() if mode == 'advanced' else None
+        self.flow_extractor = (FlowFeatureExtractor()
+                               if mode == 'advanced' and config.OPTICAL_FLOW_ENABLED else None)
+        self.alert_manager = AlertManager(camera_id)
+
+        # Reusable per-frame buffers (resize, display, overlay)
+        self.frame_pool = FramePool()
+
+        # Current frame and stats
+        self.current_frame = None
+        self.frame_lock = threading.Lock()
+
+        self.stats = make_stats(camera_id, mode, source_type)
+
+        # Adaptive quality - processing resolution and YOLO input size of the current level
+        self.quality = QualityController(target_fps) if config.QUALITY_CONTROL_ENABLED else None
+        self.frame_size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)
+        self.detect_imgsz = None  # None = model default
+        if self.quality:
+            self.stats.update(self.quality.get_stats())
+
+        # Detection thread
+        self.detection_thread = None
+        self._cleaned_up = False
+        self._cleanup_lock = threading.Lock()
+
+    def apply_quality(self):
+        """
+        Apply the quality controller's current settings to this camera's pipeline
+        A resolution change restarts the frame-to-frame state (motion, flow,
+        tracks, violence history) since old coordinates no longer line up
+        """
+        settings = self.quality.settings
+        if tuple(settings['resolution']) != self.frame_size:
+            self.frame_size = tuple(settings['resolution'])
+            self.video_input.set_output_size(*self.frame_size)  # Decoder output goes straight to this size
+            self.detector.reset_stream()
+            if self.flow_extractor:
+                self.flow_extractor.reset()
+            if self.advanced_detector:
+                self.advanced_detector.reset()
+            if isinstance(self.person_detector, TrackingPersonDetector):
+                self.person_detector.reset()
+
+        if settings['pyramid_level'] != self.detector.pyramid_level:
+            self.detector.set_pyramid_level(settings['pyramid_level'])
+        if isinstance(self.person_detector, TrackingPersonDetector):
+            self.person_detector.scheduler.set_min_stride(settings['detection_stride'])
+        self.detect_imgsz = settings['imgsz']
+
+        self.stats.update(self.quality.get_stats())
+        print(f"⏱ {self.camera_id}: quality level {self.quality.level} "
+              f"({self.quality.frame_ms:.1f} ms/frame, target {self.quality.target_fps:g} FPS) - {settings}")
+
+    def start(self, target, on_exit=None):
+        """
+        Start the detection loop for this camera in a background thread
+        However the loop ends (stop, file EOF, error) the session is cleaned up,
+        then on_exit(session) is called
+        """
+        self.running = True
+        self.stats['is_monitoring'] = True
+        self.detection_thread = threading.Thread(target=self._run, args=(target, on_exit), daemon=True)
+        self.detection_thread.start()
+
+    def _run(self, target, on_exit):
+        try:
+            target(self)
+        finally:
+            self.stop()
+            self.cleanup()
+            self.finished_at = time.time()
+            if on_exit:
+                on_exit(self)
+
+    def stop(self):
+        """Signal the detection loop to stop (resources released by cleanup())"""
+        self.running = False
+        self.stats['is_monitoring'] = False
+
+    def cleanup(self):
+        """Release video source and alert resources (once, from whichever thread gets here first)"""
+        with self._cleanup_lock:
+            if self._cleaned_up:
+                return
+            self._cleaned_up = True
+        if self.detection_thread and self.detection_thread is not threading.current_thread():
+            self.detection_thread.join(timeout=2.0)
+        try:
+            self.video_input.release()
+        except Exception:
+            pass
+        try:
+            self.alert_manager.close()
+        except Exception:
+            pass
+
+
+class CameraManager:
+    def __init__(self, max_cameras=None):
+        """
+        Registry of running cameras
+        The PersonDetector model comes from the process-wide model pool: loaded
+        once, warmed up, and shared by every session (behind a cross-camera
+        batching front-end when YOLO_BATCHING is on)
+        """
+        self.max_cameras = max_cameras or config.MAX_CAMERAS
+        self.sessions = {}
+        self.lock = threading.Lock()
+        model_pool.register('person', load_person_detector, warm_up=config.MODEL_WARMUP)
+        model_pool.register('violence_scorer', load_scorer, warm_up=False)
+
+    def preload_models(self):
+        """Start loading the shared models in the background"""
+        model_pool.preload('person')
+        model_pool.preload('violence_scorer')
+
+    def get_person_detector(self):
+        """Get the shared YOLO person detector (waits if it is still loading)"""
+        return model_pool.get('person')
+
+    def set_violence_scorer(self, scorer):
+        """Use a newly trained scorer for new and running cameras"""
+        model_pool.set('violence_scorer', scorer)
+        for session in list(self.sessions.values()):
+            if session.advanced_detector:
+                session.advanced_detector.scorer = scorer
+
+    def get_inference_stats(self):
+        """Get batching latency/throughput metrics of the shared person detector"""
+        detector = model_pool.peek('person')
+        if isinstance(detector, BatchedPersonDetector):
+            return detector.get_stats()
+        return {'batching': False, 'loaded': detector is not None}
+
+    def get(self, camera_id):
+        """Get a camera session (or None)"""
+        return self.sessions.get(camera_id)
+
+    def is_running(self, camera_id):
+        """Check if a camera is currently running"""
+        session = self.sessions.get(camera_id)
+        return session is not None and session.running
+
+    def start_camera(self, camera_id, source, target, mode='advanced', **options):
+        """
+        Create and start a camera session
+        target: detection loop function, called with the session
+        Returns: session
+        """
+        with self.lock:
+            if self.is_running(camera_id):
+                raise RuntimeError(f"Camera {camera_id} already running")
+
+            active = sum(1 for s in self.sessions.values() if s.running)
+            if active >= self.max_cameras:
+                raise RuntimeError(f"Camera limit reached ({self.max_cameras})")
+
+            session = CameraSession(camera_id, source, mode, **options)
+            session.running = True  # Reserve the slot while the model loads
+
+            # A stopped session under the same ID may still be releasing its source
+            old = self.sessions.get(camera_id)
+            if old is not None:
+                threading.Thread(target=old.cleanup, daemon=True).start()
+            self.sessions[camera_id] = session
+            self._prune()
+
+        try:
+            if mode == 'advanced':
+                session.person_detector = self.get_person_detector()
+                if config.TRACK_BETWEEN_DETECTIONS:
+                    session.person_detector = TrackingPersonDetector(session.person_detector)
+                try:
+                    session.advanced_detector.scorer = model_pool.get('violence_scorer')
+                except RuntimeError as e:
+                    print(f"❌ {e} - using hand-tuned violence weights")
+        except Exception:
+            session.stop()
+            session.cleanup()
+            raise
+
+        session.start(target, on_exit=self._session_finished)
+        return session
+
+    def _session_finished(self, session):
+        """Detection loop exited (session already cleaned up)"""
+        with self.lock:
+            self._prune()
+
+    def _prune(self):
+        """
+        Forget the oldest finished sessions beyond FINISHED_SESSIONS_KEPT (called with lock held)
+        The most recent ones stay listed so their final stats can still be read
+        """
+        finished = sorted((s for s in self.sessions.values() if s.finished_at is not None),
+                          key=lambda s: s.finished_at)
+        for session in finished[:max(0, len(finished) - config.FINISHED_SESSIONS_KEPT)]:
+            if self.sessions.get(session.camera_id) is session:
+                del self.sessions[session.camera_id]
+
+    def stop_camera(self, camera_id):
+        """
+        Stop a camera session (cleanup runs in the background)
+        Returns: True if the camera was running
+        """
+        session = self.sessions.get(camera_id)
+        if session is None or not session.running:
+            return False
+
+        session.stop()
+        threading.Thread(target=session.cleanup, daemon=True).start()
+        return True
+
+    def stop_all(self):
+        """Stop every running camera"""
+        for camera_id in list(self.sessions):
+            self.stop_camera(camera_id)
+
+    def list_stats(self):
+        """Get stats for all registered cameras"""
+        return [dict(session.stats) for session in list(self.sessions.values())]
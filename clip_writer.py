@@ -0,0 +1,189 @@
+"""
+Alert Clip Writer
+Encodes alert clips on a background thread fed by a bounded frame queue, so
+XVID encoding never runs on the detection thread. Any number of clips can be
+open at once (one queued frame feeds all of them); when the queue is full
+new frames are dropped and counted instead of blocking detection.
+Timestamped frames are placed on the clip's fixed-rate timeline, so clips
+play back in real time whatever rate frames arrived at
+"""
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+import config
+
+
+class ClipWriter:
+    def __init__(self, max_frames=None, name='clip-writer', log_saves=True):
+        """
+        max_frames: frames allowed to wait for encoding (None = config.CLIP_QUEUE_FRAMES)
+        name: writer thread name (e.g. per camera)
+        log_saves: print a line for every finished clip
+        """
+        self.max_frames = max_frames or config.CLIP_QUEUE_FRAMES
+        self.name = name
+        self.log_saves = log_saves
+        self._queue = queue.Queue()  # Commands - the frames in it are bounded by max_frames
+        self._lock = threading.Lock()
+        self._pending = 0            # Frames queued and not yet encoded
+        self._spare = []             # Frame buffers handed back by the writer thread for reuse
+        self._thread = None
+        self._next_id = 0
+
+        # Stats
+        self.clips_open = 0
+        self.clips_saved = 0
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.peak_pending = 0
+        self._encode_ms = 0.0
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def open_clip(self, path, fps, preroll=None):
+        """
+        Start a clip - frames are added with write(), finished with close_clip()
+        preroll: optional iterable of (timestamp, frame) written first, consumed on the writer thread
+        Returns: clip id
+        """
+        self._start()
+        clip_id = self._next_id
+        self._next_id += 1
+        self.clips_open += 1
+        self._queue.put(('open', clip_id, path, fps, preroll))
+        return clip_id
+
+    def write(self, clip_ids, frame, timestamp=None):
+        """
+        Queue one frame for one or more open clips (copied once, shared by all)
+        timestamp: capture time in seconds (None = one clip frame per call)
+        Never blocks: when the queue is full the frame is dropped
+        Returns: True if queued
+        """
+        with self._lock:
+            if self._pending >= self.max_frames:
+                self.frames_dropped += 1
+                return False
+            self._pending += 1
+            self.peak_pending = max(self.peak_pending, self._pending)
+            buffer = self._spare.pop() if self._spare else None
+
+        if buffer is None or buffer.shape != frame.shape or buffer.dtype != frame.dtype:
+            buffer = np.empty_like(frame)
+        np.copyto(buffer, frame)
+        self._queue.put(('frame', tuple(clip_ids), buffer, timestamp))
+        return True
+
+    def close_clip(self, clip_id, final_path=None):
+        """
+        Finish a clip once its queued frames are written
+        final_path: rename the finished file to this (readers never see a half-written clip)
+        """
+        self.clips_open -= 1
+        self._queue.put(('close', clip_id, final_path))
+
+    def _run(self):
+        """Writer thread: encode queued frames in order"""
+        clips = {}  # Clip id -> {'path', 'fps', 'writer', 'size', 'start', 'frames', 'final_path'}
+        while True:
+            command = self._queue.get()
+            kind = command[0]
+
+            if kind == 'open':
+                _, clip_id, path, fps, preroll = command
+                clip = clips[clip_id] = {'path': path, 'fps': fps, 'writer': None, 'size': None,
+                                         'start': None, 'frames': 0, 'final_path': None}
+                for timestamp, frame in preroll or ():
+                    self._encode(clip, frame, timestamp)
+            elif kind == 'frame':
+                _, clip_ids, buffer, timestamp = command
+                for clip_id in clip_ids:
+                    if clip_id in clips:
+                        self._encode(clips[clip_id], buffer, timestamp)
+                with self._lock:
+                    self._pending -= 1
+                    self._spare.append(buffer)
+            elif kind == 'close':
+                _, clip_id, final_path = command
+                clip = clips.pop(clip_id, None)
+                if clip:
+                    clip['final_path'] = final_path
+                    self._finish(clip)
+            else:  # 'stop'
+                break
+
+        for clip in clips.values():
+            self._finish(clip)
+
+    def _encode(self, clip, frame, timestamp=None):
+        """
+        Write a frame - with a timestamp it is repeated (slow source) or skipped
+        (fast source) to land on the clip's fixed fps timeline
+        """
+        copies = 1
+        if timestamp is not None:
+            if clip['start'] is None:
+                clip['start'] = timestamp
+            tick = int((timestamp - clip['start']) * clip['fps'] + 0.5)
+            copies = tick + 1 - clip['frames']
+            if copies <= 0:
+                return
+            if copies > clip['fps']:
+                # Gap over a second (stalled source) - cut it instead of freezing the clip
+                clip['start'] += (copies - 1) / clip['fps']
+                copies = 1
+
+        start = time.perf_counter()
+        if clip['writer'] is None:
+            # Clip size comes from its first frame
+            height, width = frame.shape[:2]
+            clip['size'] = (width, height)
+            clip['writer'] = cv2.VideoWriter(clip['path'], cv2.VideoWriter_fourcc(*'XVID'),
+                                             clip['fps'], clip['size'])
+        if (frame.shape[1], frame.shape[0]) != clip['size']:
+            # Processing resolution changed mid-clip (adaptive quality)
+            frame = cv2.resize(frame, clip['size'])
+        for _ in range(copies):
+            clip['writer'].write(frame)
+        clip['frames'] += copies
+        self.frames_written += copies
+        self._encode_ms += (time.perf_counter() - start) * 1000
+
+    def _finish(self, clip):
+        if clip['writer']:
+            clip['writer'].release()
+            path = clip['path']
+            if clip['final_path']:
+                try:
+                    os.replace(path, clip['final_path'])
+                    path = clip['final_path']
+                except OSError as e:
+                    print(f"❌ Could not finish clip {path}: {e}")
+            self.clips_saved += 1
+            if self.log_saves:
+                print(f"✓ Alert clip saved: {path}")
+
+    def get_stats(self):
+        """Get queue depth (backpressure), open clips and encode cost"""
+        return {
+            'clip_queue': self._pending,
+            'clip_queue_max': self.max_frames,
+            'clip_queue_peak': self.peak_pending,
+            'clips_recording': self.clips_open,
+            'clips_saved': self.clips_saved,
+            'clip_frames_dropped': self.frames_dropped,
+            'clip_encode_ms': round(self._encode_ms / self.frames_written, 2) if self.frames_written else 0.0
+        }
+
+    def close(self, timeout=None):
+        """Write everything still queued, release open clips and stop the thread"""
+        if self._thread is not None:
+            self._queue.put(('stop',))
+            self._thread.join(timeout)
+            self._thread = None
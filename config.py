@@ -9,9 +9,59 @@ FRAME_WIDTH = 480  # Smaller = MUCH faster (was 640)
 FRAME_HEIGHT = 360
 FPS = 30
 
+# ===== MULTI-CAMERA SETTINGS =====
+DEFAULT_CAMERA_ID = 'cam1'  # Camera used by the legacy single-stream endpoints
+MAX_CAMERAS = 16  # Concurrent camera sessions per process (YOLO model is shared)
+FINISHED_SESSIONS_KEPT = 16  # Ended sessions still listed (final stats); older ones are forgotten
+
+# ===== CAPTURE SETTINGS =====
+THREADED_CAPTURE = True  # Decode in a background thread so detector stalls don't back up the camera
+CAPTURE_MODE = None  # None = auto ('latest' for cameras/RTSP, 'ordered' for uploaded files)
+CAPTURE_BUFFER_SIZE = 4  # Preallocated ring buffer slots (min CAPTURE_CONSUMER_HOLD + 2)
+CAPTURE_CONSUMER_HOLD = 2  # Frames the detection loop may hold at once (curr + prev)
+CAPTURE_READ_TIMEOUT = 5.0  # Seconds without a frame before a stall is logged (reading keeps waiting)
+CAPTURE_RECONNECT_DELAY = 2.0  # Seconds between reopen attempts when a live source stops delivering
+
+# Uploaded video analysis
+UPLOAD_FRAME_STRIDE = 1  # Analyse every Nth frame of uploads (2-3 = several times faster)
+SEEK_STRIDE_THRESHOLD = 30  # Skips this long seek instead of grabbing each frame
+
 # ===== YOLO SETTINGS =====
 YOLO_MODEL_SIZE = 'yolov8n.pt'  # Nano model for speed (n=nano, s=small, m=medium)
 YOLO_CONFIDENCE = 0.6  # Higher = faster (skip low confidence detections)
+# Inference backend: 'torch' (ultralytics/PyTorch) or 'onnx' (ONNX Runtime on CPU, no PyTorch at runtime)
+DETECTION_BACKEND = 'torch'
+ONNX_MODEL_DIR = "models"  # Exported/quantized models are cached here
+ONNX_IMGSZ = 640
+ONNX_THREADS = 0  # Intra-op threads (0 = ONNX Runtime default)
+ONNX_INT8 = False  # Static INT8 quantization, calibrated on our own frames
+ONNX_CALIBRATION_SOURCE = "uploads"  # Video/image file or directory to calibrate on
+ONNX_CALIBRATION_FRAMES = 64
+# Motion-ROI detection: run YOLO on padded crops around motion at a smaller input size
+YOLO_ON_MOTION_ROIS = False
+ROI_DETECTION_IMGSZ = 320        # YOLO input size for crops
+ROI_DETECTION_PADDING = 0.5      # Crop padding around each motion box (fraction of its size)
+ROI_DETECTION_MIN_SIZE = 160     # Crops are at least this wide/high (a moving arm needs the whole person)
+ROI_DETECTION_MAX_COVERAGE = 0.5 # Above this fraction of the frame, run full-frame detection instead
+# Model pool: load models once per process in the background after the server starts listening
+PRELOAD_MODELS = True
+MODEL_WARMUP = True  # One inference on a blank frame right after loading
+# Cross-camera batching: pending frames from all cameras share one model call
+YOLO_BATCHING = True
+YOLO_MAX_BATCH = 8      # Frames per model call
+YOLO_MAX_WAIT_MS = 10   # Max time the first frame of a batch waits for others
+
+# ===== DETECTION STRIDE / TRACKING =====
+# Run YOLO every N frames and carry person boxes forward with a Kalman/IoU tracker in between
+TRACK_BETWEEN_DETECTIONS = True
+MIN_DETECTION_STRIDE = 1     # N while the scene is changing
+MAX_DETECTION_STRIDE = 5     # N while tracks predict detections well
+DETECTION_CHANGE_RATIO = 3.0 # Frame change this many times above normal forces a detection
+TRACKER_IOU_THRESHOLD = 0.3  # Min IoU to associate a detection with a track
+TRACKER_MAX_MISSES = 2       # Detection rounds a track survives unmatched
+# Per-person kinematics for violence scoring (speed/impact/chaos per track, not per list index)
+KINEMATIC_MATCH_DISTANCE = 0.5  # No IoU match: match centres within this fraction of the box diagonal
+KINEMATIC_MAX_MISSES = 5        # Frames a person track survives unseen
 
 # ===== MOTION DETECTION SETTINGS (OPTIMIZED FOR SPEED) =====
 # Basic motion detection
@@ -19,6 +69,50 @@ GAUSSIAN_BLUR_SIZE = (11, 11)  # Smaller = faster (was 15x15)
 MOTION_THRESHOLD = 30  # Higher = faster (less sensitive = less processing)
 MIN_CONTOUR_AREA = 2000  # Smaller for faster (was 3000)
 DILATION_ITERATIONS = 1  # Minimal processing
+MOTION_PYRAMID_LEVEL = 0  # Compute motion at 1/2**level scale (0 = full, 1 = half, 2 = quarter); boxes stay full-res
+
+# Motion backend: 'diff' (two-frame differencing), 'running_avg' (accumulateWeighted),
+# 'mog2' or 'knn' (OpenCV background subtraction - steadier masks on static CCTV scenes)
+MOTION_BACKEND = 'diff'
+CAMERA_MOTION_BACKENDS = {}  # Per-camera override, e.g. {'cam2': 'mog2'}
+RUNNING_AVG_ALPHA = 0.05  # Background learning rate for 'running_avg'
+BG_HISTORY = 300  # Frames of history for 'mog2' / 'knn'
+MOG2_VAR_THRESHOLD = 25  # Higher = less sensitive
+KNN_DIST2_THRESHOLD = 600.0  # Higher = less sensitive
+
+# Advanced mode: compute motion only inside person boxes (work scales with the area people cover)
+MOTION_IN_PERSON_ROIS = True
+MOTION_ROI_MAX_COVERAGE = 0.6  # Above this fraction of the frame, use one full-frame pass
+
+# ===== OPTICAL FLOW SETTINGS =====
+# Advanced mode: sparse Lucas-Kanade flow inside person boxes (speed / impact / chaos features)
+OPTICAL_FLOW_ENABLED = True
+FLOW_MAX_POINTS = 200          # Points tracked per frame across all people
+FLOW_POINTS_PER_PERSON = 60    # Cap for a single person
+FLOW_TIME_BUDGET_MS = 8.0      # Per-frame budget - point budget shrinks when exceeded
+FLOW_MIN_DISTANCE = 5          # Min spacing between tracked corners (px)
+FLOW_MIN_MAGNITUDE = 1.0       # Points moving less than this (px between frames, LK noise) are treated as still
+FLOW_SPEED_LEVELS = (90.0, 180.0, 300.0)  # Mean flow (px/s) for moderate / fast / very fast
+
+# ===== ADAPTIVE QUALITY =====
+# Per-camera feedback controller: when processing can't keep up with TARGET_FPS,
+# step down the ladder (cheaper settings); step back up when there is headroom
+QUALITY_CONTROL_ENABLED = True
+TARGET_FPS = 15  # Default per-camera target (override with 'target_fps' when starting a camera)
+QUALITY_SMOOTHING = 0.1        # EMA weight of the newest frame time
+QUALITY_HEADROOM = 0.6         # Step back up when frames take less than this fraction of the budget
+QUALITY_DEGRADE_FRAMES = 15    # Consecutive over-budget frames before stepping down
+QUALITY_RECOVER_FRAMES = 90    # Consecutive frames with headroom before stepping up
+QUALITY_LADDER = [
+    # Level 0 = configured quality
+    {'resolution': (FRAME_WIDTH, FRAME_HEIGHT), 'detection_stride': MIN_DETECTION_STRIDE, 'imgsz': 640, 'pyramid_level': MOTION_PYRAMID_LEVEL},
+    {'resolution': (416, 312), 'detection_stride': MIN_DETECTION_STRIDE, 'imgsz': 640, 'pyramid_level': MOTION_PYRAMID_LEVEL},
+    {'resolution': (416, 312), 'detection_stride': 2, 'imgsz': 640, 'pyramid_level': MOTION_PYRAMID_LEVEL},
+    {'resolution': (416, 312), 'detection_stride': 2, 'imgsz': 480, 'pyramid_level': MOTION_PYRAMID_LEVEL},
+    {'resolution': (416, 312), 'detection_stride': 2, 'imgsz': 480, 'pyramid_level': 1},
+    {'resolution': (320, 240), 'detection_stride': 3, 'imgsz': 416, 'pyramid_level': 1},
+    {'resolution': (320, 240), 'detection_stride': 4, 'imgsz': 320, 'pyramid_level': 2},
+]
 
 # ===== VIOLENCE DETECTION THRESHOLDS =====
 # Level 1: Basic motion counting
@@ -29,25 +123,78 @@ STILL_RESET_THRESHOLD = 20   # Frames of stillness to reset
 HIGH_INTENSITY_THRESHOLD = 30000  # High intensity motion area
 INTENSITY_ALERT_FRAMES = 10       # Consecutive high-intensity frames
 
+# Level 2/3 scoring windows (seconds, so frame skipping or a lower FPS doesn't change them)
+MOTION_HISTORY_SECONDS = 1.0     # Motion history kept
+MOTION_SHORT_WINDOW = 0.33       # Intensity window
+MOTION_LONG_WINDOW = 0.5         # Sustained motion / regions / people window
+
 # Level 3: Advanced pattern detection
-RAPID_MOVEMENT_THRESHOLD = 50    # Pixel displacement threshold
-ERRATIC_MOVEMENT_COUNT = 8       # Number of direction changes
+RAPID_MOVEMENT_THRESHOLD = 1500  # Centroid speed (px/s)
+ERRATIC_WINDOW = 0.3             # Seconds of centroid moves checked for direction changes
+ERRATIC_CHANGE_RATIO = 0.85      # Direction changes per significant move counted as erratic
 VIOLENCE_SCORE_THRESHOLD = 0.7   # 0-1 score for violence probability
+PROXIMITY_LEVELS = (0.15, 0.25, 0.35)  # Closest pair distance (fraction of frame width) for very close / close / nearby
+PROXIMITY_GRID_MIN_POINTS = 64  # People count from which close pairs use a grid index instead of all pairs
+
+# ===== TIME-BASED SCORING =====
+# RealAdvancedDetector works on capture timestamps in pixels per second,
+# so thresholds hold at any effective FPS (values were tuned at 30 FPS)
+ANALYSIS_WARMUP_SECONDS = 0.3    # History needed before scoring
+ANALYSIS_HISTORY_SECONDS = 0.65  # History kept
+SPEED_WINDOW_SECONDS = 0.15      # Speed averaged over this span
+IMPACT_WINDOW_SECONDS = 0.25     # Split into before/after halves to find sudden stops
+CHAOS_WINDOW_SECONDS = 0.4       # Direction changes counted over this span
+SPEED_LEVELS = (300.0, 600.0, 900.0)  # Box speed (px/s) for moderate / fast / very fast
+IMPACT_LEVELS = (300.0, 450.0)   # Horizontal speed (px/s) before a stop for a possible / strong impact
+CHAOS_MIN_SPEED = 60.0           # px/s - slower moves don't count as a direction
+
+# ===== LEARNED SCORER =====
+# Logistic regression over windowed RealAdvancedDetector features, trained offline (POST /train)
+LEARNED_SCORER_ENABLED = True  # Use the trained model when one exists, else the hand-tuned weights
+SCORER_MODEL_PATH = "models/violence_scorer.npz"
+FEATURE_CACHE_DIR = "models/feature_cache"  # Per-video features (memory-mapped .npy), keyed by video hash
+FEATURE_WINDOW_SECONDS = 0.5  # Capture time averaged into each feature window
+FEATURE_HOP_SECONDS = 0.25    # Media time between training windows
+TRAINING_VIDEO_LIST = "zip_vids.json"  # JSON list of training videos
+TRAINING_VIDEO_PREFIX = "Violence-Detection--main/"  # Stripped from listed paths (archive root = this repo)
+TRAINING_LABELS = "y.npy"  # One 0/1 label per listed video: .npy in list order, or .json {video path: label}
+TRAINING_VALIDATION_SPLIT = 0.2
 
 # ===== ALERT SETTINGS =====
-ALERT_COOLDOWN = 30  # Frames between repeated alerts
+ALERT_COOLDOWN = 1.0  # Seconds (capture time) between repeated alerts
 SAVE_ALERT_CLIPS = True
 ALERT_CLIP_DURATION = 5  # Seconds before and after alert
+ALERT_CLIP_FPS = FPS  # Clip playback rate - frames are placed by capture time, so clips play in real time
+PREROLL_SECONDS = ALERT_CLIP_DURATION
+PREROLL_BUDGET_MB = 8  # Compressed pre-roll memory per camera (16 cameras = 128 MB)
+PREROLL_JPEG_QUALITY = 80
+CLIP_QUEUE_FRAMES = 90  # Frames waiting for the clip writer thread before new ones are dropped
+CLIP_WRITER_CLOSE_TIMEOUT = 10.0  # Seconds to finish queued clip frames on shutdown
 
 # ===== DISPLAY SETTINGS =====
 SHOW_MOTION_MASK = True
 SHOW_DEBUG_INFO = True
-ENABLE_RECORDING = False
 
 # ===== FILE PATHS =====
 OUTPUT_DIR = "output"
 ALERTS_DIR = "output/alerts"
-LOGS_DIR = "output/logs"
+
+# ===== CONTINUOUS RECORDING =====
+# Always-on segment recording per camera - alerts then reference time ranges
+# instead of writing their own clips (cut from the segments on download)
+ENABLE_RECORDING = False
+RECORDINGS_DIR = "output/recordings"
+SEGMENT_SECONDS = 10
+RECORDING_RETENTION_SECONDS = 24 * 3600  # Rolling window kept on disk
+RECORDING_FPS = FPS
+RECORDING_QUEUE_FRAMES = 30  # Frames waiting for the segment writer before new ones are dropped
+
+# ===== ALERT STORE =====
+ALERT_DB_PATH = "output/alerts.db"  # SQLite (WAL) - all cameras' alerts, indexed by camera, time, score
+ALERT_DB_BATCH_SIZE = 100  # Alerts committed per transaction at most
+ALERT_DB_BATCH_SECONDS = 0.2  # How long the writer waits to fill a batch
+ALERT_PAGE_SIZE = 50  # /api/alerts default page size
+ALERT_PAGE_MAX = 500
 
 # ===== DETECTION MODES =====
 # Choose detection level: 'basic', 'intermediate', 'advanced'
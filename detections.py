@@ -0,0 +1,144 @@
+"""
+Detections Module
+Compact array representation of person detections: one N x 7 float32 array
+(x1, y1, x2, y2, confidence, class, track_id) instead of a list of dicts,
+so per-frame geometry is vectorised numpy
+"""
+import cv2
+import numpy as np
+
+
+# Column layout
+X1, Y1, X2, Y2, CONF, CLS, TRACK_ID = range(7)
+NUM_COLUMNS = 7
+NO_TRACK = -1
+
+
+class Detections:
+    def __init__(self, data=None, predicted=False):
+        """
+        Wrap an N x 7 float32 array (x1, y1, x2, y2, confidence, class, track_id)
+        Indexing and iteration still yield {'box', 'confidence', 'track_id'} dicts,
+        so code written for the old list-of-dicts format keeps working
+        predicted: boxes are tracker predictions rather than this frame's detections
+        """
+        if data is None:
+            data = np.zeros((0, NUM_COLUMNS), dtype=np.float32)
+        self.data = data
+        self.predicted = predicted
+
+    @classmethod
+    def from_array(cls, rows):
+        """From an N x 6 (x1, y1, x2, y2, confidence, class) array - no track IDs yet"""
+        rows = np.asarray(rows, dtype=np.float32).reshape(-1, 6)
+        data = np.empty((len(rows), NUM_COLUMNS), dtype=np.float32)
+        data[:, :6] = rows
+        data[:, TRACK_ID] = NO_TRACK
+        return cls(data)
+
+    @classmethod
+    def from_yolo(cls, result):
+        """From an ultralytics result - one device-to-host transfer for all boxes"""
+        rows = result.boxes.data.cpu().numpy()
+        if rows.shape[1] == 7:
+            # Tracking results are x1, y1, x2, y2, track_id, confidence, class
+            return cls(rows[:, [X1, Y1, X2, Y2, 5, 6, 4]].astype(np.float32))
+        return cls.from_array(rows)
+
+    @classmethod
+    def from_dicts(cls, person_boxes):
+        """From the legacy [{'box', 'confidence'(, 'track_id')}] format"""
+        if isinstance(person_boxes, Detections):
+            return person_boxes
+        data = np.empty((len(person_boxes), NUM_COLUMNS), dtype=np.float32)
+        for i, person in enumerate(person_boxes):
+            data[i, :4] = person['box']
+            data[i, CONF] = person.get('confidence', 1.0)
+            data[i, CLS] = 0
+            data[i, TRACK_ID] = person.get('track_id', NO_TRACK)
+        return cls(data)
+
+    @classmethod
+    def concatenate(cls, items):
+        """Join several Detections into one"""
+        items = [item.data for item in items if len(item)]
+        return cls(np.concatenate(items)) if items else cls()
+
+    # ----- Vectorised views -----
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def boxes(self):
+        """Integer (x1, y1, x2, y2) boxes, N x 4"""
+        return self.data[:, :4].astype(np.int32)
+
+    @property
+    def confidence(self):
+        return self.data[:, CONF]
+
+    @property
+    def cls(self):
+        return self.data[:, CLS]
+
+    @property
+    def track_id(self):
+        return self.data[:, TRACK_ID]
+
+    @property
+    def centers(self):
+        """Box centres, N x 2"""
+        return (self.data[:, 0:2] + self.data[:, 2:4]) / 2
+
+    @property
+    def sizes(self):
+        """Box widths and heights, N x 2"""
+        return self.data[:, 2:4] - self.data[:, 0:2]
+
+    def filter(self, keep):
+        """Subset by boolean mask or index array"""
+        return Detections(self.data[keep], self.predicted)
+
+    def nms(self, iou_threshold=0.5):
+        """Non-maximum suppression (e.g. after merging detections from overlapping crops)"""
+        if len(self) < 2:
+            return self
+        xywh = np.concatenate([self.data[:, 0:2], self.sizes], axis=1)
+        keep = cv2.dnn.NMSBoxes(xywh.tolist(), self.confidence.tolist(), 0.0, iou_threshold)
+        return self.filter(np.asarray(keep, dtype=int).reshape(-1))
+
+    def offset(self, dx, dy):
+        """Shift boxes in place (crop coordinates -> frame coordinates)"""
+        self.data[:, [X1, X2]] += dx
+        self.data[:, [Y1, Y2]] += dy
+        return self
+
+    # ----- Legacy list-of-dicts interface -----
+
+    def _person(self, row):
+        person = {
+            'box': (int(row[X1]), int(row[Y1]), int(row[X2]), int(row[Y2])),
+            'confidence': float(row[CONF])
+        }
+        if row[TRACK_ID] != NO_TRACK:
+            person['track_id'] = int(row[TRACK_ID])
+        return person
+
+    def to_dicts(self):
+        """[{'box', 'confidence'(, 'track_id')}] list"""
+        return [self._person(row) for row in self.data]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        return self._person(self.data[i])
+
+    def __iter__(self):
+        for row in self.data:
+            yield self._person(row)
+
+    def __repr__(self):
+        return f"Detections({len(self)})"
@@ -0,0 +1,75 @@
+"""
+Frame Pool Module
+Reusable, preallocated numpy buffers for the per-frame pipeline
+OpenCV calls write into these through dst= instead of allocating new arrays
+"""
+import cv2
+import numpy as np
+
+
+class FramePool:
+    def __init__(self):
+        """
+        Initialize an empty pool
+        Buffers are allocated on first request and reused while the shape stays the same
+        """
+        self._buffers = {}
+        self._rings = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        """
+        Get the reusable buffer for a pipeline step
+        name: step name (e.g. 'gray', 'display')
+        Contents are whatever the previous frame left behind
+        """
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buf
+            self.allocations += 1
+        return buf
+
+    def next(self, name, shape, dtype=np.uint8, count=3):
+        """
+        Get the next buffer from a small rotating set
+        Used when a buffer must stay valid after the following frame starts,
+        e.g. the display frame another thread is still encoding
+        """
+        index = self._rings.get(name, -1) + 1
+        index %= count
+        self._rings[name] = index
+        return self.get(f"{name}#{index}", shape, dtype)
+
+    def constant(self, name, shape, value, dtype=np.uint8):
+        """Get a buffer filled with a constant colour (filled only when allocated)"""
+        key = f"{name}={value}"
+        buf = self._buffers.get(key)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = self.get(key, shape, dtype)
+            buf[:] = value
+        return buf
+
+    def resize(self, name, src, size, interpolation=cv2.INTER_LINEAR):
+        """Resize src to size (width, height) into the named buffer"""
+        width, height = size
+        dst = self.get(name, (height, width) + src.shape[2:], src.dtype)
+        return cv2.resize(src, size, dst=dst, interpolation=interpolation)
+
+    def copy(self, name, src, ring=0):
+        """Copy src into the named buffer (ring > 0 uses a rotating set)"""
+        if ring:
+            dst = self.next(name, src.shape, src.dtype, count=ring)
+        else:
+            dst = self.get(name, src.shape, src.dtype)
+        np.copyto(dst, src)
+        return dst
+
+    def get_stats(self):
+        """Get pool size and allocation count"""
+        return {
+            'buffers': len(self._buffers),
+            'allocations': self.allocations,
+            'bytes': sum(buf.nbytes for buf in self._buffers.values())
+        }
+
@@ -0,0 +1,118 @@
+"""
+Model Pool
+Loads each model at most once per process, in a background thread,
+warms it up, and hands the same shared instance to every session
+"""
+import threading
+import time
+
+
+class ModelPool:
+    def __init__(self):
+        """Initialize an empty pool (models are registered by name with a factory)"""
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, warm_up=True):
+        """
+        Register how to build a model (nothing is loaded yet)
+        factory: zero-argument callable returning the model
+        warm_up: call model.warm_up() (if it has one) right after loading
+        """
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = {
+                    'factory': factory,
+                    'warm_up': warm_up,
+                    'model': None,
+                    'error': None,
+                    'status': 'registered',
+                    'ready': threading.Event(),
+                    'load_ms': None,
+                    'warmup_ms': None
+                }
+
+    def preload(self, name):
+        """Start loading a model in the background (no-op if already loading or loaded)"""
+        entry = self._entries[name]
+        with self._lock:
+            if entry['status'] != 'registered':
+                return
+            entry['status'] = 'loading'
+        threading.Thread(target=self._load, args=(name, entry), daemon=True).start()
+
+    def _load(self, name, entry):
+        """Build and warm up one model, then wake everyone waiting for it"""
+        try:
+            start = time.perf_counter()
+            model = entry['factory']()
+            entry['load_ms'] = (time.perf_counter() - start) * 1000
+
+            if entry['warm_up'] and hasattr(model, 'warm_up'):
+                start = time.perf_counter()
+                model.warm_up()
+                entry['warmup_ms'] = (time.perf_counter() - start) * 1000
+
+            entry['model'] = model
+            entry['status'] = 'ready'
+            print(f"✓ Model '{name}' ready (load {entry['load_ms']:.0f} ms, "
+                  f"warm-up {entry['warmup_ms'] or 0:.0f} ms)")
+        except Exception as e:
+            entry['error'] = e
+            entry['status'] = 'error'
+            print(f"❌ Model '{name}' failed to load: {e}")
+        finally:
+            entry['ready'].set()
+
+    def get(self, name, timeout=None):
+        """
+        Get the shared model, loading it (or waiting for the background load) if needed
+        Raises the load error if the model could not be loaded (the next get() retries)
+        """
+        entry = self._entries[name]
+        self.preload(name)
+        if not entry['ready'].wait(timeout):
+            raise TimeoutError(f"Model '{name}' still loading")
+        error = entry['error']
+        if error is not None:
+            self._reset(entry)
+            raise RuntimeError(f"Model '{name}' failed to load: {error}")
+        return entry['model']
+
+    def set(self, name, model):
+        """Replace a loaded model (e.g. after retraining) - later get() calls return it"""
+        entry = self._entries[name]
+        with self._lock:
+            entry['model'] = model
+            entry['error'] = None
+            entry['status'] = 'ready'
+            entry['ready'].set()
+
+    def peek(self, name):
+        """Get the model if it is already loaded, without triggering a load"""
+        entry = self._entries.get(name)
+        return entry['model'] if entry else None
+
+    def _reset(self, entry):
+        """Forget a failed load so the next get() retries"""
+        with self._lock:
+            if entry['status'] == 'error':
+                entry['status'] = 'registered'
+                entry['error'] = None
+                entry['ready'] = threading.Event()
+
+    def get_stats(self):
+        """Get load status and timings of every registered model"""
+        return {
+            name: {
+                'status': entry['status'],
+                'load_ms': round(entry['load_ms'], 1) if entry['load_ms'] is not None else None,
+                'warmup_ms': round(entry['warmup_ms'], 1) if entry['warmup_ms'] is not None else None,
+                'error': str(entry['error']) if entry['error'] is not None else None
+            }
+            for name, entry in self._entries.items()
+        }
+
+
+# One pool per process - every CameraManager/session shares these models
+model_pool = ModelPool()
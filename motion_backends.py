@@ -0,0 +1,148 @@
+"""
+Motion Backends
+Pluggable foreground extraction for MotionDetector:
+frame differencing, running average, and OpenCV MOG2 / KNN background subtraction
+Every backend works on blurred grayscale frames and returns a binary (0/255) mask
+"""
+import time
+import cv2
+import numpy as np
+import config
+
+
+class MotionBackend:
+    name = 'base'
+    needs_previous = False  # True if apply() uses the previous frame
+
+    def __init__(self):
+        """Initialize cost tracking"""
+        self.frames = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+
+    def apply(self, gray, prev_gray, out):
+        """
+        Compute the foreground mask for one frame
+        gray: blurred grayscale frame, prev_gray: previous one (may be ignored)
+        out: preallocated uint8 buffer to write the 0/255 mask into
+        Returns: foreground mask
+        """
+        start = time.perf_counter()
+        mask = self._apply(gray, prev_gray, out)
+        self.last_ms = (time.perf_counter() - start) * 1000
+        self.total_ms += self.last_ms
+        self.frames += 1
+        return mask
+
+    def _apply(self, gray, prev_gray, out):
+        raise NotImplementedError
+
+    def reset(self):
+        """Forget the learned background"""
+
+    def get_stats(self):
+        """Get per-frame cost of this backend"""
+        return {
+            'backend': self.name,
+            'frames': self.frames,
+            'last_ms': round(self.last_ms, 3),
+            'avg_ms': round(self.total_ms / self.frames, 3) if self.frames else 0.0
+        }
+
+
+class FrameDiffBackend(MotionBackend):
+    name = 'diff'
+    needs_previous = True
+
+    def _apply(self, gray, prev_gray, out):
+        """Two-frame differencing (original behaviour) - diff and threshold in place"""
+        cv2.absdiff(prev_gray, gray, dst=out)
+        cv2.threshold(out, config.MOTION_THRESHOLD, 255, cv2.THRESH_BINARY, dst=out)
+        return out
+
+
+class RunningAverageBackend(MotionBackend):
+    name = 'running_avg'
+
+    def __init__(self, alpha=None):
+        """
+        Background = exponential running average of past frames (accumulateWeighted)
+        alpha: learning rate, higher adapts faster to scene changes
+        """
+        super().__init__()
+        self.alpha = alpha if alpha is not None else config.RUNNING_AVG_ALPHA
+        self._average = None  # float32 background model
+        self._background = None
+        self._diff = None
+
+    def _apply(self, gray, prev_gray, out):
+        if self._average is None or self._average.shape != gray.shape:
+            self._average = gray.astype(np.float32)
+            self._background = np.empty_like(gray)
+            self._diff = np.empty_like(gray)
+
+        cv2.convertScaleAbs(self._average, dst=self._background)
+        cv2.absdiff(self._background, gray, dst=self._diff)
+        cv2.accumulateWeighted(gray, self._average, self.alpha)
+        cv2.threshold(self._diff, config.MOTION_THRESHOLD, 255, cv2.THRESH_BINARY, dst=out)
+        return out
+
+    def reset(self):
+        self._average = None
+
+
+class SubtractorBackend(MotionBackend):
+    def __init__(self):
+        """OpenCV BackgroundSubtractor wrapper (shadows disabled - masks are binary)"""
+        super().__init__()
+        self.subtractor = self._create()
+
+    def _create(self):
+        raise NotImplementedError
+
+    def _apply(self, gray, prev_gray, out):
+        return self.subtractor.apply(gray, fgmask=out)
+
+    def reset(self):
+        self.subtractor = self._create()
+
+
+class MOG2Backend(SubtractorBackend):
+    name = 'mog2'
+
+    def _create(self):
+        return cv2.createBackgroundSubtractorMOG2(
+            history=config.BG_HISTORY,
+            varThreshold=config.MOG2_VAR_THRESHOLD,
+            detectShadows=False
+        )
+
+
+class KNNBackend(SubtractorBackend):
+    name = 'knn'
+
+    def _create(self):
+        return cv2.createBackgroundSubtractorKNN(
+            history=config.BG_HISTORY,
+            dist2Threshold=config.KNN_DIST2_THRESHOLD,
+            detectShadows=False
+        )
+
+
+BACKENDS = {
+    'diff': FrameDiffBackend,
+    'running_avg': RunningAverageBackend,
+    'mog2': MOG2Backend,
+    'knn': KNNBackend,
+}
+
+
+def create_backend(name=None):
+    """
+    Create a motion backend by name
+    name: 'diff', 'running_avg', 'mog2' or 'knn' (None = config.MOTION_BACKEND)
+    """
+    name = name or config.MOTION_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown motion backend: {name} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
@@ -5,178 +5,378 @@ Supports multiple levels of motion analysis for violence detection
 import cv2
 import numpy as np
 import config
-from collections import deque
+from frame_pool import FramePool
+from motion_backends import FrameDiffBackend, create_backend
+from rolling_stats import TimeWindow, DirectionChangeCounter
+from spatial_index import pairwise_distances
+from detections import Detections
+
+HISTORY_COLUMNS = ('detected', 'area', 'num_regions', 'people_count')
 
 
 class MotionDetector:
-    def __init__(self, mode='basic'):
+    def __init__(self, mode='basic', backend=None, pyramid_level=None):
         """
         Initialize motion detector
         mode: 'basic', 'intermediate', or 'advanced'
+        backend: streaming foreground backend - 'diff', 'running_avg', 'mog2', 'knn'
+                 (None = config.MOTION_BACKEND)
+        pyramid_level: detect at 1/2**level scale (None = config.MOTION_PYRAMID_LEVEL)
         """
         self.mode = mode
-        self.motion_history = deque(maxlen=30)  # Store last 30 frames of motion data
-        self.centroids_history = deque(maxlen=10)  # Track object centroids
+        self.backend = create_backend(backend)
+        self._pair_backend = FrameDiffBackend()  # detect_motion() is always two-frame
+        # Timestamped motion data, with running sums over the short/long scoring windows (seconds)
+        self.motion_history = TimeWindow(HISTORY_COLUMNS, spans=(
+            config.MOTION_SHORT_WINDOW, config.MOTION_LONG_WINDOW, config.MOTION_HISTORY_SECONDS
+        ))
+        self._frames = 0
+        self._time = 0.0  # Capture time of the frame being analysed
+        self._prev_centroids = None  # Object centroids of the last detect_rapid_movement() call
+        self._prev_centroid_time = None
+        # Direction changes of centroid velocity (moves slower than 150 px/s don't count), incrementally
+        self.direction_changes = DirectionChangeCounter(window=config.ERRATIC_WINDOW, min_step=150)
+        self.pool = FramePool()  # Reusable gray/blur/diff/threshold buffers
+
+        # Streaming state for detect_motion_next()
+        self._prev_blur = None  # Blurred grayscale of the last frame seen
+        self._prev_raw = None   # Last frame passed to skip_frame() (not yet blurred)
+        self._prev_roi = None   # (blur, blurred rects) of the last frame seen by the ROI path
+        self._blur_slot = 0     # Which of the two blur buffers to write next
+
+        self.set_pyramid_level(config.MOTION_PYRAMID_LEVEL if pyramid_level is None else pyramid_level)
+
+    def set_pyramid_level(self, level):
+        """
+        Change the motion detection scale (0 = full resolution, 1 = 1/2, 2 = 1/4)
+        Blur kernel and MIN_CONTOUR_AREA are scaled to match; boxes are always
+        returned in full-resolution coordinates
+        """
+        level = int(level)
+        if level < 0:
+            raise ValueError(f"Pyramid level must be >= 0, got {level}")
+        self.pyramid_level = level
+        self.scale = 2 ** level
+        # pyrDown already smooths with a 5x5 Gaussian - shrink the kernel by the same factor (kept odd)
+        self._blur_size = tuple(max(1, (k >> level) | 1) for k in config.GAUSSIAN_BLUR_SIZE)
+        # Cached blurs and background models are at the old scale
+        self.reset_stream()
+
+    def _preprocess(self, frame, name):
+        """Grayscale (+ pyrDown per pyramid level) + Gaussian blur into the named pooled buffer"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self.pool.get('gray', frame.shape[:2]))
+        for level in range(self.pyramid_level):
+            height, width = gray.shape
+            gray = cv2.pyrDown(gray, dst=self.pool.get(f'pyr{level}', ((height + 1) // 2, (width + 1) // 2)))
+        return cv2.GaussianBlur(gray, self._blur_size, 0, dst=self.pool.get(name, gray.shape))
+
+    def _tick(self, timestamp):
+        """Set the capture time of the frame being analysed (None = frame count at config.FPS)"""
+        self._frames += 1
+        self._time = timestamp if timestamp is not None else self._frames / config.FPS
 
-    def detect_motion(self, prev_frame, curr_frame, mask=None):
+    def detect_motion(self, prev_frame, curr_frame, mask=None, timestamp=None):
         """
         Basic motion detection using frame differencing
         Optional mask to focus detection on specific regions
+        timestamp: capture time of curr_frame in seconds (for the time-based history)
         Returns: motion_detected (bool), boxes (list), motion_mask (numpy array)
         """
-        # Convert to grayscale
-        prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-        curr_gray = cv2.cvtColor(curr_frame, cv2.COLOR_BGR2GRAY)
+        self._tick(timestamp)
+        # Convert to grayscale and blur to reduce noise
+        prev_gray = self._preprocess(prev_frame, 'prev_blur')
+        curr_gray = self._preprocess(curr_frame, 'curr_blur')
+
+        return self._detect_from_blurred(self._pair_backend, prev_gray, curr_gray, mask)
+
+    def detect_motion_next(self, frame, mask=None, timestamp=None):
+        """
+        Streaming motion detection - call once per frame, in order
+        The blurred grayscale of the previous frame is cached, so each frame
+        is converted and blurred only once (half the work of detect_motion)
+        Foreground comes from the configured backend
+        timestamp: capture time in seconds (for the time-based history)
+        Returns: motion_detected (bool), boxes (list), motion_mask (numpy array)
+        """
+        self._tick(timestamp)
+        slot = self._blur_slot
+        curr_gray = self._preprocess(frame, f'blur{slot}')
+
+        prev_gray = self._prev_blur
+        if prev_gray is None and self._prev_raw is not None and self.backend.needs_previous:
+            # Previous frame was skipped - blur it now into the other buffer
+            prev_gray = self._preprocess(self._prev_raw, f'blur{1 - slot}')
+        if prev_gray is None:
+            prev_gray = curr_gray  # First frame: nothing to compare against
+
+        result = self._detect_from_blurred(self.backend, prev_gray, curr_gray, mask)
+
+        self._prev_blur = curr_gray
+        self._prev_roi = None
+        self._prev_raw = frame
+        self._blur_slot = 1 - slot
+        return result
+
+    def detect_motion_rois(self, frame, person_boxes, timestamp=None):
+        """
+        Streaming motion detection restricted to person regions
+        Only the union of the (x1, y1, x2, y2) boxes is converted, blurred,
+        diffed and contoured - work scales with the area people cover.
+        Falls back to a masked full-frame pass when the boxes cover most of the
+        frame, the backend needs whole frames (background models) or a pyramid
+        level is set (the downscaled pass is already cheaper than the crops)
+        Returns: motion_detected (bool), boxes (list, frame coordinates), motion_mask (numpy array)
+        """
+        height, width = frame.shape[:2]
+        if isinstance(person_boxes, Detections):
+            person_boxes = person_boxes.xyxy
+        rois = merge_boxes(person_boxes, width, height)
+        covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in rois)
+
+        if (self.pyramid_level or not self.backend.needs_previous or self._prev_raw is None
+                or self._prev_raw.shape != frame.shape
+                or covered > config.MOTION_ROI_MAX_COVERAGE * width * height):
+            mask = self.pool.get('roi_mask', (height, width))
+            mask[:] = 0
+            for x1, y1, x2, y2 in rois:
+                mask[y1:y2, x1:x2] = 255
+            return self.detect_motion_next(frame, mask, timestamp)
+
+        self._tick(timestamp)
+
+        pool = self.pool
+        shape = (height, width)
+        slot = self._blur_slot
+        # This frame's ROI blurs are kept for the next call, with the rects they cover
+        curr_blur = pool.get(f'roi_blur{slot}', shape)
+        curr_rects = []
+        thresh = pool.get('roi_thresh', shape)
+        dilated = pool.get('roi_dilated', shape)
+        dilated[:] = 0
+
+        # Previous frame: reuse its blur (full-frame pass or last ROI pass), blur only what it lacks
+        if self._prev_roi is not None and self._prev_roi[0].shape == shape:
+            prev_blur, prev_rects = self._prev_roi
+        elif self._prev_blur is not None and self._prev_blur.shape == shape:
+            prev_blur, prev_rects = self._prev_blur, None  # Whole frame is blurred
+        else:
+            prev_blur, prev_rects = pool.get(f'roi_blur{1 - slot}', shape), []
+
+        boxes = []
+        total_motion_area = 0
+        for x1, y1, x2, y2 in rois:
+            roi = (x1, y1, x2, y2)
+            if prev_rects is not None:
+                # Blur only the strips of the previous frame its last pass didn't cover
+                missing = [roi]
+                for rect in prev_rects:
+                    missing = [piece for part in missing for piece in subtract_rect(part, rect)]
+                for rect in missing:
+                    self._blur_region(self._prev_raw, prev_blur, *rect)
+                prev_rects.extend(missing)
+            self._blur_region(frame, curr_blur, *roi)
+            curr_rects.append(roi)
+
+            # Diff/threshold/dilate the ROI interior only
+            roi_thresh = self.backend.apply(curr_blur[y1:y2, x1:x2], prev_blur[y1:y2, x1:x2],
+                                            thresh[y1:y2, x1:x2])
+            roi_dilated = cv2.dilate(roi_thresh, None, dst=dilated[y1:y2, x1:x2],
+                                     iterations=config.DILATION_ITERATIONS)
+
+            roi_boxes, area = self._boxes_from_mask(roi_dilated, offset=(x1, y1), scale=1)
+            boxes.extend(roi_boxes)
+            total_motion_area += area
+
+        motion_detected = len(boxes) > 0
+        self.motion_history.append(self._time, (motion_detected, total_motion_area, len(boxes), 0))
+
+        # Full-frame blur cache is stale now - next full pass re-blurs this frame
+        self._prev_blur = None
+        self._prev_roi = (curr_blur, curr_rects)
+        self._prev_raw = frame
+        self._blur_slot = 1 - slot
+        return motion_detected, boxes, dilated
+
+    def _blur_region(self, src, dst, x1, y1, x2, y2):
+        """
+        Grayscale + blur src[y1:y2, x1:x2] into dst, matching a full-frame blur:
+        the crop is padded by the kernel margin and only its interior is copied,
+        so neighbouring regions already in dst are never overwritten with edge values
+        """
+        height, width = dst.shape
+        pad_x = config.GAUSSIAN_BLUR_SIZE[0] // 2
+        pad_y = config.GAUSSIAN_BLUR_SIZE[1] // 2
+        bx1, by1 = max(x1 - pad_x, 0), max(y1 - pad_y, 0)
+        bx2, by2 = min(x2 + pad_x, width), min(y2 + pad_y, height)
+        gray = cv2.cvtColor(src[by1:by2, bx1:bx2], cv2.COLOR_BGR2GRAY,
+                            dst=self.pool.get('roi_gray', (height, width))[by1:by2, bx1:bx2])
+        blur = cv2.GaussianBlur(gray, config.GAUSSIAN_BLUR_SIZE, 0,
+                                dst=self.pool.get('roi_scratch', (height, width))[by1:by2, bx1:bx2])
+        dst[y1:y2, x1:x2] = blur[y1 - by1:y2 - by1, x1 - bx1:x2 - bx1]
+
+    def skip_frame(self, frame):
+        """
+        Keep the stream in step without analysing a frame
+        Only a reference is kept - the frame must stay valid until the next call
+        """
+        self._frames += 1  # Skipped frames still advance the default clock
+        self._prev_blur = None
+        self._prev_roi = None
+        self._prev_raw = frame
+
+    def reset_stream(self):
+        """Forget the cached previous frame and background model (e.g. after a seek)"""
+        self._prev_blur = None
+        self._prev_roi = None
+        self._prev_raw = None
+        self.backend.reset()
 
-        # Blur to reduce noise
-        prev_gray = cv2.GaussianBlur(prev_gray, config.GAUSSIAN_BLUR_SIZE, 0)
-        curr_gray = cv2.GaussianBlur(curr_gray, config.GAUSSIAN_BLUR_SIZE, 0)
+    def get_backend_stats(self):
+        """Get name and per-frame cost of the streaming motion backend"""
+        return self.backend.get_stats()
+
+    def _detect_from_blurred(self, backend, prev_gray, curr_gray, mask=None):
+        """
+        Foreground mask, threshold and contours for preprocessed frames
+        mask: full-resolution mask, downscaled to the pyramid level if needed
+        Returned motion mask is at pyramid resolution
+        """
+        shape = curr_gray.shape
+        pool = self.pool
 
-        # Frame difference
-        diff = cv2.absdiff(prev_gray, curr_gray)
+        # Foreground (frame difference or background model), thresholded to 0/255
+        thresh = backend.apply(curr_gray, prev_gray, pool.get('thresh', shape))
 
         # Apply mask if provided
         if mask is not None:
-            diff = cv2.bitwise_and(diff, mask)
-
-        # Threshold
-        _, thresh = cv2.threshold(diff, config.MOTION_THRESHOLD, 255, cv2.THRESH_BINARY)
+            if mask.shape != shape:
+                mask = cv2.resize(mask, (shape[1], shape[0]), dst=pool.get('mask_small', shape),
+                                  interpolation=cv2.INTER_NEAREST)
+            thresh = cv2.bitwise_and(thresh, mask, dst=thresh)
 
         # Dilate to fill gaps
-        thresh = cv2.dilate(thresh, None, iterations=config.DILATION_ITERATIONS)
+        thresh = cv2.dilate(thresh, None, dst=pool.get('dilated', shape), iterations=config.DILATION_ITERATIONS)
+
+        boxes, total_motion_area = self._boxes_from_mask(thresh)
+        motion_detected = len(boxes) > 0
+
+        # Store motion data for advanced analysis
+        self.motion_history.append(self._time, (motion_detected, total_motion_area, len(boxes), 0))
+
+        return motion_detected, boxes, thresh
 
+    def _boxes_from_mask(self, thresh, offset=(0, 0), scale=None):
+        """
+        Contours of a binary motion mask above MIN_CONTOUR_AREA
+        offset: added to box coordinates (for masks that are ROI views)
+        scale: mask-to-frame factor (None = pyramid scale); boxes and area are scaled back up
+        Returns: boxes [(x, y, w, h)], total_motion_area (full-resolution pixels)
+        """
+        scale = scale or self.scale
+        min_area = config.MIN_CONTOUR_AREA / (scale * scale)
         # Find contours
         contours, _ = cv2.findContours(
             thresh,
             cv2.RETR_EXTERNAL,
-            cv2.CHAIN_APPROX_SIMPLE
+            cv2.CHAIN_APPROX_SIMPLE,
+            offset=offset
         )
 
         boxes = []
-        motion_detected = False
         total_motion_area = 0
 
         for contour in contours:
             area = cv2.contourArea(contour)
-            if area < config.MIN_CONTOUR_AREA:
+            if area < min_area:
                 continue
 
-            motion_detected = True
-            total_motion_area += area
+            total_motion_area += area * scale * scale
             x, y, w, h = cv2.boundingRect(contour)
-            boxes.append((x, y, w, h))
-
-        # Store motion data for advanced analysis
-        self.motion_history.append({
-            'detected': motion_detected,
-            'area': total_motion_area,
-            'num_regions': len(boxes),
-            'boxes': boxes
-        })
+            boxes.append((x * scale, y * scale, w * scale, h * scale))
 
-        return motion_detected, boxes, thresh
+        return boxes, total_motion_area
+    
+    def record_people_count(self, count):
+        """Attach the person count to the latest motion frame (used by the violence score)"""
+        self.motion_history.update_last('people_count', count)
     
     def analyze_motion_intensity(self):
         """
         Intermediate: Analyze motion intensity over time
         Returns: intensity_score, is_high_intensity
         """
-        if len(self.motion_history) < 5:
+        if self.motion_history.duration() < config.MOTION_SHORT_WINDOW / 2:
             return 0, False
         
-        recent_motion = list(self.motion_history)[-10:]
-        total_area = sum(m['area'] for m in recent_motion)
-        avg_area = total_area / len(recent_motion)
+        avg_area = self.motion_history.mean('area', config.MOTION_SHORT_WINDOW)
         
         is_high_intensity = avg_area > config.HIGH_INTENSITY_THRESHOLD
         
         return avg_area, is_high_intensity
     
-    def detect_rapid_movement(self, boxes):
+    def detect_rapid_movement(self, boxes, timestamp=None):
         """
         Advanced: Detect rapid/erratic movements
-        Returns: is_rapid, displacement
+        timestamp: capture time in seconds (None = frames are 1 / config.FPS apart)
+        Returns: is_rapid, speed (px/s)
         """
         if len(boxes) == 0:
             return False, 0
         
         # Calculate centroids of current boxes
-        current_centroids = []
-        for (x, y, w, h) in boxes:
-            cx = x + w // 2
-            cy = y + h // 2
-            current_centroids.append((cx, cy))
+        boxes = np.asarray(boxes).reshape(-1, 4)
+        current_centroids = boxes[:, :2] + boxes[:, 2:] // 2
         
-        self.centroids_history.append(current_centroids)
+        prev_centroids, prev_time = self._prev_centroids, self._prev_centroid_time
+        if timestamp is None:
+            timestamp = (prev_time + 1.0 / config.FPS) if prev_time is not None else 0.0
+        self._prev_centroids, self._prev_centroid_time = current_centroids, timestamp
         
-        if len(self.centroids_history) < 2:
+        if prev_centroids is None or timestamp <= prev_time:
             return False, 0
+        dt = timestamp - prev_time
         
-        # Calculate displacement between frames
-        prev_centroids = self.centroids_history[-2]
-        
-        if len(prev_centroids) == 0 or len(current_centroids) == 0:
-            return False, 0
+        # Velocity of the first centroid feeds the erratic-pattern counter
+        vx, vy = (current_centroids[0] - prev_centroids[0]) / dt
+        self.direction_changes.add(vx, vy, timestamp)
         
-        # Find maximum displacement
-        max_displacement = 0
-        for curr_c in current_centroids:
-            for prev_c in prev_centroids:
-                dist = np.sqrt((curr_c[0] - prev_c[0])**2 + (curr_c[1] - prev_c[1])**2)
-                max_displacement = max(max_displacement, dist)
+        # Find maximum displacement (every current x every previous centroid), per second
+        speed = pairwise_distances(current_centroids, prev_centroids).max() / dt
         
-        is_rapid = max_displacement > config.RAPID_MOVEMENT_THRESHOLD
+        is_rapid = speed > config.RAPID_MOVEMENT_THRESHOLD
         
-        return is_rapid, max_displacement
+        return is_rapid, speed
     
     def detect_erratic_pattern(self):
         """
         Advanced: Detect erratic movement patterns (direction changes)
-        Returns: is_erratic, direction_changes
+        Returns: is_erratic, change_ratio (direction changes per significant move
+                 in the last ERRATIC_WINDOW seconds)
         """
-        if len(self.centroids_history) < 5:
+        moves = self.direction_changes.moves()
+        if moves < 3:
             return False, 0
         
-        # Track direction changes
-        direction_changes = 0
-        prev_direction = None
-        
-        history_list = list(self.centroids_history)
-        for i in range(1, len(history_list)):
-            if len(history_list[i]) > 0 and len(history_list[i-1]) > 0:
-                # Compare first centroid of each frame
-                curr = history_list[i][0]
-                prev = history_list[i-1][0]
-                
-                dx = curr[0] - prev[0]
-                dy = curr[1] - prev[1]
-                
-                if abs(dx) > 5 or abs(dy) > 5:  # Significant movement
-                    current_direction = (1 if dx > 0 else -1, 1 if dy > 0 else -1)
-                    
-                    if prev_direction and current_direction != prev_direction:
-                        direction_changes += 1
-                    
-                    prev_direction = current_direction
-        
-        is_erratic = direction_changes >= config.ERRATIC_MOVEMENT_COUNT
-        
-        return is_erratic, direction_changes
+        # Maintained incrementally as centroids arrive
+        change_ratio = self.direction_changes.count() / moves
+        
+        is_erratic = change_ratio >= config.ERRATIC_CHANGE_RATIO
+        
+        return is_erratic, change_ratio
     
     def calculate_violence_score(self):
         """
         Advanced: Calculate overall violence probability score
         Returns: score (0-1), components dict
         """
-        if len(self.motion_history) < 10:
+        if self.motion_history.duration() < config.ANALYSIS_WARMUP_SECONDS - 1e-6:
             return 0.0, {}
         
         # Component scores
         scores = {}
         
         # 1. Sustained motion score (0-1)
-        recent_motion = list(self.motion_history)[-15:]
-        motion_ratio = sum(1 for m in recent_motion if m['detected']) / len(recent_motion)
+        motion_ratio = self.motion_history.mean('detected', config.MOTION_LONG_WINDOW)
         scores['sustained_motion'] = motion_ratio
         
         # 2. Intensity score (0-1)
@@ -184,12 +384,12 @@ class MotionDetector:
         scores['intensity'] = min(intensity / config.HIGH_INTENSITY_THRESHOLD, 1.0)
         
         # 3. Multiple regions score (0-1)
-        avg_regions = np.mean([m['num_regions'] for m in recent_motion])
+        avg_regions = self.motion_history.mean('num_regions', config.MOTION_LONG_WINDOW)
         scores['multiple_regions'] = min(avg_regions / 3.0, 1.0)  # 3+ regions is max
         
         # 4. Erratic movement score (0-1)
-        is_erratic, changes = self.detect_erratic_pattern()
-        scores['erratic_movement'] = min(changes / config.ERRATIC_MOVEMENT_COUNT, 1.0)
+        is_erratic, change_ratio = self.detect_erratic_pattern()
+        scores['erratic_movement'] = min(change_ratio / config.ERRATIC_CHANGE_RATIO, 1.0)
         
         # Weighted average
         weights = {
@@ -204,8 +404,7 @@ class MotionDetector:
         # PENALTY: Violence usually involves multiple people
         # If only one person is detected, reduce the score significantly
         # unless it's extremely high intensity
-        recent_people = [m.get('people_count', 0) for m in recent_motion]
-        avg_people = np.mean(recent_people) if recent_people else 0
+        avg_people = self.motion_history.mean('people_count', config.MOTION_LONG_WINDOW)
         
         if avg_people < 1.5: # Mostly 1 person
             violence_score *= 0.5
@@ -213,6 +412,56 @@ class MotionDetector:
         return violence_score, scores
 
 
+def subtract_rect(rect, other):
+    """
+    Parts of rect (x1, y1, x2, y2) outside other, as up to 4 non-overlapping rects
+    """
+    x1, y1, x2, y2 = rect
+    ox1, oy1, ox2, oy2 = other
+    if ox1 >= x2 or ox2 <= x1 or oy1 >= y2 or oy2 <= y1:
+        return [rect]
+    pieces = []
+    if oy1 > y1:
+        pieces.append((x1, y1, x2, oy1))  # Above
+    if oy2 < y2:
+        pieces.append((x1, oy2, x2, y2))  # Below
+    top, bottom = max(y1, oy1), min(y2, oy2)
+    if ox1 > x1:
+        pieces.append((x1, top, ox1, bottom))  # Left
+    if ox2 < x2:
+        pieces.append((ox2, top, x2, bottom))  # Right
+    return pieces
+
+
+def merge_boxes(boxes, width, height):
+    """
+    Merge overlapping (x1, y1, x2, y2) boxes into disjoint rectangles
+    clipped to the frame, so no pixel is processed twice
+    """
+    rects = []
+    for x1, y1, x2, y2 in boxes:
+        rect = [max(int(x1), 0), max(int(y1), 0), min(int(x2), width), min(int(y2), height)]
+        if rect[2] > rect[0] and rect[3] > rect[1]:
+            rects.append(rect)
+    
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for rect in rects:
+            for other in result:
+                if rect[0] < other[2] and other[0] < rect[2] and rect[1] < other[3] and other[1] < rect[3]:
+                    other[:] = [min(rect[0], other[0]), min(rect[1], other[1]),
+                                max(rect[2], other[2]), max(rect[3], other[3])]
+                    merged = True
+                    break
+            else:
+                result.append(rect)
+        rects = result
+    
+    return [tuple(rect) for rect in rects]
+
+
 # Legacy function for backward compatibility
 def detect_motion(prev_frame, curr_frame):
     """Basic motion detection - legacy interface"""
@@ -0,0 +1,247 @@
+"""
+ONNX Runtime Backend for Person Detection
+Exports the YOLO model to ONNX once (cached on disk), optionally quantizes it
+to INT8 with static calibration on our own frames, and runs it on CPU with
+ONNX Runtime - no PyTorch needed at inference time
+"""
+import os
+import cv2
+import numpy as np
+import config
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm')
+
+
+def _require_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError:
+        raise RuntimeError("ONNX backend needs onnxruntime: pip install onnxruntime")
+    return onnxruntime
+
+
+def onnx_model_path(weights, imgsz):
+    """Cache path for an exported model"""
+    name = os.path.splitext(os.path.basename(weights))[0]
+    return os.path.join(config.ONNX_MODEL_DIR, f"{name}-{imgsz}.onnx")
+
+
+def _is_fresh(path, source):
+    """Cached file exists and is newer than what it was built from"""
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(source) or os.path.getmtime(path) >= os.path.getmtime(source)
+
+
+def export_onnx(weights=None, imgsz=None):
+    """
+    Export YOLO weights to ONNX (dynamic batch), reusing the cached export
+    Returns: path to the .onnx file
+    """
+    weights = weights or config.YOLO_MODEL_SIZE
+    imgsz = imgsz or config.ONNX_IMGSZ
+    path = onnx_model_path(weights, imgsz)
+    if _is_fresh(path, weights):
+        return path
+
+    from ultralytics import YOLO
+    print(f"Exporting {weights} to ONNX ({imgsz}px)...")
+    os.makedirs(config.ONNX_MODEL_DIR, exist_ok=True)
+    exported = YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+    os.replace(exported, path)
+    print(f"✓ ONNX model cached: {path}")
+    return path
+
+
+def load_calibration_frames(source=None, count=None):
+    """
+    Frames to calibrate INT8 quantization on
+    source: image/video file or a directory of them (default: ONNX_CALIBRATION_SOURCE)
+    Frames are sampled evenly across each video
+    """
+    source = source or config.ONNX_CALIBRATION_SOURCE
+    count = count or config.ONNX_CALIBRATION_FRAMES
+
+    if os.path.isdir(source):
+        files = [os.path.join(source, f) for f in sorted(os.listdir(source))
+                 if f.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)]
+    elif os.path.exists(source):
+        files = [source]
+    else:
+        files = []
+
+    videos = [f for f in files if f.lower().endswith(VIDEO_EXTENSIONS)]
+    frames = []
+    for path in files:
+        if path.lower().endswith(IMAGE_EXTENSIONS):
+            image = cv2.imread(path)
+            if image is not None:
+                frames.append(image)
+
+    per_video = max(1, (count - len(frames)) // max(1, len(videos)))
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for index in np.linspace(0, max(total - 1, 0), per_video).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        cap.release()
+
+    if not frames:
+        raise RuntimeError(f"No calibration frames found in {source}")
+    return frames[:count]
+
+
+def quantize_int8(onnx_path, frames=None, imgsz=None):
+    """
+    Static INT8 quantization (QDQ, per-channel weights) calibrated on our frames
+    Returns: path to the cached quantized model
+    """
+    _require_onnxruntime()
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    )
+
+    imgsz = imgsz or config.ONNX_IMGSZ
+    path = onnx_path.replace('.onnx', '-int8.onnx')
+    if _is_fresh(path, onnx_path):
+        return path
+
+    frames = frames if frames is not None else load_calibration_frames()
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self, input_name):
+            self.batches = iter([{input_name: letterbox_batch([frame], imgsz)[0]} for frame in frames])
+
+        def get_next(self):
+            return next(self.batches, None)
+
+    ort = _require_onnxruntime()
+    input_name = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    print(f"Quantizing {onnx_path} to INT8 ({len(frames)} calibration frames)...")
+    quantize_static(
+        onnx_path, path, FrameReader(input_name),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8
+    )
+    print(f"✓ INT8 model cached: {path}")
+    return path
+
+
+def letterbox_batch(frames, imgsz):
+    """
+    Resize + pad frames to imgsz x imgsz (YOLO letterbox, grey 114 padding)
+    Returns: NCHW float32 RGB batch in [0, 1], per-frame (gain, pad_x, pad_y)
+    """
+    batch = np.empty((len(frames), 3, imgsz, imgsz), dtype=np.float32)
+    transforms = []
+    canvas = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        height, width = frame.shape[:2]
+        gain = min(imgsz / height, imgsz / width)
+        new_w, new_h = int(round(width * gain)), int(round(height * gain))
+        pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+
+        canvas[:] = 114
+        cv2.resize(frame, (new_w, new_h), dst=canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w],
+                   interpolation=cv2.INTER_LINEAR)
+        # BGR HWC uint8 -> RGB CHW float
+        np.multiply(canvas[:, :, ::-1].transpose(2, 0, 1), 1 / 255.0, out=batch[i], casting='unsafe')
+        transforms.append((gain, pad_x, pad_y))
+    return batch, transforms
+
+
+class OnnxYOLO:
+    def __init__(self, model_path, iou=0.7, threads=None):
+        """
+        YOLOv8 detection model on ONNX Runtime (CPU)
+        model_path: exported .onnx (fp32 or int8)
+        iou: NMS IoU threshold (ultralytics default)
+        """
+        ort = _require_onnxruntime()
+        options = ort.SessionOptions()
+        threads = threads if threads is not None else config.ONNX_THREADS
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.imgsz = model_input.shape[2] if isinstance(model_input.shape[2], int) else config.ONNX_IMGSZ
+        self.iou = iou
+
+    def __call__(self, source, classes=None, conf=0.25, verbose=False, imgsz=None):
+        """
+        Run detection on a frame or list of frames
+        imgsz: input size for this call (dynamic-shape export), default the export size
+        Returns: list (one per frame) of N x 6 float32 arrays - x1, y1, x2, y2, confidence, class
+        """
+        frames = source if isinstance(source, list) else [source]
+        batch, transforms = letterbox_batch(frames, imgsz or self.imgsz)
+        # (batch, 4 + classes, anchors)
+        output = self.session.run(None, {self.input_name: batch})[0]
+        return [
+            self._postprocess(prediction, transform, frame.shape, classes, conf)
+            for prediction, transform, frame in zip(output, transforms, frames)
+        ]
+
+    def _postprocess(self, prediction, transform, shape, classes, conf):
+        """Confidence filter, NMS and scaling back to frame coordinates for one frame"""
+        prediction = prediction.T  # anchors x (4 + classes)
+        scores = prediction[:, 4:]
+        if classes is not None:
+            class_ids = np.asarray(classes)
+            class_scores = scores[:, class_ids]
+            best = class_scores.argmax(axis=1)
+            confidence = class_scores[np.arange(len(best)), best]
+            class_id = class_ids[best]
+        else:
+            class_id = scores.argmax(axis=1)
+            confidence = scores[np.arange(len(class_id)), class_id]
+
+        keep = confidence > conf
+        if not np.any(keep):
+            return np.zeros((0, 6), dtype=np.float32)
+        boxes, confidence, class_id = prediction[keep, :4], confidence[keep], class_id[keep]
+
+        # cx, cy, w, h -> x, y, w, h for NMS (class-aware: offset boxes per class)
+        xywh = boxes.copy()
+        xywh[:, :2] -= xywh[:, 2:] / 2
+        offset = class_id[:, None] * 4096.0
+        nms_boxes = np.concatenate([xywh[:, :2] + offset, xywh[:, 2:]], axis=1)
+        indices = cv2.dnn.NMSBoxes(nms_boxes.tolist(), confidence.tolist(), conf, self.iou)
+        indices = np.asarray(indices, dtype=int).reshape(-1)
+
+        gain, pad_x, pad_y = transform
+        height, width = shape[:2]
+        out = np.empty((len(indices), 6), dtype=np.float32)
+        out[:, 0] = (xywh[indices, 0] - pad_x) / gain
+        out[:, 1] = (xywh[indices, 1] - pad_y) / gain
+        out[:, 2] = out[:, 0] + xywh[indices, 2] / gain
+        out[:, 3] = out[:, 1] + xywh[indices, 3] / gain
+        out[:, [0, 2]] = np.clip(out[:, [0, 2]], 0, width)
+        out[:, [1, 3]] = np.clip(out[:, [1, 3]], 0, height)
+        out[:, 4] = confidence[indices]
+        out[:, 5] = class_id[indices]
+        return out[np.argsort(-out[:, 4])]
+
+
+def load_onnx_model(weights=None, int8=None):
+    """
+    Export (once) and load the ONNX person detection model
+    int8: use the statically quantized model (None = config.ONNX_INT8)
+    """
+    int8 = config.ONNX_INT8 if int8 is None else int8
+    path = export_onnx(weights)
+    if int8:
+        path = quantize_int8(path)
+    return OnnxYOLO(path)
@@ -0,0 +1,205 @@
+"""
+Optical Flow Features
+Sparse Lucas-Kanade flow inside person boxes for the advanced violence scorer
+Work is capped by a per-frame point budget and a time budget
+"""
+import math
+import time
+import cv2
+import numpy as np
+import config
+from frame_pool import FramePool
+from detections import Detections
+
+
+LK_PARAMS = dict(
+    winSize=(15, 15),
+    maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+)
+
+
+class FlowFeatureExtractor:
+    def __init__(self, max_points=None, points_per_person=None, time_budget_ms=None):
+        """
+        Budgeted sparse optical flow
+        max_points: points tracked per frame across all people
+        points_per_person: cap for a single person box
+        time_budget_ms: per-frame time budget - when exceeded the point budget shrinks
+        """
+        self.max_points = max_points or config.FLOW_MAX_POINTS
+        self.points_per_person = points_per_person or config.FLOW_POINTS_PER_PERSON
+        self.time_budget_ms = time_budget_ms or config.FLOW_TIME_BUDGET_MS
+        self.point_budget = self.max_points  # Adapted to the time budget
+        self.min_points = max(8, self.max_points // 10)  # Floor the budget may shrink to
+
+        self.pool = FramePool()
+        self._prev_gray = None
+        self._prev_raw = None   # Last frame passed to skip_frame() (not yet converted)
+        self._prev_time = None  # Capture time of the previous frame
+        self._gray_slot = 0
+
+        # Cost tracking
+        self.frames = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+        self.last_points = 0
+        self.over_budget = 0
+
+    def _gray(self, frame, slot):
+        """Grayscale into one of two alternating pooled buffers"""
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                            dst=self.pool.get(f'gray{slot}', frame.shape[:2]))
+
+    def update(self, frame, person_boxes, timestamp=None):
+        """
+        Flow features for each person between the previous frame and this one
+        person_boxes: Detections or list of (x1, y1, x2, y2) - call once per frame, in order
+        timestamp: capture time in seconds (None = frames are 1 / config.FPS apart)
+        Returns: list (same order as person_boxes) of
+                 {'magnitude': mean px/s, 'direction_variance': 0-1, 'points': n}
+        """
+        start = time.perf_counter()
+        if isinstance(person_boxes, Detections):
+            person_boxes = person_boxes.boxes.tolist()
+        slot = self._gray_slot
+        curr_gray = self._gray(frame, slot)
+
+        prev_gray = self._prev_gray
+        if prev_gray is None and self._prev_raw is not None:
+            # Previous frame was skipped - convert it now into the other buffer
+            prev_gray = self._gray(self._prev_raw, 1 - slot)
+
+        features = [empty_features() for _ in person_boxes]
+        if prev_gray is not None and person_boxes:
+            self._track(prev_gray, curr_gray, person_boxes, features, start)
+
+            # Displacement per frame pair -> px/s, so skipped frames don't inflate speeds
+            dt = 1.0 / config.FPS
+            if timestamp is not None and self._prev_time is not None and timestamp > self._prev_time:
+                dt = timestamp - self._prev_time
+            for person in features:
+                person['magnitude'] /= dt
+
+        self._prev_gray = curr_gray
+        self._prev_raw = frame
+        self._prev_time = timestamp
+        self._gray_slot = 1 - slot
+
+        self._account((time.perf_counter() - start) * 1000)
+        return features
+
+    def _track(self, prev_gray, curr_gray, person_boxes, features, start):
+        """Seed corners in each box of the previous frame and track them with one LK call"""
+        height, width = prev_gray.shape
+        per_person = min(self.points_per_person, max(1, self.point_budget // len(person_boxes)))
+        seed_budget_ms = self.time_budget_ms * 0.5
+
+        seeds = []
+        owners = []
+        for i, (x1, y1, x2, y2) in enumerate(person_boxes):
+            # Stop seeding when half the budget is gone - LK needs the rest
+            if (time.perf_counter() - start) * 1000 > seed_budget_ms:
+                break
+            x1, y1 = max(int(x1), 0), max(int(y1), 0)
+            x2, y2 = min(int(x2), width), min(int(y2), height)
+            if x2 - x1 < 8 or y2 - y1 < 8:
+                continue
+
+            corners = cv2.goodFeaturesToTrack(
+                prev_gray[y1:y2, x1:x2],
+                maxCorners=per_person,
+                qualityLevel=0.01,
+                minDistance=config.FLOW_MIN_DISTANCE,
+                blockSize=7
+            )
+            if corners is None:
+                continue
+            corners = corners.reshape(-1, 2)
+            corners += (x1, y1)
+            seeds.append(corners)
+            owners.append(np.full(len(corners), i))
+
+        if not seeds:
+            self.last_points = 0
+            return
+
+        points = np.concatenate(seeds).astype(np.float32).reshape(-1, 1, 2)
+        owners = np.concatenate(owners)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, curr_gray, points, None, **LK_PARAMS)
+
+        ok = status.reshape(-1) == 1
+        flow = (moved - points).reshape(-1, 2)[ok]
+        owners = owners[ok]
+        self.last_points = len(points)
+
+        for i in np.unique(owners):
+            features[i] = flow_features(flow[owners == i])
+
+    def skip_frame(self, frame, timestamp=None):
+        """
+        Keep the stream in step without computing flow
+        Only a reference is kept - the frame must stay valid until the next call
+        """
+        self._prev_gray = None
+        self._prev_raw = frame
+        self._prev_time = timestamp
+
+    def reset(self):
+        """Forget the previous frame (e.g. after a seek)"""
+        self._prev_gray = None
+        self._prev_raw = None
+        self._prev_time = None
+
+    def _account(self, elapsed_ms):
+        """Track cost and adapt the point budget to the time budget"""
+        self.last_ms = elapsed_ms
+        self.total_ms += elapsed_ms
+        self.frames += 1
+
+        if elapsed_ms > self.time_budget_ms:
+            self.over_budget += 1
+            self.point_budget = max(self.min_points, int(self.point_budget * 0.7))
+        elif elapsed_ms < self.time_budget_ms * 0.5 and self.point_budget < self.max_points:
+            self.point_budget = min(self.max_points, int(self.point_budget * 1.1) + 1)
+
+    def get_stats(self):
+        """Get per-frame cost and current point budget"""
+        return {
+            'frames': self.frames,
+            'last_ms': round(self.last_ms, 3),
+            'avg_ms': round(self.total_ms / self.frames, 3) if self.frames else 0.0,
+            'last_points': self.last_points,
+            'point_budget': self.point_budget,
+            'over_budget': self.over_budget
+        }
+
+
+def empty_features():
+    """Features for a person without usable flow"""
+    return {'magnitude': 0.0, 'direction_variance': 0.0, 'points': 0}
+
+
+def flow_features(vectors):
+    """
+    Summarise flow vectors of one person
+    magnitude: mean displacement (px/frame)
+    direction_variance: circular variance of the moving points' directions
+                        (0 = all one way, 1 = every direction)
+    """
+    if len(vectors) == 0:
+        return empty_features()
+
+    magnitudes = np.hypot(vectors[:, 0], vectors[:, 1])
+    moving = magnitudes > config.FLOW_MIN_MAGNITUDE
+    variance = 0.0
+    if np.count_nonzero(moving) >= 3:
+        unit = vectors[moving] / magnitudes[moving, None]
+        mean_x, mean_y = unit.mean(axis=0)
+        variance = 1.0 - math.hypot(mean_x, mean_y)
+
+    return {
+        'magnitude': float(magnitudes.mean()),
+        'direction_variance': float(variance),
+        'points': int(len(vectors))
+    }
@@ -3,58 +3,120 @@ Person Detection Module using YOLO
 Detects people in frames before checking for violence
 OPTIMIZED FOR SPEED
 """
-from ultralytics import YOLO
 import cv2
+import time
+import threading
 import numpy as np
+import config
+from detections import Detections
+from motion_detector import merge_boxes
 
 class PersonDetector:
-    def __init__(self):
-        """Initialize YOLO model for person detection"""
-        print("Loading person detection model...")
-        # Load YOLOv8 nano model (fast and lightweight)
-        self.model = YOLO('yolov8n.pt')  # Fixed: removed duplicate
+    def __init__(self, backend=None):
+        """
+        Initialize YOLO model for person detection
+        backend: 'torch' (ultralytics/PyTorch) or 'onnx' (ONNX Runtime, cached export)
+                 (None = config.DETECTION_BACKEND)
+        """
+        self.backend = backend or config.DETECTION_BACKEND
+        print(f"Loading person detection model ({self.backend})...")
+        if self.backend == 'onnx':
+            from onnx_backend import load_onnx_model
+            self.model = load_onnx_model(config.YOLO_MODEL_SIZE)
+        elif self.backend == 'torch':
+            # Imported here - ultralytics/PyTorch take seconds to import
+            from ultralytics import YOLO
+            # Load YOLOv8 nano model (fast and lightweight)
+            self.model = YOLO(config.YOLO_MODEL_SIZE)
+        else:
+            raise ValueError(f"Unknown detection backend: {self.backend} (choose 'torch' or 'onnx')")
+        # One model is shared by every camera thread - serialize inference
+        self._lock = threading.Lock()
         print("✓ Person detection ready!")
     
-    def detect_people(self, frame):
+    def warm_up(self):
+        """Run one inference on a blank frame so the first real frame isn't slow"""
+        self.detect_people(np.zeros((config.FRAME_HEIGHT, config.FRAME_WIDTH, 3), dtype=np.uint8))
+    
+    def detect_people(self, frame, imgsz=None):
         """
         Detect people in frame (OPTIMIZED FOR SPEED)
-        Returns: people_detected (bool), person_boxes (list)
+        imgsz: model input size (None = model default; smaller = faster)
+        Returns: people_detected (bool), person_boxes (Detections)
         """
         # Run YOLO detection (only detect people - class 0)
         # Use conf=0.6 for faster processing (skip low confidence)
-        results = self.model(frame, classes=[0], verbose=False, conf=0.6)
+        options = {'imgsz': imgsz} if imgsz else {}
+        with self._lock:
+            results = self.model(frame, classes=[0], verbose=False, conf=0.6, **options)
+        
+        person_boxes = Detections.concatenate([self._parse_result(result) for result in results])
+        
+        return len(person_boxes) > 0, person_boxes
+    
+    def detect_people_in_rois(self, frame, motion_boxes):
+        """
+        Detect people only around motion, on crops at a smaller input size
+        motion_boxes: (x, y, w, h) boxes from MotionDetector
+        Crops are padded, merged, run in one model call at ROI_DETECTION_IMGSZ, mapped
+        back to frame coordinates and merged with NMS. Falls back to full-frame
+        detection when the crops cover most of the frame
+        Returns: people_detected (bool), person_boxes (Detections)
+        """
+        height, width = frame.shape[:2]
+        crops = motion_crops(motion_boxes, width, height)
+        if not crops:
+            return False, Detections()
+        
+        covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in crops)
+        if covered > config.ROI_DETECTION_MAX_COVERAGE * width * height:
+            return self.detect_people(frame)
         
-        person_boxes = []
-        people_detected = False
+        with self._lock:
+            results = self.model([frame[y1:y2, x1:x2] for x1, y1, x2, y2 in crops],
+                                 classes=[0], verbose=False, conf=0.6, imgsz=config.ROI_DETECTION_IMGSZ)
+        
+        person_boxes = Detections.concatenate([
+            self._parse_result(result).offset(x1, y1)
+            for (x1, y1, _, _), result in zip(crops, results)
+        ]).nms(0.5)
+        
+        return len(person_boxes) > 0, person_boxes
+    
+    def detect_batch(self, frames, imgsz=None):
+        """
+        Detect people in several frames with one model call
+        Returns: list of (people_detected, person_boxes (Detections)), one per frame
+        """
+        options = {'imgsz': imgsz} if imgsz else {}
+        with self._lock:
+            results = self.model(list(frames), classes=[0], verbose=False, conf=0.6, **options)
         
-        # Extract person bounding boxes
+        detections = []
         for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                # Get box coordinates
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = box.conf[0].cpu().numpy()
-                
-                # Only include high confidence detections
-                if confidence > 0.5:
-                    people_detected = True
-                    person_boxes.append({
-                        'box': (int(x1), int(y1), int(x2), int(y2)),
-                        'confidence': float(confidence)
-                    })
+            person_boxes = self._parse_result(result)
+            detections.append((len(person_boxes) > 0, person_boxes))
+        return detections
+    
+    def _parse_result(self, result):
+        """Person detections from one YOLO result (or ONNX N x 6 array), in one transfer"""
+        if isinstance(result, np.ndarray):
+            detections = Detections.from_array(result)
+        else:
+            detections = Detections.from_yolo(result)
         
-        return people_detected, person_boxes
+        # Only include high confidence detections
+        return detections.filter(detections.confidence > 0.5)
     
     def draw_person_boxes(self, frame, person_boxes):
         """Draw boxes around detected people - THICK and VISIBLE"""
-        for person in person_boxes:
-            x1, y1, x2, y2 = person['box']
-            
+        person_boxes = Detections.from_dicts(person_boxes)
+        for (x1, y1, x2, y2), confidence in zip(person_boxes.boxes.tolist(), person_boxes.confidence.tolist()):
             # Draw THICK green box around person
             cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 3)  # Thickness 3!
             
             # Add label background
-            label = f"Person {person['confidence']:.2f}"
+            label = f"Person {confidence:.2f}"
             label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
             cv2.rectangle(frame, (x1, y1 - label_size[1] - 10), 
                          (x1 + label_size[0], y1), (0, 255, 0), -1)
@@ -70,10 +132,176 @@ class PersonDetector:
         """
         mask = np.zeros(frame.shape[:2], dtype=np.uint8)
         
-        for person in person_boxes:
-            x1, y1, x2, y2 = person['box']
-            # Fill person region with white
-            cv2.rectangle(mask, (x1, y1), (x2, y2), 255, -1)
+        # Fill person regions with white (corners inclusive, clipped to the frame)
+        boxes = Detections.from_dicts(person_boxes).boxes
+        np.clip(boxes, 0, None, out=boxes)
+        for x1, y1, x2, y2 in boxes.tolist():
+            mask[y1:y2 + 1, x1:x2 + 1] = 255
         
         return mask
-    
\ No newline at end of file
+    
+
+def motion_crops(motion_boxes, width, height):
+    """
+    Padded (x1, y1, x2, y2) crops around (x, y, w, h) motion boxes,
+    merged so overlapping crops are processed once
+    """
+    padded = []
+    min_size = config.ROI_DETECTION_MIN_SIZE
+    for x, y, w, h in motion_boxes:
+        pad_x = max(w * config.ROI_DETECTION_PADDING, (min_size - w) / 2)
+        pad_y = max(h * config.ROI_DETECTION_PADDING, (min_size - h) / 2)
+        padded.append((x - pad_x, y - pad_y, x + w + pad_x, y + h + pad_y))
+    return merge_boxes(padded, width, height)
+
+
+class BatchedPersonDetector:
+    def __init__(self, detector, max_batch=None, max_wait_ms=None):
+        """
+        Cross-camera batching front-end for a shared PersonDetector
+        Camera threads call detect_people() as usual and block; a worker thread
+        gathers pending frames (up to max_batch, or max_wait_ms after the first
+        one arrived) and runs a single model call for all of them
+        """
+        self.detector = detector
+        self.max_batch = max_batch or config.YOLO_MAX_BATCH
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.YOLO_MAX_WAIT_MS) / 1000.0
+        
+        self._pending = []
+        self._cond = threading.Condition()
+        self._clients = {}  # Submitting thread -> last submit time
+        self._running = True
+        
+        # Metrics
+        self.batches = 0
+        self.frames = 0
+        self.total_batch_ms = 0.0
+        self.last_batch_ms = 0.0
+        self.last_batch_size = 0
+        self.total_wait_ms = 0.0
+        self._started = time.time()
+        
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+    
+    def detect_people(self, frame, imgsz=None):
+        """
+        Detect people in frame (batched with other cameras using the same imgsz)
+        Returns: people_detected (bool), person_boxes (Detections)
+        """
+        request = {'frame': frame, 'imgsz': imgsz, 'submitted': time.perf_counter(),
+                   'done': threading.Event(), 'result': None, 'error': None}
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Batched person detector is closed")
+            self._clients[threading.get_ident()] = time.time()
+            self._pending.append(request)
+            self._cond.notify_all()
+        
+        request['done'].wait()
+        if request['error'] is not None:
+            raise request['error']
+        return request['result']
+    
+    def detect_people_in_rois(self, frame, motion_boxes):
+        """Crop-based detection (not batched - crop count and input size differ per camera)"""
+        return self.detector.detect_people_in_rois(frame, motion_boxes)
+    
+    def _active_clients(self):
+        """Threads that submitted in the last second (a batch with all of them need not wait)"""
+        cutoff = time.time() - 1.0
+        for ident in [i for i, seen in self._clients.items() if seen < cutoff]:
+            del self._clients[ident]
+        return max(1, len(self._clients))
+    
+    def _next_batch(self):
+        """
+        Wait for the first frame, then gather more with the same input size
+        until full or max_wait passed
+        """
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait()
+            if not self._running:
+                return None
+            
+            first = self._pending[0]
+            deadline = first['submitted'] + self.max_wait
+            while sum(1 for r in self._pending if r['imgsz'] == first['imgsz']) < min(self.max_batch, self._active_clients()):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not self._running:
+                    break
+                self._cond.wait(remaining)
+            
+            batch = [r for r in self._pending if r['imgsz'] == first['imgsz']][:self.max_batch]
+            taken = set(map(id, batch))
+            self._pending = [r for r in self._pending if id(r) not in taken]
+            return batch
+    
+    def _run(self):
+        """Worker loop - one model call per batch, results routed back to each camera"""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            
+            start = time.perf_counter()
+            try:
+                detections = self.detector.detect_batch([request['frame'] for request in batch],
+                                                        imgsz=batch[0]['imgsz'])
+            except Exception as e:
+                detections = None
+                for request in batch:
+                    request['error'] = e
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            
+            self.batches += 1
+            self.frames += len(batch)
+            self.last_batch_ms = elapsed_ms
+            self.total_batch_ms += elapsed_ms
+            self.last_batch_size = len(batch)
+            self.total_wait_ms += sum((start - request['submitted']) * 1000 for request in batch)
+            
+            for i, request in enumerate(batch):
+                if detections is not None:
+                    request['result'] = detections[i]
+                request['done'].set()
+    
+    def get_stats(self):
+        """Get batch size, per-batch latency and throughput"""
+        elapsed = time.time() - self._started
+        return {
+            'batching': True,
+            'batches': self.batches,
+            'frames': self.frames,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'avg_batch_size': round(self.frames / self.batches, 2) if self.batches else 0.0,
+            'last_batch_size': self.last_batch_size,
+            'last_batch_ms': round(self.last_batch_ms, 2),
+            'avg_batch_ms': round(self.total_batch_ms / self.batches, 2) if self.batches else 0.0,
+            'avg_queue_wait_ms': round(self.total_wait_ms / self.frames, 2) if self.frames else 0.0,
+            'throughput_fps': round(self.frames / elapsed, 2) if elapsed > 0 else 0.0
+        }
+    
+    def close(self):
+        """Stop the worker (pending callers get an error)"""
+        with self._cond:
+            self._running = False
+            pending, self._pending = self._pending, []
+            self._cond.notify_all()
+        for request in pending:
+            request['error'] = RuntimeError("Batched person detector is closed")
+            request['done'].set()
+    
+    def warm_up(self):
+        """Warm up the wrapped detector directly (bypasses the batch queue)"""
+        self.detector.warm_up()
+    
+    def draw_person_boxes(self, frame, person_boxes):
+        """Draw boxes around detected people"""
+        return self.detector.draw_person_boxes(frame, person_boxes)
+    
+    def create_person_mask(self, frame, person_boxes):
+        """Create a mask showing only person regions"""
+        return self.detector.create_person_mask(frame, person_boxes)
@@ -0,0 +1,74 @@
+"""
+Alert Pre-roll Buffer
+Keeps the last few seconds of a camera as JPEG-compressed frames with their
+capture timestamps - every frame at the source rate, in a fixed memory budget
+per camera (raw 480x360 frames are ~0.5 MB each, JPEG ~20-40 KB)
+"""
+import cv2
+from collections import deque
+import config
+
+
+class PrerollBuffer:
+    def __init__(self, seconds=None, budget_mb=None, quality=None):
+        """
+        seconds: footage to keep before an alert (None = config.PREROLL_SECONDS)
+        budget_mb: memory cap for the compressed frames (None = config.PREROLL_BUDGET_MB)
+        quality: JPEG quality 1-100 (None = config.PREROLL_JPEG_QUALITY)
+        """
+        self.seconds = seconds or config.PREROLL_SECONDS
+        self.budget = int((budget_mb or config.PREROLL_BUDGET_MB) * 1024 * 1024)
+        self._params = [cv2.IMWRITE_JPEG_QUALITY, quality or config.PREROLL_JPEG_QUALITY]
+        self._frames = deque()  # (timestamp, JPEG bytes as uint8 array), oldest first
+        self.nbytes = 0
+        self.budget_evictions = 0  # Frames dropped before their time to stay in budget
+
+    def append(self, frame, timestamp):
+        """Compress a frame and drop what is older than `seconds` or over the budget"""
+        if self._frames and timestamp < self._frames[-1][0]:
+            self.clear()  # Clock went back (seek, restarted source)
+
+        ok, jpeg = cv2.imencode('.jpg', frame, self._params)
+        if not ok:
+            return
+        self._frames.append((timestamp, jpeg))
+        self.nbytes += jpeg.nbytes
+
+        while self._frames[0][0] <= timestamp - self.seconds:
+            self._pop()
+        while self.nbytes > self.budget and len(self._frames) > 1:
+            self._pop()
+            self.budget_evictions += 1
+
+    def _pop(self):
+        _, jpeg = self._frames.popleft()
+        self.nbytes -= jpeg.nbytes
+
+    def snapshot(self):
+        """
+        Frames buffered right now as a lazy (timestamp, frame) iterator, oldest first
+        Decoding happens where it is consumed (the clip writer thread)
+        """
+        entries = list(self._frames)
+        return ((timestamp, cv2.imdecode(jpeg, cv2.IMREAD_COLOR)) for timestamp, jpeg in entries)
+
+    def duration(self):
+        """Seconds of footage currently buffered"""
+        return self._frames[-1][0] - self._frames[0][0] if self._frames else 0.0
+
+    def clear(self):
+        self._frames.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get_stats(self):
+        """Get buffered frames, seconds covered and memory use"""
+        return {
+            'preroll_frames': len(self._frames),
+            'preroll_seconds': round(self.duration(), 2),
+            'preroll_mb': round(self.nbytes / (1024 * 1024), 2),
+            'preroll_budget_mb': round(self.budget / (1024 * 1024), 2),
+            'preroll_budget_evictions': self.budget_evictions
+        }
@@ -0,0 +1,82 @@
+"""
+Adaptive Quality Controller
+Watches per-frame processing latency against a camera's FPS target and steps
+through a ladder of cheaper settings (resolution, detection stride, YOLO input
+size, motion pyramid level) under load - and back up when headroom returns
+"""
+import config
+
+
+class QualityController:
+    def __init__(self, target_fps=None, ladder=None):
+        """
+        target_fps: frames per second this camera should sustain (None = config.TARGET_FPS)
+        ladder: list of settings dicts, best quality first (None = config.QUALITY_LADDER)
+        """
+        self.target_fps = float(target_fps or config.TARGET_FPS)
+        self.ladder = ladder or config.QUALITY_LADDER
+        self.level = 0
+        self.frame_ms = None  # Smoothed processing time per frame
+        self.changes = 0
+
+        self._over = 0      # Consecutive frames over budget
+        self._under = 0     # Consecutive frames with headroom
+        self._settle = 0    # Frames to ignore after a change (EMA catches up)
+
+    @property
+    def budget_ms(self):
+        """Processing time per frame that still meets the FPS target"""
+        return 1000.0 / self.target_fps
+
+    @property
+    def settings(self):
+        """Settings for the current level"""
+        return self.ladder[self.level]
+
+    def update(self, frame_ms):
+        """
+        Record one frame's processing time
+        Returns: True if the level changed (apply the new settings)
+        """
+        if self.frame_ms is None:
+            self.frame_ms = frame_ms
+        else:
+            self.frame_ms += config.QUALITY_SMOOTHING * (frame_ms - self.frame_ms)
+
+        if self._settle > 0:
+            self._settle -= 1
+            return False
+
+        if self.frame_ms > self.budget_ms:
+            self._over += 1
+            self._under = 0
+        elif self.frame_ms < self.budget_ms * config.QUALITY_HEADROOM:
+            self._under += 1
+            self._over = 0
+        else:
+            self._over = self._under = 0
+
+        # Degrade quickly, recover slowly (avoids flapping at the boundary)
+        if self._over >= config.QUALITY_DEGRADE_FRAMES and self.level < len(self.ladder) - 1:
+            return self._set_level(self.level + 1)
+        if self._under >= config.QUALITY_RECOVER_FRAMES and self.level > 0:
+            return self._set_level(self.level - 1)
+        return False
+
+    def _set_level(self, level):
+        self.level = level
+        self.changes += 1
+        self._over = self._under = 0
+        self._settle = config.QUALITY_DEGRADE_FRAMES
+        return True
+
+    def get_stats(self):
+        """Get current level, settings and measured latency"""
+        return {
+            'quality_level': self.level,
+            'quality_max_level': len(self.ladder) - 1,
+            'target_fps': self.target_fps,
+            'frame_ms': round(self.frame_ms, 2) if self.frame_ms is not None else None,
+            'quality_settings': dict(self.settings),
+            'quality_changes': self.changes
+        }
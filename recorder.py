@@ -0,0 +1,226 @@
+"""
+Continuous Segmented Recorder
+Optional always-on recording: each camera's frames go to fixed-length
+segment files (encoded on a ClipWriter thread) kept for a rolling retention
+window. Alerts then only reference a (camera, start, end) time range - the
+clip is cut from the segments when someone downloads it
+"""
+import os
+import re
+import threading
+import time
+import cv2
+import config
+from clip_writer import ClipWriter
+
+
+# Finished segment: <first frame ms>_<end ms>.avi (wall clock, epoch milliseconds)
+SEGMENT_NAME = re.compile(r'^(\d+)_(\d+)\.avi$')
+# Segment still being written: <first frame ms>.partial.avi
+PARTIAL_NAME = re.compile(r'^(\d+)\.partial\.avi$')
+
+# Camera folders already swept for crash leftovers by this process
+_swept_dirs = set()
+_swept_lock = threading.Lock()
+
+
+def camera_dir(camera_id, directory=None):
+    return os.path.join(directory or config.RECORDINGS_DIR, camera_id or 'default')
+
+
+def list_segments(camera_id, directory=None):
+    """
+    Finished segments of a camera, oldest first
+    Returns: list of (start, end, path) - epoch seconds
+    """
+    folder = camera_dir(camera_id, directory)
+    if not os.path.isdir(folder):
+        return []
+    segments = []
+    for filename in os.listdir(folder):
+        match = SEGMENT_NAME.match(filename)
+        if match:
+            segments.append((int(match.group(1)) / 1000, int(match.group(2)) / 1000,
+                             os.path.join(folder, filename)))
+    return sorted(segments)
+
+
+def export_clip(camera_id, start, end, path, directory=None):
+    """
+    Cut [start, end) (epoch seconds) out of a camera's segments into one clip
+    Only the covering segments are decoded; frames sit at fixed fps from each segment start
+    Returns: frames written
+    """
+    segments = [s for s in list_segments(camera_id, directory) if s[1] > start and s[0] < end]
+    if not segments:
+        raise RuntimeError(f"No recording of {camera_id} covers this time range")
+
+    fps = config.RECORDING_FPS
+    writer = None
+    written = 0
+    try:
+        for segment_start, _, segment_path in segments:
+            cap = cv2.VideoCapture(segment_path)
+            first = max(0, int((start - segment_start) * fps))
+            if first:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+            index = first
+            while segment_start + index / fps < end:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
+                writer.write(frame)
+                written += 1
+                index += 1
+            cap.release()
+    finally:
+        if writer is not None:
+            writer.release()
+    if not written:
+        raise RuntimeError(f"No recorded frames of {camera_id} in this time range")
+    return written
+
+
+class ClipExports:
+    def __init__(self):
+        """Clips being cut from recordings on background threads, one job per output path"""
+        self._lock = threading.Lock()
+        self._jobs = {}  # Output path -> None while running, or the exception it failed with
+
+    def request(self, camera_id, start, end, path):
+        """
+        Export [start, end) of a camera's recording to path, unless it exists or is running
+        Returns: (state, error) - state 'done', 'running' or 'failed' (reported once, then retried)
+        """
+        with self._lock:
+            if path in self._jobs:
+                error = self._jobs[path]
+                if error is None:
+                    return 'running', None
+                del self._jobs[path]
+                return 'failed', error
+            if os.path.exists(path):
+                return 'done', None
+            self._jobs[path] = None
+        threading.Thread(target=self._run, args=(camera_id, start, end, path),
+                         name='clip-export', daemon=True).start()
+        return 'running', None
+
+    def _run(self, camera_id, start, end, path):
+        """Export to a temporary name, renamed only on success (never left half-written)"""
+        partial = os.path.splitext(path)[0] + '.partial.avi'
+        error = None
+        try:
+            export_clip(camera_id, start, end, partial)
+            os.replace(partial, path)
+        except Exception as e:
+            error = e
+            print(f"❌ Clip export failed ({path}): {e}")
+        finally:
+            if os.path.exists(partial):
+                try:
+                    os.remove(partial)
+                except OSError:
+                    pass
+        with self._lock:
+            if error is None:
+                del self._jobs[path]
+            else:
+                self._jobs[path] = error
+
+
+# Shared by all cameras
+clip_exports = ClipExports()
+
+
+class SegmentRecorder:
+    def __init__(self, camera_id, directory=None, segment_seconds=None, retention_seconds=None):
+        """
+        camera_id: segments go to <directory>/<camera_id>/
+        segment_seconds: length of each file (None = config.SEGMENT_SECONDS)
+        retention_seconds: segments older than this are deleted (None = config.RECORDING_RETENTION_SECONDS)
+        """
+        self.camera_id = camera_id
+        self.directory = camera_dir(camera_id, directory)
+        self.segment_seconds = segment_seconds or config.SEGMENT_SECONDS
+        self.retention_seconds = retention_seconds or config.RECORDING_RETENTION_SECONDS
+        self.fps = config.RECORDING_FPS
+        os.makedirs(self.directory, exist_ok=True)
+        self._remove_partials()
+
+        self.writer = ClipWriter(max_frames=config.RECORDING_QUEUE_FRAMES,
+                                 name=f"recorder-{camera_id}", log_saves=False)
+        self._clip = None    # Clip id of the open segment
+        self._start = None   # Wall time of its first frame
+        self._last = None    # Wall time of the last frame written
+        self.segments_deleted = 0
+
+    def write(self, frame, wall_time=None):
+        """
+        Record one frame (queued - never blocks)
+        wall_time: epoch seconds (None = now) - segments and alerts share this clock
+        """
+        now = wall_time if wall_time is not None else time.time()
+        if self._clip is not None and now - self._start >= self.segment_seconds:
+            self._close_segment()
+        if self._clip is None:
+            self._start = now
+            self._clip = self.writer.open_clip(
+                os.path.join(self.directory, f"{int(now * 1000)}.partial.avi"), self.fps
+            )
+            self._expire(now)
+        self.writer.write([self._clip], frame, now)
+        self._last = now
+
+    def _close_segment(self):
+        """Finish the open segment - renamed to <start>_<end>.avi once fully written"""
+        end = self._last + 1.0 / self.fps
+        final_path = os.path.join(self.directory, f"{int(self._start * 1000)}_{int(end * 1000)}.avi")
+        self.writer.close_clip(self._clip, final_path)
+        self._clip = None
+
+    def _remove_partials(self):
+        """
+        Segments left unfinished by a previous run (crash) are unreadable - drop them
+        Only once per process: a restarted camera's old recorder may still be finishing its partial
+        """
+        with _swept_lock:
+            if self.directory in _swept_dirs:
+                return
+            _swept_dirs.add(self.directory)
+        for filename in os.listdir(self.directory):
+            if PARTIAL_NAME.match(filename):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+    def _expire(self, now):
+        """Delete finished segments that ended before the retention window"""
+        for _, end, path in list_segments(self.camera_id, os.path.dirname(self.directory)):
+            if end >= now - self.retention_seconds:
+                break
+            try:
+                os.remove(path)
+                self.segments_deleted += 1
+            except OSError:
+                pass
+
+    def get_stats(self):
+        """Get segment writer backlog and retention activity"""
+        stats = self.writer.get_stats()
+        return {
+            'recording_queue': stats['clip_queue'],
+            'recording_frames_dropped': stats['clip_frames_dropped'],
+            'recording_segments': stats['clips_saved'],
+            'recording_segments_deleted': self.segments_deleted
+        }
+
+    def close(self):
+        """Finish the open segment and stop the writer thread"""
+        if self._clip is not None:
+            self._close_segment()
+        self.writer.close(timeout=config.CLIP_WRITER_CLOSE_TIMEOUT)
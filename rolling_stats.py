@@ -0,0 +1,179 @@
+"""
+Rolling Statistics Module
+Timestamped numpy ring buffers with O(1) running sums over trailing time
+spans (a fixed time rather than a fixed frame count), and an incremental
+direction-change counter
+"""
+import numpy as np
+from collections import deque
+
+
+class TimeWindow:
+    def __init__(self, columns, spans, capacity=64):
+        """
+        Timestamped rows in a preallocated ring with O(1) running sums over
+        trailing time spans - each span is a tail index into the same ring
+        columns: column names, e.g. ('dt', 'distance')
+        spans: window lengths in seconds (rows older than the span are evicted)
+        capacity: initial rows kept; doubled (rarely) if the longest span ever holds more
+        """
+        self.columns = {name: i for i, name in enumerate(columns)}
+        self.spans = tuple(sorted(set(spans)))
+        self.capacity = capacity
+        self.times = [0.0] * capacity  # Plain floats - compared one at a time while evicting
+        self.data = np.zeros((capacity, len(columns)), dtype=np.float64)
+        self._all_sums = np.zeros((len(self.spans), len(columns)), dtype=np.float64)
+        self._sums = dict(zip(self.spans, self._all_sums))  # Row views - one add updates every span
+        self._tails = {span: 0 for span in self.spans}   # Oldest row inside each span
+        self._counts = {span: 0 for span in self.spans}  # Rows inside each span
+        self._head = 0    # Next row to write
+        self._appends = 0
+
+    def append(self, timestamp, row):
+        """Add a row at timestamp (non-decreasing), evicting rows that left each span"""
+        if self._counts[self.spans[-1]] == self.capacity:
+            self._grow()
+
+        head = self._head
+        times, data, capacity = self.times, self.data, self.capacity
+        times[head] = timestamp
+        new = data[head]
+        new[:] = row
+        self._head = (head + 1) % capacity
+
+        self._all_sums += new
+        for span in self.spans:
+            tail, count = self._tails[span], self._counts[span] + 1
+            while times[tail] <= timestamp - span:
+                self._sums[span] -= data[tail]
+                tail = (tail + 1) % capacity
+                count -= 1
+            self._tails[span], self._counts[span] = tail, count
+
+        # Re-sum occasionally so float error can't drift
+        self._appends += 1
+        if self._appends % (self.capacity * 100) == 0:
+            self._recompute()
+
+    def _grow(self):
+        """Double the ring, oldest row first (only when a span outgrows it)"""
+        longest = self.spans[-1]
+        order = (self._tails[longest] + np.arange(self._counts[longest])) % self.capacity
+        offsets = {span: self._counts[longest] - self._counts[span] for span in self.spans}
+        self.capacity *= 2
+        self.times = [self.times[i] for i in order] + [0.0] * (self.capacity - len(order))
+        self.data = np.concatenate([self.data[order], np.zeros((self.capacity - len(order), self.data.shape[1]))])
+        self._tails = offsets
+        self._head = len(order)
+
+    def _recompute(self):
+        for span in self.spans:
+            idx = (self._tails[span] + np.arange(self._counts[span])) % self.capacity
+            self._sums[span][:] = self.data[idx].sum(axis=0)
+
+    def update_last(self, column, value):
+        """Overwrite one value of the newest row (every span holds it)"""
+        if self._counts[self.spans[0]] == 0:
+            return
+        col = self.columns[column]
+        last = (self._head - 1) % self.capacity
+        delta = value - self.data[last, col]
+        self.data[last, col] = value
+        for span in self.spans:
+            self._sums[span][col] += delta
+
+    def sum(self, column, span=None):
+        """Sum of a column over the span (default: the longest)"""
+        return self._sums[span or self.spans[-1]][self.columns[column]]
+
+    def count(self, span=None):
+        """Rows inside the span"""
+        return self._counts[span or self.spans[-1]]
+
+    def mean(self, column, span=None):
+        """Mean of a column over the rows inside the span"""
+        n = self.count(span)
+        return self.sum(column, span) / n if n else 0.0
+
+    def means(self, span=None):
+        """Mean of every column over the span, as one vector"""
+        n = self.count(span)
+        if n == 0:
+            return np.zeros(len(self.columns))
+        return self._sums[span or self.spans[-1]] / n
+
+    def last_row(self):
+        """Newest row, as a copy"""
+        if self._counts[self.spans[-1]] == 0:
+            return np.zeros(len(self.columns))
+        return self.data[(self._head - 1) % self.capacity].copy()
+
+    def duration(self, span=None):
+        """Time between the oldest and newest row inside the span"""
+        span = span or self.spans[-1]
+        if not self._counts[span]:
+            return 0.0
+        return self.times[(self._head - 1) % self.capacity] - self.times[self._tails[span]]
+
+    def clear(self):
+        """Drop all rows"""
+        for span in self.spans:
+            self._sums[span][:] = 0
+            self._tails[span] = self._head
+            self._counts[span] = 0
+
+    def __len__(self):
+        return self.count()
+
+
+class DirectionChangeCounter:
+    def __init__(self, window, min_step):
+        """
+        Incremental count of direction changes over the last `window` steps
+        (or seconds, when add() is given timestamps)
+        A step is significant when |dx| or |dy| exceeds min_step; a change is a
+        significant step whose (sign dx, sign dy) differs from the previous
+        significant step inside the window
+        """
+        self.window = window
+        self.min_step = min_step
+        self._steps = 0
+        self._significant = deque()  # (step index, direction, changed) inside the window
+        self._changes = deque()      # Step indices flagged as a change inside the window
+
+    def add(self, dx, dy, timestamp=None):
+        """
+        Add one step (displacement since the previous frame, or velocity)
+        timestamp: position on a time axis - the window is then in seconds
+        """
+        index = self._steps if timestamp is None else timestamp
+        self._steps += 1
+
+        # Evict steps that slid out of the window
+        cutoff = index - self.window
+        while self._significant and self._significant[0][0] <= cutoff:
+            self._significant.popleft()
+        while self._changes and self._changes[0] <= cutoff:
+            self._changes.popleft()
+
+        if abs(dx) > self.min_step or abs(dy) > self.min_step:
+            direction = (1 if dx > 0 else -1, 1 if dy > 0 else -1)
+            changed = bool(self._significant) and self._significant[-1][1] != direction
+            self._significant.append((index, direction, changed))
+            if changed:
+                self._changes.append(index)
+
+    def count(self):
+        """Direction changes in the window"""
+        # The oldest significant step has no predecessor left in the window
+        first_changed = self._significant and self._significant[0][2]
+        return len(self._changes) - (1 if first_changed else 0)
+
+    def moves(self):
+        """Significant steps in the window"""
+        return len(self._significant)
+
+    def reset(self):
+        """Forget all steps"""
+        self._significant.clear()
+        self._changes.clear()
@@ -479,8 +479,9 @@ function updateAlertList() {
 
 async function loadSavedVideos() {
     try {
-        const response = await fetch('/api/alerts');
-        const videos = await response.json();
+        const response = await fetch('/api/alerts?limit=10');
+        const data = await response.json();
+        const videos = data.alerts.filter(alert => alert.clip_url);
 
         if (videos.length === 0) {
             videoList.innerHTML = '<p class="no-videos">No saved videos</p>';
@@ -490,8 +491,8 @@ async function loadSavedVideos() {
         videoList.innerHTML = videos.map(video => `
             <div class="video-item">
                 <div>
-                    <div class="video-name">📹 ${video.filename}</div>
-                    <div class="video-info">${video.time} | ${formatFileSize(video.size)}</div>
+                    <div class="video-name">📹 <a href="${video.clip_url}">${video.filename || `alert_${video.id} (${video.camera_id})`}</a></div>
+                    <div class="video-info">${video.time}${video.size !== null ? ' | ' + formatFileSize(video.size) : ''}</div>
                 </div>
             </div>
         `).join('');
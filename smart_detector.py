@@ -6,52 +6,84 @@ import cv2
 import numpy as np
 from collections import deque
 import math
+import config
+from detections import Detections
+from tracker import KinematicTracker
+from spatial_index import close_pairs
+from rolling_stats import TimeWindow
+
+# Per-frame features recorded for the learned scorer (indicator scores + scene counts)
+FEATURE_NAMES = ('proximity', 'speed', 'impact', 'chaos', 'aggression', 'interaction',
+                 'people', 'motion_regions')
 
 class RealAdvancedDetector:
-    def __init__(self):
-        """Initialize REAL advanced violence detector"""
+    def __init__(self, scorer=None):
+        """
+        Initialize REAL advanced violence detector
+        scorer: trained violence_model.LogisticScorer (None = hand-tuned weights)
+        """
         # Use simple lists instead of complex numpy arrays
-        self.person_history = []  # Store last 20 frames of person data
-        self.max_history = 20
-        
-    def analyze_violence(self, person_boxes, motion_boxes, frame_shape):
+        self.person_history = []  # Person data of the last ANALYSIS_HISTORY_SECONDS
+        self.frame_index = 0
+        self.tracker = KinematicTracker()  # Stable person IDs + incremental speed/impact/chaos state
+        self.tracks = []  # Tracks seen in the current frame
+        self.close_pairs = np.zeros((0, 2), dtype=np.int64)  # Index pairs into person_boxes at fighting distance, closest first
+        self.scorer = scorer
+        # Per-frame features for the scorer, over the last FEATURE_WINDOW_SECONDS of capture time
+        self.features = TimeWindow(FEATURE_NAMES, spans=(config.FEATURE_WINDOW_SECONDS,))
+        
+    def analyze_violence(self, person_boxes, motion_boxes, frame_shape, flow=None, timestamp=None):
         """
         REAL violence analysis that actually works
+        flow: optional per-person optical flow features (FlowFeatureExtractor.update)
+              - when given, speed/impact/chaos use flow instead of box-centre jumps
+        person_boxes: Detections (or the legacy list of {'box', 'confidence'} dicts)
+        timestamp: capture time in seconds (None = frame count at config.FPS) - speeds
+                   are px/s over time windows, so skipped frames don't change the score
         Returns: violence_score (0-1), reason (string)
         """
+        self.frame_index += 1
+        if timestamp is None:
+            timestamp = self.frame_index / config.FPS
+        person_boxes = Detections.from_dicts(person_boxes)
+        self.tracks = self.tracker.update(person_boxes, timestamp)
         if len(person_boxes) == 0:
+            self._record_features(timestamp, {}, person_boxes, motion_boxes)
             return 0.0, "No people"
         
         # Store current frame data
         current_data = {
             'people': person_boxes,
             'motion': motion_boxes,
-            'time': len(self.person_history)
+            'flow': flow,
+            'time': timestamp
         }
         self.person_history.append(current_data)
         
         # Keep only recent history
-        if len(self.person_history) > self.max_history:
+        while timestamp - self.person_history[0]['time'] > config.ANALYSIS_HISTORY_SECONDS:
             self.person_history.pop(0)
         
-        # Need at least 10 frames for analysis
-        if len(self.person_history) < 10:
+        # Need some history for analysis
+        if timestamp - self.person_history[0]['time'] < config.ANALYSIS_WARMUP_SECONDS - 1e-6:
+            self._record_features(timestamp, {}, person_boxes, motion_boxes)
             return 0.0, "Analyzing..."
         
         # Calculate 6 violence indicators
         scores = {}
         
         # 1. PROXIMITY - Are people fighting distance? (0-1)
-        scores['proximity'] = self._check_proximity(person_boxes, frame_shape)
-        
-        # 2. SPEED - Fast aggressive movement? (0-1)
-        scores['speed'] = self._check_speed()
+        scores['proximity'], self.close_pairs = self._check_proximity(person_boxes, frame_shape)
         
-        # 3. IMPACT - Sudden stops (hit landed)? (0-1)
-        scores['impact'] = self._check_impact()
-        
-        # 4. CHAOS - Erratic unpredictable movement? (0-1)
-        scores['chaos'] = self._check_chaos()
+        # 2-4. SPEED, IMPACT, CHAOS - from optical flow when available, else box centres
+        if flow is not None:
+            scores['speed'] = self._check_flow_speed()
+            scores['impact'] = self._check_flow_impact()
+            scores['chaos'] = self._check_flow_chaos()
+        else:
+            scores['speed'] = self._check_speed()
+            scores['impact'] = self._check_impact()
+            scores['chaos'] = self._check_chaos()
         
         # 5. AGGRESSION - Upper body motion (punching)? (0-1)
         scores['aggression'] = self._check_aggression(person_boxes, motion_boxes)
@@ -59,6 +91,12 @@ class RealAdvancedDetector:
         # 6. INTERACTION - Multiple people moving together? (0-1)
         scores['interaction'] = self._check_interaction(person_boxes)
         
+        self._record_features(timestamp, scores, person_boxes, motion_boxes)
+        
+        # Learned scorer (one dot product on the feature window) when trained
+        if self.scorer is not None:
+            return self.scorer.predict(self.window_features()), self._explain_score(scores)
+        
         # Calculate final score with smart weighting
         violence_score = (
             scores['proximity'] * 0.20 +      # Close = suspicious
@@ -74,164 +112,166 @@ class RealAdvancedDetector:
         
         return min(violence_score, 1.0), reason
     
+    def _record_features(self, timestamp, scores, person_boxes, motion_boxes):
+        """Append this frame's feature row at its capture time (O(1), running window sums)"""
+        self.features.append(timestamp, [scores.get(name, 0.0) for name in FEATURE_NAMES[:6]] +
+                             [len(person_boxes), len(motion_boxes)])
+    
+    def window_features(self):
+        """Learned scorer input: this frame's features + their mean over the last FEATURE_WINDOW_SECONDS"""
+        return np.concatenate([self.features.last_row(), self.features.means()])
+    
     def _check_proximity(self, person_boxes, frame_shape):
-        """Check if people are at fighting distance"""
-        if len(person_boxes) < 2:
-            return 0.0
-        
+        """
+        Check if people are at fighting distance
+        Returns: score (0-1), close pairs (K x 2 indices into person_boxes, closest first)
+        """
         frame_width = frame_shape[1]
+        very_close, close, nearby = config.PROXIMITY_LEVELS
         
-        # Calculate distance between people
-        min_dist = float('inf')
-        for i in range(len(person_boxes)):
-            for j in range(i + 1, len(person_boxes)):
-                box1 = person_boxes[i]['box']
-                box2 = person_boxes[j]['box']
-                
-                # Center points
-                c1_x = (box1[0] + box1[2]) / 2
-                c1_y = (box1[1] + box1[3]) / 2
-                c2_x = (box2[0] + box2[2]) / 2
-                c2_y = (box2[1] + box2[3]) / 2
-                
-                dist = math.sqrt((c1_x - c2_x)**2 + (c1_y - c2_y)**2)
-                min_dist = min(min_dist, dist)
+        # Only pairs within the widest scoring distance (grid index in crowds)
+        pairs, distances = close_pairs(person_boxes.centers, nearby * frame_width)
+        if len(pairs) == 0:
+            return 0.0, pairs
         
         # Normalize by frame width
-        normalized_dist = min_dist / frame_width
+        normalized_dist = distances[0] / frame_width
         
-        # Close proximity scoring
-        if normalized_dist < 0.15:  # Very close
-            return 1.0
-        elif normalized_dist < 0.25:  # Close
-            return 0.7
-        elif normalized_dist < 0.35:  # Nearby
-            return 0.3
+        # Close proximity scoring (every returned pair is at least nearby)
+        if normalized_dist < very_close:
+            return 1.0, pairs
+        elif normalized_dist < close:
+            return 0.7, pairs
         else:
-            return 0.0
+            return 0.3, pairs
     
     def _check_speed(self):
-        """Check movement speed - violence is FAST"""
-        if len(self.person_history) < 5:
+        """Check movement speed - violence is FAST (fastest tracked person)"""
+        speeds = [speed for speed in (track.speed() for track in self.tracks) if speed is not None]
+        if len(speeds) == 0:
             return 0.0
         
-        recent = self.person_history[-5:]
-        
-        # Calculate how much people moved
-        total_movement = 0
-        count = 0
+        avg_speed = max(speeds)  # px/s
+        moderate, fast, very_fast = config.SPEED_LEVELS
         
-        for i in range(len(recent) - 1):
-            prev_people = recent[i]['people']
-            curr_people = recent[i + 1]['people']
+        # Violence is typically fast movement
+        if avg_speed > very_fast:
+            return 1.0
+        elif avg_speed > fast:
+            return 0.7
+        elif avg_speed > moderate:
+            return 0.3
+        else:
+            return 0.0
+    
+    def _check_impact(self):
+        """Detect sudden stops - sign of hit/impact (any tracked person)"""
+        possible, strong = config.IMPACT_LEVELS
+        score = 0.0
+        for track in self.tracks:
+            speeds = track.impact_speeds()
+            if speeds is None:
+                continue
+            before_avg, after_avg = speeds
             
-            # Match people across frames (simple: just use first person)
-            if len(prev_people) > 0 and len(curr_people) > 0:
-                prev_box = prev_people[0]['box']
-                curr_box = curr_people[0]['box']
-                
-                # Calculate movement
-                prev_cx = (prev_box[0] + prev_box[2]) / 2
-                prev_cy = (prev_box[1] + prev_box[3]) / 2
-                curr_cx = (curr_box[0] + curr_box[2]) / 2
-                curr_cy = (curr_box[1] + curr_box[3]) / 2
-                
-                movement = math.sqrt((curr_cx - prev_cx)**2 + (curr_cy - prev_cy)**2)
-                total_movement += movement
-                count += 1
-        
-        if count == 0:
+            # Big drop = impact
+            if before_avg > strong and after_avg < before_avg * 0.4:
+                return 1.0
+            elif before_avg > possible and after_avg < before_avg * 0.5:
+                score = 0.6
+        
+        return score
+    
+    def _check_chaos(self):
+        """Detect chaotic, unpredictable movement - sign of fighting (most chaotic person)"""
+        ratios = [ratio for ratio in (track.direction_change_ratio() for track in self.tracks)
+                  if ratio is not None]
+        if len(ratios) == 0:
             return 0.0
         
-        avg_speed = total_movement / count
+        change_ratio = max(ratios)
         
-        # Violence is typically fast movement
-        if avg_speed > 30:  # Very fast
+        # High change ratio = chaotic = fighting
+        if change_ratio > 0.7:  # Very chaotic
             return 1.0
-        elif avg_speed > 20:  # Fast
+        elif change_ratio > 0.5:  # Chaotic
             return 0.7
-        elif avg_speed > 10:  # Moderate
+        elif change_ratio > 0.3:  # Somewhat chaotic
             return 0.3
         else:
             return 0.0
     
-    def _check_impact(self):
-        """Detect sudden stops - sign of hit/impact"""
-        if len(self.person_history) < 8:
+    def _recent(self, seconds):
+        """History entries from the last `seconds` of capture time"""
+        now = self.person_history[-1]['time']
+        return [data for data in self.person_history if data['time'] > now - seconds]
+    
+    def _flow_speeds(self, seconds):
+        """(time, fastest person's mean flow in px/s) for recent frames that have flow"""
+        speeds = []
+        for data in self._recent(seconds):
+            if data['flow']:
+                speeds.append((data['time'], max(person['magnitude'] for person in data['flow'])))
+        return speeds
+    
+    def _check_flow_speed(self):
+        """Check movement speed from optical flow - violence is FAST"""
+        speeds = self._flow_speeds(config.SPEED_WINDOW_SECONDS)
+        if len(speeds) == 0:
             return 0.0
         
-        recent = self.person_history[-8:]
+        avg_speed = sum(speed for _, speed in speeds) / len(speeds)
+        moderate, fast, very_fast = config.FLOW_SPEED_LEVELS
         
-        # Calculate speed changes
-        speeds = []
-        for i in range(len(recent) - 1):
-            if len(recent[i]['people']) > 0 and len(recent[i+1]['people']) > 0:
-                prev_box = recent[i]['people'][0]['box']
-                curr_box = recent[i+1]['people'][0]['box']
-                
-                prev_cx = (prev_box[0] + prev_box[2]) / 2
-                curr_cx = (curr_box[0] + curr_box[2]) / 2
-                
-                speed = abs(curr_cx - prev_cx)
-                speeds.append(speed)
-        
-        if len(speeds) < 4:
+        if avg_speed > very_fast:
+            return 1.0
+        elif avg_speed > fast:
+            return 0.7
+        elif avg_speed > moderate:
+            return 0.3
+        else:
+            return 0.0
+    
+    def _check_flow_impact(self):
+        """Detect sudden stops in optical flow - sign of hit/impact"""
+        speeds = self._flow_speeds(config.IMPACT_WINDOW_SECONDS)
+        middle = self.person_history[-1]['time'] - config.IMPACT_WINDOW_SECONDS / 2
+        first_half = [speed for t, speed in speeds if t <= middle]
+        second_half = [speed for t, speed in speeds if t > middle]
+        if len(first_half) == 0 or len(second_half) == 0:
             return 0.0
         
-        # Check for sudden drop (impact)
-        first_half = speeds[:len(speeds)//2]
-        second_half = speeds[len(speeds)//2:]
+        before_avg = sum(first_half) / len(first_half)
+        after_avg = sum(second_half) / len(second_half)
+        moderate, fast, _ = config.FLOW_SPEED_LEVELS
         
-        if len(first_half) > 0 and len(second_half) > 0:
-            before_avg = sum(first_half) / len(first_half)
-            after_avg = sum(second_half) / len(second_half)
-            
-            # Big drop = impact
-            if before_avg > 15 and after_avg < before_avg * 0.4:
-                return 1.0
-            elif before_avg > 10 and after_avg < before_avg * 0.5:
-                return 0.6
+        # Big drop = impact
+        if before_avg > fast and after_avg < before_avg * 0.4:
+            return 1.0
+        elif before_avg > moderate and after_avg < before_avg * 0.5:
+            return 0.6
         
         return 0.0
     
-    def _check_chaos(self):
-        """Detect chaotic, unpredictable movement - sign of fighting"""
-        if len(self.person_history) < 12:
-            return 0.0
-        
-        recent = self.person_history[-12:]
-        
-        # Track direction changes
-        directions = []
-        for i in range(len(recent) - 1):
-            if len(recent[i]['people']) > 0 and len(recent[i+1]['people']) > 0:
-                prev_box = recent[i]['people'][0]['box']
-                curr_box = recent[i+1]['people'][0]['box']
-                
-                dx = ((curr_box[0] + curr_box[2])/2) - ((prev_box[0] + prev_box[2])/2)
-                dy = ((curr_box[1] + curr_box[3])/2) - ((prev_box[1] + prev_box[3])/2)
-                
-                if abs(dx) > 2 or abs(dy) > 2:  # Significant movement
-                    direction = (1 if dx > 0 else -1, 1 if dy > 0 else -1)
-                    directions.append(direction)
-        
-        if len(directions) < 5:
+    def _check_flow_chaos(self):
+        """Detect chaotic movement - flow of moving people points in many directions"""
+        variances = []
+        for data in self._recent(config.CHAOS_WINDOW_SECONDS):
+            for person in data['flow'] or ():
+                if person['magnitude'] > config.FLOW_SPEED_LEVELS[0]:
+                    variances.append(person['direction_variance'])
+        
+        if len(variances) < 3:
             return 0.0
         
-        # Count direction changes
-        changes = 0
-        for i in range(len(directions) - 1):
-            if directions[i] != directions[i + 1]:
-                changes += 1
-        
-        change_ratio = changes / len(directions)
+        direction_variance = sum(variances) / len(variances)
         
-        # High change ratio = chaotic = fighting
-        if change_ratio > 0.7:  # Very chaotic
+        # High direction variance = chaotic = fighting
+        if direction_variance > 0.7:  # Very chaotic
             return 1.0
-        elif change_ratio > 0.5:  # Chaotic
+        elif direction_variance > 0.5:  # Chaotic
             return 0.7
-        elif change_ratio > 0.3:  # Somewhat chaotic
+        elif direction_variance > 0.3:  # Somewhat chaotic
             return 0.3
         else:
             return 0.0
@@ -241,25 +281,18 @@ class RealAdvancedDetector:
         if len(person_boxes) == 0 or len(motion_boxes) == 0:
             return 0.0
         
-        # Check if motion is in upper body area
-        upper_motion = 0
-        total_motion = 0
+        # Check if motion is in upper body area (every person x every motion box)
+        px1, py1, px2, py2 = (person_boxes.xyxy.astype(np.float64)[:, i, None] for i in range(4))
+        mx, my, mw, mh = np.asarray(motion_boxes, dtype=np.float64).T
+        upper_threshold = py1 + (py2 - py1) * 0.6  # Upper 60%
         
-        for person in person_boxes:
-            px1, py1, px2, py2 = person['box']
-            person_height = py2 - py1
-            upper_threshold = py1 + (person_height * 0.6)  # Upper 60%
-            
-            for mx, my, mw, mh in motion_boxes:
-                motion_cy = my + mh/2
-                
-                # Check if motion is in this person's area
-                if px1 <= mx <= px2 and py1 <= my <= py2:
-                    total_motion += mw * mh
-                    
-                    # Is it upper body?
-                    if motion_cy < upper_threshold:
-                        upper_motion += mw * mh
+        # Motion box corner inside this person's area
+        inside = (px1 <= mx) & (mx <= px2) & (py1 <= my) & (my <= py2)
+        area = mw * mh
+        total_motion = (inside * area).sum()
+        
+        # Is it upper body?
+        upper_motion = ((inside & (my + mh / 2 < upper_threshold)) * area).sum()
         
         if total_motion == 0:
             return 0.0
@@ -317,4 +350,9 @@ class RealAdvancedDetector:
     
     def reset(self):
         """Reset history"""
-        self.person_history = []
\ No newline at end of file
+        self.person_history = []
+        self.frame_index = 0
+        self.tracker.reset()
+        self.tracks = []
+        self.close_pairs = np.zeros((0, 2), dtype=np.int64)
+        self.features.clear()
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Spatial Index Module
+Close pairs among 2-D points (person centres) - vectorised brute force for
+small N, a uniform grid (cell size = search radius) for crowded scenes, so
+only points in neighbouring cells are ever compared
+"""
+import numpy as np
+import config
+
+
+# Neighbour cells checked from each cell - half of the 3x3 block, so each pair is found once
+HALF_NEIGHBOURHOOD = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def _empty_pairs():
+    return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+
+def pairwise_distances(points_a, points_b):
+    """Euclidean distance between every pair, len(points_a) x len(points_b)"""
+    a = np.asarray(points_a, dtype=np.float64).reshape(-1, 2)
+    b = np.asarray(points_b, dtype=np.float64).reshape(-1, 2)
+    diff = a[:, None, :] - b[None, :, :]
+    return np.hypot(diff[..., 0], diff[..., 1])
+
+
+def close_pairs(points, radius, grid_min_points=None):
+    """
+    All pairs of points within radius of each other
+    grid_min_points: use the grid index from this many points (None = config.PROXIMITY_GRID_MIN_POINTS)
+    Returns: pairs (K x 2 indices, i < j), distances (K) - closest pair first
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    grid_min_points = grid_min_points or config.PROXIMITY_GRID_MIN_POINTS
+    if len(points) < 2 or radius <= 0:
+        return _empty_pairs()
+
+    if len(points) < grid_min_points:
+        dist = pairwise_distances(points, points)
+        i, j = np.nonzero(np.triu(dist <= radius, k=1))
+        pairs, distances = np.stack([i, j], axis=1), dist[i, j]
+    else:
+        pairs, distances = _grid_pairs(points, radius)
+
+    order = np.argsort(distances, kind='stable')
+    return pairs[order], distances[order]
+
+
+def _grid_pairs(points, radius):
+    """Close pairs via a uniform grid: sort points by cell, range-search neighbouring cells"""
+    n = len(points)
+    cells = np.floor(points / radius).astype(np.int64)
+    cells -= cells.min(axis=0)
+    # Row-major cell key, with a spare column on each side so dy = +-1 never wraps
+    width = cells[:, 1].max() + 3
+    keys = cells[:, 0] * width + cells[:, 1] + 1
+
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    found_i, found_j = [], []
+    for dx, dy in HALF_NEIGHBOURHOOD:
+        neighbour = keys + dx * width + dy
+        lo = np.searchsorted(sorted_keys, neighbour, side='left')
+        hi = np.searchsorted(sorted_keys, neighbour, side='right')
+        counts = hi - lo
+        total = counts.sum()
+        if total == 0:
+            continue
+        # Expand each point's [lo, hi) range into individual candidates
+        i = np.repeat(np.arange(n), counts)
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(lo, counts) + within]
+        if dx == 0 and dy == 0:
+            keep = i < j  # Same cell: each pair once, no self pairs
+            i, j = i[keep], j[keep]
+        found_i.append(i)
+        found_j.append(j)
+
+    if not found_i:
+        return _empty_pairs()
+    i, j = np.concatenate(found_i), np.concatenate(found_j)
+    diff = points[i] - points[j]
+    distances = np.hypot(diff[:, 0], diff[:, 1])
+    keep = distances <= radius
+    pairs = np.sort(np.stack([i[keep], j[keep]], axis=1), axis=1)
+    return pairs, distances[keep]
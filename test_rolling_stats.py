@@ -0,0 +1,44 @@
+"""
+Rolling statistics regression tests (run: python -m pytest -q)
+"""
+import numpy as np
+from rolling_stats import TimeWindow
+
+
+def test_update_last_updates_every_span():
+    window = TimeWindow(('people',), (0.33, 0.5, 1.0))
+    for i in range(30):
+        window.append(i / 30, [0])
+    window.update_last('people', 2)
+    for span in window.spans:
+        assert window.sum('people', span) == 2.0
+        assert window.mean('people', span) == 2.0 / window.count(span)
+
+
+def test_update_last_then_evict_returns_to_zero():
+    window = TimeWindow(('people',), (0.33, 0.5, 1.0))
+    window.append(0.0, [0])
+    window.update_last('people', 2)
+    window.append(2.0, [0])  # Evicts the updated row from every span
+    for span in window.spans:
+        assert window.sum('people', span) == 0.0
+
+
+def test_matches_brute_force_through_ring_growth():
+    rng = np.random.default_rng(0)
+    spans = (0.2, 0.5, 2.0)
+    window = TimeWindow(('a', 'b'), spans, capacity=4)
+    rows, t = [], 0.0
+    for _ in range(2000):
+        t += rng.choice([0.001, 0.01, 0.05, 0.3])
+        row = rng.normal(size=2)
+        window.append(t, row)
+        rows.append((t, row))
+        if rng.random() < 0.2:
+            rows[-1][1][0] = 7.0
+            window.update_last('a', 7.0)
+        for span in spans:
+            inside = [r for ts, r in rows if ts > t - span]
+            assert window.count(span) == len(inside)
+            assert np.allclose([window.sum('a', span), window.sum('b', span)], np.sum(inside, axis=0))
+            assert np.isclose(window.duration(span), t - min(ts for ts, _ in rows if ts > t - span))
@@ -0,0 +1,515 @@
+"""
+Person Tracking Module
+Constant-velocity Kalman tracks with IoU association, so YOLO can run every
+N frames and person boxes are carried forward in between, plus per-person
+kinematics (velocity, acceleration, direction changes) for violence scoring
+"""
+import itertools
+import math
+import cv2
+import numpy as np
+import config
+from frame_pool import FramePool
+from detections import Detections, NUM_COLUMNS, CONF, TRACK_ID, NO_TRACK
+from rolling_stats import TimeWindow, DirectionChangeCounter
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    IoU between every pair of (x1, y1, x2, y2) boxes
+    Returns: len(boxes_a) x len(boxes_b) array
+    """
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    ix = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    iy = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = ix * iy
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_match(iou, threshold):
+    """
+    Match rows to columns, highest IoU first
+    Returns: list of (row, col, iou) with iou >= threshold
+    """
+    matches = []
+    if iou.size == 0:
+        return matches
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols])
+    used_rows, used_cols = set(), set()
+    for k in order:
+        r, c = rows[k], cols[k]
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matches.append((r, c, iou[r, c]))
+    return matches
+
+
+class KalmanBoxTrack:
+    # State: cx, cy, w, h and their velocities in px/s. The transition and
+    # process noise are built per step from the time since the last predict,
+    # so dropped frames and frame-rate changes move tracks the right distance
+    H = np.eye(4, 8)
+    Q_RATE = np.array([30.0, 30.0, 30.0, 30.0, 13500.0, 13500.0, 6750.0, 6750.0])  # Variance added per second
+    R = np.diag([4.0, 4.0, 10.0, 10.0])
+
+    def __init__(self, track_id, box, confidence):
+        """Start a track from a detection (x1, y1, x2, y2)"""
+        self.track_id = track_id
+        self.confidence = confidence
+        self.x = np.zeros(8)
+        self.x[:4] = self._measure(box)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 9e4, 9e4, 9e4, 9e4])
+        self.hits = 1
+        self.misses = 0  # Consecutive detection rounds without a match
+
+    @staticmethod
+    def _measure(box):
+        x1, y1, x2, y2 = box
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+    def predict(self, dt):
+        """Advance dt seconds"""
+        if dt <= 0:
+            return
+        F = np.eye(8)
+        F[:4, 4:] = dt * np.eye(4)
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + np.diag(self.Q_RATE * dt)
+        # Boxes can't shrink below a pixel
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+
+    def update(self, box, confidence):
+        """Correct with a matched detection"""
+        y = self._measure(box) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+        self.confidence = confidence
+        self.hits += 1
+        self.misses = 0
+
+    @property
+    def xyxy(self):
+        """Current (x1, y1, x2, y2) estimate"""
+        cx, cy, w, h = self.x[:4]
+        return (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+
+
+class PersonTracker:
+    def __init__(self, iou_threshold=None, max_misses=None):
+        """
+        IoU-associated Kalman tracks for person detections
+        iou_threshold: min IoU between a predicted track and a detection to match
+        max_misses: detection rounds a track survives without a match
+        """
+        self.iou_threshold = iou_threshold or config.TRACKER_IOU_THRESHOLD
+        self.max_misses = max_misses if max_misses is not None else config.TRACKER_MAX_MISSES
+        self.tracks = []
+        self.last_agreement = 1.0  # How well predictions matched the last detections (0-1)
+        self.last_time = None  # Capture time of the last predict
+        self._ids = itertools.count(1)
+
+    def predict(self, timestamp=None):
+        """
+        Advance every track to this frame (call once per frame, before update)
+        timestamp: capture time in seconds (None = one frame at config.FPS)
+        Returns: Detections with track_id, marked predicted
+        """
+        if timestamp is None:
+            dt = 1.0 / config.FPS
+        else:
+            # First frame, or the clock went back (seek): nothing to advance
+            dt = timestamp - self.last_time if self.last_time is not None else 0.0
+            self.last_time = timestamp
+        for track in self.tracks:
+            track.predict(dt)
+        return self.person_boxes(predicted=True)
+
+    def update(self, person_boxes):
+        """
+        Associate this frame's detections with the predicted tracks
+        person_boxes: PersonDetector output (Detections)
+        Returns: Detections with track_id
+        """
+        person_boxes = Detections.from_dicts(person_boxes)
+        detections = person_boxes.xyxy
+        confidences = person_boxes.confidence
+        iou = iou_matrix([track.xyxy for track in self.tracks], detections)
+        matches = greedy_match(iou, self.iou_threshold)
+
+        # Agreement: mean IoU, unmatched tracks/detections count as 0
+        expected = max(len(self.tracks), len(detections))
+        self.last_agreement = sum(m[2] for m in matches) / expected if expected else 1.0
+
+        matched_tracks, matched_dets = set(), set()
+        for r, c, _ in matches:
+            self.tracks[r].update(detections[c], float(confidences[c]))
+            matched_tracks.add(r)
+            matched_dets.add(c)
+
+        survivors = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        for c, box in enumerate(detections):
+            if c not in matched_dets:
+                survivors.append(KalmanBoxTrack(next(self._ids), box, float(confidences[c])))
+        self.tracks = survivors
+
+        return self.person_boxes()
+
+    def person_boxes(self, predicted=False):
+        """
+        Tracks seen in the last detection round, as Detections with track_id
+        predicted: the boxes are Kalman predictions, not this frame's detections
+        """
+        visible = [track for track in self.tracks if track.misses == 0]
+        data = np.zeros((len(visible), NUM_COLUMNS), dtype=np.float32)
+        for i, track in enumerate(visible):
+            data[i, :4] = track.xyxy
+            data[i, CONF] = track.confidence
+            data[i, TRACK_ID] = track.track_id
+        return Detections(data, predicted=predicted)
+
+    def reset(self):
+        """Drop all tracks"""
+        self.tracks = []
+        self.last_agreement = 1.0
+        self.last_time = None
+
+
+class KinematicTrack:
+    CHAOS_MIN_MOVES = 3  # Significant moves needed before chaos is scored
+
+    def __init__(self, track_id, box, frame_index, timestamp):
+        """
+        One person's motion state, updated incrementally (O(1) per frame)
+        Works on capture timestamps: speeds are px/s over time windows, so the
+        same motion scores the same at any frame rate. Only measured boxes make
+        steps - center and last_time are the last detection, and predicted boxes
+        between detections just move the box used for matching
+        """
+        self.track_id = track_id
+        self.box = np.asarray(box, dtype=np.float64)
+        self.center = (self.box[:2] + self.box[2:]) / 2
+        self.velocity = np.zeros(2)      # px/s
+        self.acceleration = np.zeros(2)  # px/s^2
+        self.last_seen = frame_index
+        self.last_time = timestamp
+        self.misses = 0
+
+        self.speed_window = config.SPEED_WINDOW_SECONDS
+        self.impact_window = config.IMPACT_WINDOW_SECONDS
+        # Steps: duration, path length, horizontal path length
+        self.steps = TimeWindow(('dt', 'distance', 'dx'),
+                                spans=(self.speed_window, self.impact_window / 2, self.impact_window))
+        self.direction_changes = DirectionChangeCounter(window=config.CHAOS_WINDOW_SECONDS,
+                                                        min_step=config.CHAOS_MIN_SPEED)
+
+    def update(self, box, frame_index, timestamp, measured=True):
+        """
+        Move to this frame's box (a gap of unseen or predicted frames is one longer step)
+        measured: False for a tracker prediction - it isn't evidence of motion, so it
+                  doesn't feed speed, impact or chaos
+        """
+        box = np.asarray(box, dtype=np.float64)
+        if not measured:
+            self.box = box
+            self.last_seen = frame_index
+            self.misses = 0
+            return
+        center = (box[:2] + box[2:]) / 2
+        dt = timestamp - self.last_time
+        if dt <= 0:
+            self.box, self.center = box, center
+            self.last_seen = frame_index
+            self.misses = 0
+            return
+
+        step = center - self.center
+        velocity = step / dt
+        self.acceleration = (velocity - self.velocity) / dt if len(self.steps) else np.zeros(2)
+        self.velocity = velocity
+        self.steps.append(timestamp, (dt, math.hypot(step[0], step[1]), abs(step[0])))
+        self.direction_changes.add(velocity[0], velocity[1], timestamp)
+
+        self.box, self.center = box, center
+        self.last_seen = frame_index
+        self.last_time = timestamp
+        self.misses = 0
+
+    def speed(self):
+        """Mean speed (px/s) over the speed window (None before the first step)"""
+        dt = self.steps.sum('dt', self.speed_window)
+        if dt <= 0:
+            return None
+        return self.steps.sum('distance', self.speed_window) / dt
+
+    def impact_speeds(self):
+        """
+        Mean horizontal speed (px/s) before and after the middle of the impact window
+        Returns: (before, after), or None until both halves have steps and the
+                 window is at least half covered
+        """
+        half = self.impact_window / 2
+        total_dt = self.steps.sum('dt', self.impact_window)
+        after_dt = self.steps.sum('dt', half)
+        before_dt = total_dt - after_dt
+        if after_dt <= 0 or before_dt <= 1e-9 or total_dt < half:
+            return None
+        after = self.steps.sum('dx', half)
+        before = self.steps.sum('dx', self.impact_window) - after
+        return before / before_dt, after / after_dt
+
+    def direction_change_ratio(self):
+        """Direction changes per significant move in the chaos window (None below CHAOS_MIN_MOVES)"""
+        moves = self.direction_changes.moves()
+        if moves < self.CHAOS_MIN_MOVES:
+            return None
+        return self.direction_changes.count() / moves
+
+
+class KinematicTracker:
+    def __init__(self, iou_threshold=None, match_distance=None, max_misses=None):
+        """
+        Stable person IDs across frames plus per-person kinematics for scoring
+        Uses upstream track IDs when the detections carry them (TrackingPersonDetector),
+        otherwise matches by IoU, then by centre distance for fast movers
+        """
+        self.iou_threshold = iou_threshold or config.TRACKER_IOU_THRESHOLD
+        self.match_distance = match_distance or config.KINEMATIC_MATCH_DISTANCE
+        self.max_misses = max_misses if max_misses is not None else config.KINEMATIC_MAX_MISSES
+        self.tracks = []
+        self.frame_index = 0
+        self._ids = itertools.count(1)
+
+    def update(self, person_boxes, timestamp=None):
+        """
+        Advance one frame with this frame's person boxes
+        timestamp: capture time in seconds (None = frame count at config.FPS)
+        Returns: tracks seen in this frame
+        """
+        self.frame_index += 1
+        if timestamp is None:
+            timestamp = self.frame_index / config.FPS
+        person_boxes = Detections.from_dicts(person_boxes)
+        boxes = person_boxes.xyxy.astype(np.float64)
+        ids = person_boxes.track_id
+        measured = not person_boxes.predicted
+
+        if len(boxes) and np.all(ids != NO_TRACK):
+            matches = self._match_ids(ids)
+        else:
+            matches = self._match_boxes(boxes)
+
+        matched_tracks = {r for r, _ in matches}
+        matched_dets = {c for _, c in matches}
+        for r, c in matches:
+            self.tracks[r].update(boxes[c], self.frame_index, timestamp, measured)
+
+        survivors = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        for c in range(len(boxes)):
+            if c not in matched_dets:
+                track_id = int(ids[c]) if ids[c] != NO_TRACK else next(self._ids)
+                survivors.append(KinematicTrack(track_id, boxes[c], self.frame_index, timestamp))
+        self.tracks = survivors
+
+        return [track for track in self.tracks if track.last_seen == self.frame_index]
+
+    def _match_ids(self, ids):
+        """Match by the detector's own track IDs"""
+        index = {track.track_id: r for r, track in enumerate(self.tracks)}
+        return [(index[int(track_id)], c) for c, track_id in enumerate(ids) if int(track_id) in index]
+
+    def _match_boxes(self, boxes):
+        """Match by IoU, then leftover tracks/detections by centre distance"""
+        if not self.tracks or len(boxes) == 0:
+            return []
+        track_boxes = np.array([track.box for track in self.tracks])
+        matches = [(r, c) for r, c, _ in greedy_match(iou_matrix(track_boxes, boxes), self.iou_threshold)]
+
+        rows = np.setdiff1d(np.arange(len(track_boxes)), [r for r, _ in matches])
+        cols = np.setdiff1d(np.arange(len(boxes)), [c for _, c in matches])
+        if len(rows) and len(cols):
+            track_centers = (track_boxes[rows, :2] + track_boxes[rows, 2:]) / 2
+            centers = (boxes[cols, :2] + boxes[cols, 2:]) / 2
+            diff = track_centers[:, None, :] - centers[None, :, :]
+            dist = np.hypot(diff[..., 0], diff[..., 1])
+            gate = self.match_distance * np.hypot(*(track_boxes[rows, 2:] - track_boxes[rows, :2]).T)
+            closeness = 1.0 - dist / np.maximum(gate, 1e-9)[:, None]
+            matches += [(rows[r], cols[c]) for r, c, _ in greedy_match(closeness, 1e-9)]
+        return matches
+
+    def reset(self):
+        """Drop all tracks"""
+        self.tracks = []
+
+
+class DetectionScheduler:
+    def __init__(self, min_stride=None, max_stride=None, change_ratio=None):
+        """
+        Decides which frames run the person detector
+        Stride grows while tracker predictions agree with detections and
+        shrinks when they don't; a sharp jump in frame-to-frame change
+        (someone entering, a sudden fight) forces a detection immediately
+        """
+        self.min_stride = max(1, min_stride or config.MIN_DETECTION_STRIDE)
+        self.max_stride = max(self.min_stride, max_stride or config.MAX_DETECTION_STRIDE)
+        self._max_stride = self.max_stride  # Configured max (set_min_stride may raise it)
+        self.change_ratio = change_ratio or config.DETECTION_CHANGE_RATIO
+        self.stride = self.min_stride
+        self.pool = FramePool()
+
+        self._since_detection = None  # None = detect on the next frame
+        self._thumb_slot = 0
+        self._prev_thumb = None
+        self._baseline = None  # Running average of frame-to-frame change
+
+        # Stats
+        self.frames = 0
+        self.detections = 0
+        self.forced = 0
+
+    def _change(self, frame):
+        """Mean absolute difference between tiny grayscale thumbnails of consecutive frames"""
+        small = self.pool.resize('thumb_bgr', frame, (64, 48), interpolation=cv2.INTER_AREA)
+        thumb = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self.pool.get(f'thumb{self._thumb_slot}', (48, 64)))
+        self._thumb_slot = 1 - self._thumb_slot
+
+        prev, self._prev_thumb = self._prev_thumb, thumb
+        if prev is None:
+            return 0.0
+        return cv2.norm(prev, thumb, cv2.NORM_L1) / thumb.size
+
+    def should_detect(self, frame):
+        """Call once per frame - True if the person detector should run on it"""
+        self.frames += 1
+        change = self._change(frame)
+
+        sharp = False
+        if self._baseline is None:
+            self._baseline = change
+        else:
+            sharp = change > max(self.change_ratio * self._baseline, 2.0)
+            self._baseline += 0.1 * (change - self._baseline)
+
+        due = self._since_detection is None or self._since_detection + 1 >= self.stride
+        if due or sharp:
+            if sharp and not due:
+                self.forced += 1
+                self.stride = self.min_stride  # Scene is changing - follow it closely
+            self._since_detection = 0
+            self.detections += 1
+            return True
+
+        self._since_detection += 1
+        return False
+
+    def record(self, agreement):
+        """Adapt the stride to how well the tracker predicted the last detection"""
+        if agreement >= 0.7:
+            self.stride = min(self.max_stride, self.stride + 1)
+        elif agreement < 0.5:
+            self.stride = max(self.min_stride, self.stride // 2)
+
+    def set_min_stride(self, min_stride):
+        """Raise (or restore) the lowest stride, e.g. from the quality controller"""
+        self.min_stride = max(1, int(min_stride))
+        self.max_stride = max(self._max_stride, self.min_stride)
+        self.stride = min(max(self.stride, self.min_stride), self.max_stride)
+
+    def reset(self):
+        """Detect on the next frame and forget the change baseline"""
+        self.stride = self.min_stride
+        self._since_detection = None
+        self._prev_thumb = None
+        self._baseline = None
+
+    def get_stats(self):
+        """Get current stride and how often the detector actually ran"""
+        return {
+            'stride': self.stride,
+            'frames': self.frames,
+            'detections': self.detections,
+            'forced': self.forced,
+            'detect_ratio': round(self.detections / self.frames, 3) if self.frames else 0.0
+        }
+
+
+class TrackingPersonDetector:
+    def __init__(self, detector, min_stride=None, max_stride=None):
+        """
+        Per-camera wrapper around the shared person detector
+        Runs detection every N frames (adaptive, see DetectionScheduler) and
+        carries boxes forward with PersonTracker in between, so callers still
+        get person boxes on every frame
+        """
+        self.detector = detector
+        self.tracker = PersonTracker()
+        self.scheduler = DetectionScheduler(min_stride, max_stride)
+        self.last_detected = False  # Whether the last frame ran the detector
+
+    def detect_people(self, frame, motion_boxes=None, imgsz=None, timestamp=None):
+        """
+        Detected or tracked people in frame
+        motion_boxes: (x, y, w, h) motion boxes - detect on crops around them (and
+                      around current tracks) instead of the full frame
+        imgsz: model input size for full-frame detection
+        timestamp: capture time in seconds - tracks are predicted forward by the
+                   real gap since the last frame (None = one frame at config.FPS)
+        Returns: people_detected (bool), person_boxes (Detections, with track_id;
+                 .predicted on frames the detector skipped)
+        """
+        person_boxes = self.tracker.predict(timestamp)
+        self.last_detected = self.scheduler.should_detect(frame)
+        if self.last_detected:
+            if motion_boxes is None:
+                _, detections = self.detector.detect_people(frame, imgsz=imgsz)
+            else:
+                # Tracked people stay in view even when they stop moving
+                rois = list(motion_boxes) + [(x1, y1, x2 - x1, y2 - y1)
+                                             for x1, y1, x2, y2 in person_boxes.boxes.tolist()]
+                _, detections = self.detector.detect_people_in_rois(frame, rois)
+            person_boxes = self.tracker.update(detections)
+            self.scheduler.record(self.tracker.last_agreement)
+        return len(person_boxes) > 0, person_boxes
+
+    def detect_people_in_rois(self, frame, motion_boxes, timestamp=None):
+        """Detected or tracked people, detecting on crops around motion and tracks"""
+        return self.detect_people(frame, motion_boxes, timestamp=timestamp)
+
+    def reset(self):
+        """Drop tracks and detect on the next frame (e.g. after a seek)"""
+        self.tracker.reset()
+        self.scheduler.reset()
+
+    def get_stats(self):
+        """Get detection stride stats and active track count"""
+        stats = self.scheduler.get_stats()
+        stats['tracks'] = len(self.tracker.tracks)
+        return stats
+
+    def draw_person_boxes(self, frame, person_boxes):
+        """Draw boxes around detected people"""
+        return self.detector.draw_person_boxes(frame, person_boxes)
+
+    def create_person_mask(self, frame, person_boxes):
+        """Create a mask showing only person regions"""
+        return self.detector.create_person_mask(frame, person_boxes)
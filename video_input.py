@@ -1,52 +1,333 @@
 """
 Enhanced Video Input Module
 Supports webcam, video files, and RTSP streams
+Optional background capture thread with a preallocated ring buffer
+Strided / time-range decoding for uploaded video analysis
 """
 import cv2
+import threading
+import time
+import numpy as np
+from collections import deque
 import config
 
+# Capture modes for threaded input
+MODE_LATEST = 'latest'    # Live feeds: always hand out the newest frame, drop stale ones
+MODE_ORDERED = 'ordered'  # Files: lossless, every frame in order (producer waits)
+
+STREAM_PREFIXES = ('rtsp://', 'rtmp://', 'http://', 'https://')
+
+
 class VideoInput:
-    def __init__(self, source=None):
+    def __init__(self, source=None, threaded=False, mode=None, buffer_size=None,
+                 stride=1, start_time=None, end_time=None):
         """
         Initialize video input
         source: camera ID (int), video file path (str), or RTSP URL (str)
+        threaded: decode in a background thread into a ring buffer
+        mode: 'latest' or 'ordered' (None = 'latest' for cameras/streams, 'ordered' for files)
+        buffer_size: number of preallocated frame slots in the ring buffer
+        stride: files only - deliver every Nth frame, skipped frames are grabbed but never retrieved
+        start_time, end_time: files only - analyse just this range (seconds)
         """
         self.source = source if source is not None else config.CAMERA_ID
         self.cap = None
         self.frame_count = 0
         self.is_camera = isinstance(self.source, int)
+        self.is_stream = self.is_camera or str(self.source).lower().startswith(STREAM_PREFIXES)
+        
+        # Strided / range decoding (ignored for live sources)
+        self.stride = 1 if self.is_stream else max(int(stride), 1)
+        self.start_time = None if self.is_stream else start_time
+        self.end_time = None if self.is_stream else end_time
+        self.position = 0              # Source index of the next frame to decode
+        self.last_frame_index = -1     # Source index of the last delivered frame
+        self.last_timestamp = None     # Capture time of the last delivered frame (seconds)
+        self._source_fps = config.FPS
+        self._grab_time = None
+        self._end_frame = None
+        self._first_read = True
+        self.output_size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)  # (width, height) frames are resized to
+        
+        # Threaded capture settings
+        self.threaded = threaded
+        self.mode = mode or config.CAPTURE_MODE or (MODE_LATEST if self.is_stream else MODE_ORDERED)
+        self.buffer_size = max(buffer_size or config.CAPTURE_BUFFER_SIZE, config.CAPTURE_CONSUMER_HOLD + 2)
+        
+        # Ring buffer state (only used when threaded)
+        self._slots = []           # Preallocated frame arrays
+        self._free = deque()       # Slot indices the producer may write into
+        self._filled = deque()     # Slot indices waiting for the consumer (oldest first)
+        self._leased = deque()     # Slot indices currently held by the consumer
+        self._slot_frame_index = []  # Source frame index stored in each slot
+        self._slot_timestamp = []    # Capture time of the frame in each slot
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._eof = False
+        
+        # Capture counters
+        self.frames_captured = 0
+        self.frames_delivered = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
         
     def open(self):
         """Open video source"""
-        self.cap = cv2.VideoCapture(self.source)
+        self.cap = self._open_capture()
         
         if not self.cap.isOpened():
             raise RuntimeError(f"Failed to open video source: {self.source}")
         
-        # Set camera properties if using webcam
-        if self.is_camera:
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, config.FRAME_WIDTH)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.FRAME_HEIGHT)
-            self.cap.set(cv2.CAP_PROP_FPS, config.FPS)
+        # Seek to the requested time range (files only)
+        if not self.is_stream:
+            fps = self._source_fps = self.get_fps() or config.FPS
+            if self.start_time:
+                self.position = int(self.start_time * fps)
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.position)
+            if self.end_time is not None:
+                self._end_frame = int(self.end_time * fps)
+        
+        if self.threaded:
+            self._start_capture_thread()
         
         print(f"✓ Video source opened: {self.source}")
         return self.cap
     
+    def _open_capture(self):
+        """Create the OpenCV capture (webcams get our resolution and fps)"""
+        cap = cv2.VideoCapture(self.source)
+        if self.is_camera and cap.isOpened():
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, config.FRAME_WIDTH)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.FRAME_HEIGHT)
+            cap.set(cv2.CAP_PROP_FPS, config.FPS)
+        return cap
+    
+    def _reconnect(self, attempts=None):
+        """
+        Reopen a live source after a failed read (RTSP drop, USB stall)
+        Retries every CAPTURE_RECONNECT_DELAY seconds until it opens or release() is called
+        attempts: give up after this many tries (None = keep trying)
+        Returns: True if the source is open again
+        """
+        tries = 0
+        while attempts is None or tries < attempts:
+            tries += 1
+            with self._cond:
+                if self._cond.wait_for(lambda: self._stopping, timeout=config.CAPTURE_RECONNECT_DELAY):
+                    return False
+            self.cap.release()
+            cap = self._open_capture()
+            with self._cond:
+                if self._stopping:
+                    cap.release()
+                    return False
+                if cap.isOpened():
+                    self.cap = cap
+                    self.reconnects += 1
+                    print(f"✓ Video source reconnected: {self.source}")
+                    return True
+            cap.release()
+            print(f"❌ Reconnect to {self.source} failed (attempt {tries})")
+        return False
+    
     def read_frame(self):
         """Read and preprocess a frame"""
-        ret, frame = self.cap.read()
+        if self.threaded:
+            return self._read_buffered()
+        
+        ret, frame = self._decode_next()
+        if not ret and self.is_stream and self._reconnect(attempts=1):
+            ret, frame = self._decode_next()
         if ret:
             self.frame_count += 1
+            self.last_frame_index = self.position - 1
+            self.last_timestamp = self._timestamp()
             # Resize frame for consistent processing
-            frame = cv2.resize(frame, (config.FRAME_WIDTH, config.FRAME_HEIGHT))
+            frame = cv2.resize(frame, self.output_size)
+        return ret, frame
+    
+    def set_output_size(self, width, height):
+        """
+        Change the size frames are delivered at (e.g. by the quality controller)
+        Each frame is still resized once, straight from the decoder; frames already
+        buffered keep the old size
+        """
+        self.output_size = (int(width), int(height))
+    
+    def _decode_next(self):
+        """
+        Decode the next sampled frame from the source
+        Frames skipped by the stride are only grabbed (or seeked over), never
+        retrieved, so they cost no colour conversion or resize
+        Returns: ret, raw frame
+        """
+        skip = 0 if self._first_read else self.stride - 1
+        self._first_read = False
+        
+        if self._end_frame is not None and self.position + skip >= self._end_frame:
+            return False, None
+        
+        if skip >= config.SEEK_STRIDE_THRESHOLD:
+            # Long jumps: seeking beats grabbing every intermediate frame
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.position + skip)
+            self.position += skip
+        else:
+            for _ in range(skip):
+                if not self.cap.grab():
+                    return False, None
+                self.position += 1
+        
+        if not self.cap.grab():
+            return False, None
+        self._grab_time = time.monotonic()
+        ret, frame = self.cap.retrieve()
+        self.position += 1
         return ret, frame
     
+    def _timestamp(self):
+        """
+        Capture time of the frame just decoded: media time for files (so strides
+        and time ranges keep true spacing), grab time for live sources
+        """
+        if self.is_stream:
+            return self._grab_time
+        return (self.position - 1) / self._source_fps
+    
+    def _start_capture_thread(self):
+        """Preallocate the ring buffer and start the producer thread"""
+        shape = (config.FRAME_HEIGHT, config.FRAME_WIDTH, 3)
+        self._slots = [np.empty(shape, dtype=np.uint8) for _ in range(self.buffer_size)]
+        self._slot_frame_index = [-1] * self.buffer_size
+        self._slot_timestamp = [None] * self.buffer_size
+        self._free = deque(range(self.buffer_size))
+        self._filled.clear()
+        self._leased.clear()
+        self._stopping = False
+        self._eof = False
+        
+        self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+        self._thread.start()
+    
+    def _acquire_free_slot(self):
+        """
+        Get a slot for the producer to decode into (called with lock held)
+        Latest mode steals the oldest undelivered frame, ordered mode waits
+        Returns: slot index or None when stopping
+        """
+        while not self._free:
+            if self._stopping:
+                return None
+            if self.mode == MODE_LATEST and self._filled:
+                self.frames_dropped += 1
+                return self._filled.popleft()
+            self._cond.wait()
+        return self._free.popleft()
+    
+    def _capture_loop(self):
+        """Producer: decode frames into the ring buffer until EOF or stop"""
+        try:
+            while not self._stopping:
+                ret, frame = self._decode_next()
+                if not ret:
+                    # Live feeds only end on release() - a failed read means reconnect
+                    if self.is_stream and self._reconnect():
+                        continue
+                    break
+                
+                with self._cond:
+                    slot = self._acquire_free_slot()
+                    if slot is None:
+                        break
+                
+                # Decode target is owned by the producer now - resize outside the lock
+                width, height = self.output_size
+                if self._slots[slot].shape[:2] != (height, width):
+                    # Output size changed - this slot is reallocated once
+                    self._slots[slot] = np.empty((height, width, 3), dtype=np.uint8)
+                cv2.resize(frame, (width, height), dst=self._slots[slot])
+                self._slot_frame_index[slot] = self.position - 1
+                self._slot_timestamp[slot] = self._timestamp()
+                
+                with self._cond:
+                    self._filled.append(slot)
+                    self.frames_captured += 1
+                    self._cond.notify_all()
+        finally:
+            # The capture thread owns cap while it runs - it is released here, never under a live grab()
+            self.cap.release()
+            print("✓ Video source released")
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+    
+    def _read_buffered(self):
+        """
+        Consumer: take the next frame from the ring buffer
+        Waits through source stalls - only EOF or release() end the stream
+        """
+        with self._cond:
+            stalled = False
+            while not self._filled and not self._eof and not self._stopping:
+                if not self._cond.wait(timeout=config.CAPTURE_READ_TIMEOUT) and not stalled:
+                    print(f"⏱ No frame from {self.source} for {config.CAPTURE_READ_TIMEOUT:g}s - waiting")
+                    stalled = True
+            
+            if not self._filled:
+                return False, None
+            
+            # Live feeds: skip everything except the newest frame
+            if self.mode == MODE_LATEST:
+                while len(self._filled) > 1:
+                    self._free.append(self._filled.popleft())
+                    self.frames_dropped += 1
+            
+            slot = self._filled.popleft()
+            self._leased.append(slot)
+            
+            # Keep the last few frames valid for the caller (e.g. prev_frame)
+            while len(self._leased) > config.CAPTURE_CONSUMER_HOLD:
+                self._free.append(self._leased.popleft())
+            
+            self.frames_delivered += 1
+            self.frame_count += 1
+            self.last_frame_index = self._slot_frame_index[slot]
+            self.last_timestamp = self._slot_timestamp[slot]
+            self._cond.notify_all()
+        
+        return True, self._slots[slot]
+    
+    def get_capture_stats(self):
+        """Get capture counters (queue depth shows when the detector falls behind)"""
+        with self._cond:
+            queue_depth = len(self._filled)
+        return {
+            'threaded': self.threaded,
+            'capture_mode': self.mode if self.threaded else 'direct',
+            'frames_captured': self.frames_captured if self.threaded else self.frame_count,
+            'frames_delivered': self.frames_delivered if self.threaded else self.frame_count,
+            'frames_dropped': self.frames_dropped,
+            'reconnects': self.reconnects,
+            'queue_depth': queue_depth,
+            'buffer_size': self.buffer_size if self.threaded else 0,
+            'stride': self.stride
+        }
+    
     def get_fps(self):
         """Get actual FPS of the video source"""
         if self.cap:
             return self.cap.get(cv2.CAP_PROP_FPS)
         return config.FPS
     
+    def get_timestamp(self):
+        """Capture time (seconds) of the last delivered frame - for time-based scoring"""
+        return self.last_timestamp
+    
+    def get_position_seconds(self):
+        """Get source time of the last delivered frame (for video files)"""
+        fps = self.get_fps() or config.FPS
+        return max(self.last_frame_index, 0) / fps
+    
     def get_total_frames(self):
         """Get total number of frames (for video files)"""
         if self.cap and not self.is_camera:
@@ -54,8 +335,20 @@ class VideoInput:
         return None
     
     def release(self):
-        """Release video capture"""
-        if self.cap:
+        """
+        Release video capture
+        Threaded: the capture thread releases it on exit - if it is still blocked in a
+        read or reconnect after the join timeout, it does so as soon as that returns
+        """
+        if self._thread:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify_all()
+            self._thread.join(timeout=2.0)
+            if self._thread.is_alive():
+                print(f"⏱ Capture thread for {self.source} still busy - source is released when it returns")
+            self._thread = None
+        elif self.cap and not self.threaded:
             self.cap.release()
             print("✓ Video source released")
     
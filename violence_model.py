@@ -0,0 +1,414 @@
+"""
+Learned Violence Scorer
+Offline: per-window RealAdvancedDetector features are extracted from each
+training video once, into a memory-mapped cache keyed by video hash, and a
+logistic regression is trained on them on CPU. Online: one dot product per
+frame on the feature window the detector already maintains
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import cv2
+import numpy as np
+import config
+from smart_detector import RealAdvancedDetector, FEATURE_NAMES
+from motion_detector import MotionDetector
+from optical_flow import FlowFeatureExtractor
+from tracker import TrackingPersonDetector
+
+
+# Bump when feature extraction changes - older cache entries are then ignored
+FEATURE_VERSION = 4
+NUM_FEATURES = 2 * len(FEATURE_NAMES)  # Current frame + window mean
+
+HASH_CHUNK = 1 << 20  # Bytes hashed from each end of a video
+
+
+def video_hash(path):
+    """
+    Content key for a video: size + first and last MiB (fast on large files,
+    and unchanged when the file is renamed or moved)
+    """
+    sha = hashlib.sha1()
+    size = os.path.getsize(path)
+    sha.update(str(size).encode())
+    with open(path, 'rb') as f:
+        sha.update(f.read(HASH_CHUNK))
+        if size > 2 * HASH_CHUNK:
+            f.seek(-HASH_CHUNK, os.SEEK_END)
+            sha.update(f.read(HASH_CHUNK))
+    return sha.hexdigest()[:20]
+
+
+class FeatureCache:
+    def __init__(self, cache_dir=None):
+        """Per-video feature arrays on disk (.npy), opened memory-mapped"""
+        self.cache_dir = cache_dir or config.FEATURE_CACHE_DIR
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}-v{FEATURE_VERSION}.npy")
+
+    def get(self, key):
+        """Cached windows x NUM_FEATURES array (memory-mapped), or None"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode='r')
+
+    def put(self, key, features):
+        """Store features (atomically - an interrupted write never looks cached)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp = path + '.tmp.npy'
+        np.save(tmp, np.asarray(features, dtype=np.float32).reshape(-1, NUM_FEATURES))
+        os.replace(tmp, path)
+        return self.get(key)
+
+
+def extract_video_features(path, person_detector):
+    """
+    Run the live per-frame pipeline over a video and sample the scorer input
+    every FEATURE_HOP_SECONDS of media time (the same time base the live scorer uses)
+    Returns: windows x NUM_FEATURES float32 array
+    """
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video: {path}")
+
+    if config.TRACK_BETWEEN_DETECTIONS:
+        person_detector = TrackingPersonDetector(person_detector)
+    motion = MotionDetector('advanced')
+    flow_extractor = FlowFeatureExtractor() if config.OPTICAL_FLOW_ENABLED else None
+    detector = RealAdvancedDetector()
+    size = (config.FRAME_WIDTH, config.FRAME_HEIGHT)
+    fps = cap.get(cv2.CAP_PROP_FPS) or config.FPS
+    tracking = isinstance(person_detector, TrackingPersonDetector)
+
+    windows = []
+    first = next_sample = None
+    index = -1
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            index += 1
+            timestamp = index / fps  # Media time, as VideoInput reports for files
+            track_time = {'timestamp': timestamp} if tracking else {}
+            frame = cv2.resize(frame, size)
+
+            # Same steps as run_detection (frames without people aren't scored there either)
+            people_detected, person_boxes = person_detector.detect_people(frame, **track_time)
+            if not people_detected:
+                motion.skip_frame(frame)
+                if flow_extractor:
+                    flow_extractor.skip_frame(frame, timestamp)
+                continue
+
+            if config.MOTION_IN_PERSON_ROIS:
+                _, boxes, _ = motion.detect_motion_rois(frame, person_boxes, timestamp)
+            else:
+                _, boxes, _ = motion.detect_motion_next(frame, timestamp=timestamp)
+            flow = flow_extractor.update(frame, person_boxes, timestamp) if flow_extractor else None
+            detector.analyze_violence(person_boxes, boxes, frame.shape, flow=flow, timestamp=timestamp)
+
+            if first is None:
+                first = timestamp
+                next_sample = first + config.FEATURE_WINDOW_SECONDS
+            if timestamp >= next_sample - 1e-6:
+                windows.append(detector.window_features())
+                # One window per hop - hops that fell in a gap without people are skipped
+                while next_sample <= timestamp + 1e-6:
+                    next_sample += config.FEATURE_HOP_SECONDS
+    finally:
+        cap.release()
+
+    return np.asarray(windows, dtype=np.float32).reshape(-1, NUM_FEATURES)
+
+
+def training_videos(video_list=None):
+    """Paths of the listed training videos (prefix stripped, relative to this repo)"""
+    with open(video_list or config.TRAINING_VIDEO_LIST) as f:
+        videos = json.load(f)
+    prefix = config.TRAINING_VIDEO_PREFIX
+    return [v[len(prefix):] if prefix and v.startswith(prefix) else v for v in videos]
+
+
+def load_labels(videos, labels_path=None):
+    """
+    One label per training video - labels are never matched to windows by count,
+    so changing window extraction can't shift them against the features
+    labels_path: .json {listed video path: label}, or .npy with one label per listed video in order
+    Returns: labels array aligned with videos
+    Raises: ValueError when the file doesn't give every listed video a label
+    """
+    labels_path = labels_path or config.TRAINING_LABELS
+    if not os.path.exists(labels_path):
+        raise ValueError(f"Labels file not found: {labels_path}")
+
+    if labels_path.endswith('.json'):
+        with open(labels_path) as f:
+            by_path = json.load(f)
+        prefix = config.TRAINING_VIDEO_PREFIX
+        by_path = {k[len(prefix):] if prefix and k.startswith(prefix) else k: v for k, v in by_path.items()}
+        unlabelled = [v for v in videos if v not in by_path]
+        if unlabelled:
+            raise ValueError(f"{len(unlabelled)} listed videos have no label in {labels_path}, "
+                             f"e.g. {unlabelled[0]}")
+        labels = np.array([by_path[v] for v in videos], dtype=np.float64)
+    else:
+        labels = np.load(labels_path, allow_pickle=False).reshape(-1)
+        if len(labels) != len(videos):
+            raise ValueError(f"{labels_path} has {len(labels)} labels for {len(videos)} listed videos - "
+                             f"give one label per video (in list order) or a JSON {{video path: label}}")
+        labels = labels.astype(np.float64)
+
+    if not np.isin(labels, (0, 1)).all():
+        raise ValueError(f"Labels in {labels_path} must be 0 (non-violent) or 1 (violent)")
+    return labels
+
+
+def check_dataset(videos, labels):
+    """
+    Validate the dataset before anything is decoded
+    Returns: videos and labels of the listed videos present on disk
+    Raises: ValueError when there is nothing usable to train on
+    """
+    present = np.array([os.path.exists(v) for v in videos], dtype=bool)
+    if not present.any():
+        raise ValueError(f"None of the {len(videos)} listed training videos exist "
+                         f"(paths are relative to {os.getcwd()})")
+    labels = labels[present]
+    if len(np.unique(labels)) < 2:
+        raise ValueError("Training data needs both violent and non-violent videos")
+    return [v for v, ok in zip(videos, present) if ok], labels
+
+
+def build_dataset(videos, labels, person_detector_factory, cache=None):
+    """
+    Features for every video (cached ones are only memory-mapped, never decoded)
+    labels: one per video
+    person_detector_factory: called once, only if some video needs extracting
+    Returns: X, y, groups (video index per window), stats
+    """
+    cache = cache or FeatureCache()
+
+    features, groups, window_labels = [], [], []
+    stats = {'videos': len(videos), 'cached': 0, 'extracted': 0}
+    person_detector = None
+    for index, path in enumerate(videos):
+        key = video_hash(path)
+        windows = cache.get(key)
+        if windows is None:
+            if person_detector is None:
+                person_detector = person_detector_factory()
+            start = time.perf_counter()
+            windows = cache.put(key, extract_video_features(path, person_detector))
+            stats['extracted'] += 1
+            print(f"✓ Features: {path} ({len(windows)} windows, {time.perf_counter() - start:.1f}s)")
+        else:
+            stats['cached'] += 1
+
+        features.append(windows)
+        groups.append(np.full(len(windows), index))
+        window_labels.append(np.full(len(windows), labels[index]))
+
+    X = np.concatenate(features).astype(np.float64)
+    if not len(X):
+        raise RuntimeError("No feature windows extracted - videos are too short or show no people")
+    return X, np.concatenate(window_labels), np.concatenate(groups), stats
+
+
+class LogisticScorer:
+    architecture = f"Logistic regression ({NUM_FEATURES} window features)"
+
+    def __init__(self, mean, std, weights, bias):
+        """Standardised linear model - predict() is one dot product"""
+        self.mean = mean
+        self.std = std
+        self.weights = weights
+        self.bias = float(bias)
+        # Fold standardisation into the weights
+        self._w = weights / std
+        self._b = self.bias - float(np.dot(mean / std, weights))
+
+    @classmethod
+    def fit(cls, X, y, l2=1e-2, iterations=25):
+        """L2-regularised logistic regression (Newton's method)"""
+        mean = X.mean(axis=0)
+        std = X.std(axis=0)
+        std[std < 1e-9] = 1.0
+        Z = np.hstack([(X - mean) / std, np.ones((len(X), 1))])
+
+        w = np.zeros(Z.shape[1])
+        penalty = l2 * np.eye(Z.shape[1])
+        penalty[-1, -1] = 0.0  # Bias isn't regularised
+        for _ in range(iterations):
+            p = 1.0 / (1.0 + np.exp(-Z @ w))
+            gradient = Z.T @ (p - y) / len(y) + penalty @ w
+            hessian = (Z * (p * (1 - p))[:, None]).T @ Z / len(y) + penalty
+            step = np.linalg.solve(hessian, gradient)
+            w -= step
+            if np.abs(step).max() < 1e-6:
+                break
+        return cls(mean, std, w[:-1], w[-1])
+
+    def predict_proba(self, X):
+        """Violence probability per row"""
+        return 1.0 / (1.0 + np.exp(-(np.asarray(X, dtype=np.float64) @ self._w + self._b)))
+
+    def predict(self, features):
+        """Violence probability (0-1) for one feature window"""
+        z = float(np.dot(features, self._w)) + self._b
+        return 1.0 / (1.0 + math.exp(-z)) if z > -30 else 0.0
+
+    def save(self, path=None):
+        path = path or config.SCORER_MODEL_PATH
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, mean=self.mean, std=self.std, weights=self.weights, bias=self.bias,
+                 feature_version=FEATURE_VERSION)
+
+    @classmethod
+    def load(cls, path=None):
+        data = np.load(path or config.SCORER_MODEL_PATH)
+        if int(data['feature_version']) != FEATURE_VERSION:
+            raise RuntimeError("Scorer was trained on an older feature version - retrain")
+        return cls(data['mean'], data['std'], data['weights'], data['bias'])
+
+
+def evaluate(scorer, X, y):
+    """Accuracy, precision, recall, F1 and confusion matrix [[TN, FP], [FN, TP]]"""
+    predicted = scorer.predict_proba(X) >= 0.5
+    actual = y >= 0.5
+    tp = int(np.sum(predicted & actual))
+    tn = int(np.sum(~predicted & ~actual))
+    fp = int(np.sum(predicted & ~actual))
+    fn = int(np.sum(~predicted & actual))
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        'accuracy': (tp + tn) / len(y) if len(y) else 0.0,
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        'confusion_matrix': [[tn, fp], [fn, tp]]
+    }
+
+
+def split_validation(y, groups, fraction=None, seed=0):
+    """
+    Hold out whole videos (windows of one video are near-duplicates); fall back
+    to a window-level split when that leaves a side without both classes
+    Returns: train mask, validation mask
+    """
+    fraction = config.TRAINING_VALIDATION_SPLIT if fraction is None else fraction
+    rng = np.random.default_rng(seed)
+    videos = np.unique(groups)
+    held_out = rng.permutation(videos)[:max(1, int(round(len(videos) * fraction)))]
+    val = np.isin(groups, held_out)
+    if len(videos) < 5 or any(len(np.unique(y[mask])) < 2 for mask in (val, ~val)):
+        val = rng.random(len(y)) < fraction
+    return ~val, val
+
+
+_train_lock = threading.Lock()
+_training = {'state': 'idle'}  # Status of the last background training run
+
+
+def start_training(person_detector_factory, on_trained=None, video_list=None, labels_path=None):
+    """
+    Validate the dataset, then train in a background thread
+    on_trained: called with the new scorer when training succeeds
+    Raises: ValueError when the dataset is unusable, RuntimeError when training is already running
+    """
+    if not _train_lock.acquire(blocking=False):
+        raise RuntimeError("Training already running")
+    try:
+        listed = training_videos(video_list)
+        videos, labels = check_dataset(listed, load_labels(listed, labels_path))
+    except Exception:
+        _train_lock.release()
+        raise
+
+    _training.clear()
+    _training.update({'state': 'running', 'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                      'videos': len(videos), 'missing': len(listed) - len(videos)})
+
+    def run():
+        try:
+            scorer, info = train_scorer(videos, labels, person_detector_factory, video_list)
+            if on_trained:
+                on_trained(scorer)
+            _training.update({'state': 'done', 'metrics': info})
+        except Exception as e:
+            print(f"❌ Training failed: {e}")
+            _training.update({'state': 'failed', 'error': str(e)})
+        finally:
+            _train_lock.release()
+
+    threading.Thread(target=run, name='train-scorer', daemon=True).start()
+    return dict(_training)
+
+
+def training_status():
+    """State of the last training run ('idle', 'running', 'done' or 'failed')"""
+    return dict(_training)
+
+
+def train_scorer(videos, labels, person_detector_factory, video_list=None):
+    """
+    Build the dataset (extracting only uncached videos), train, evaluate on
+    held-out videos, then refit on everything and save
+    videos, labels: validated by check_dataset()
+    Returns: scorer, training report (metrics, dataset stats)
+    """
+    start = time.perf_counter()
+    X, y, groups, stats = build_dataset(videos, labels, person_detector_factory)
+    if len(np.unique(y)) < 2:
+        raise RuntimeError("Training data needs both violent and non-violent examples")
+
+    train, val = split_validation(y, groups)
+    metrics = evaluate(LogisticScorer.fit(X[train], y[train]), X[val], y[val])
+
+    scorer = LogisticScorer.fit(X, y)
+    scorer.save()
+    info = {
+        'architecture': scorer.architecture,
+        'trained_on': f"{len(np.unique(groups))} videos ({os.path.basename(video_list or config.TRAINING_VIDEO_LIST)})",
+        'num_frames': int(len(X)),
+        'img_size': config.FRAME_WIDTH,
+        'trained_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'train_seconds': round(time.perf_counter() - start, 1),
+        **{k: round(v, 4) if isinstance(v, float) else v for k, v in metrics.items()},
+        **stats
+    }
+    with open(info_path(), 'w') as f:
+        json.dump(info, f, indent=2)
+    print(f"✓ Violence scorer trained: accuracy {metrics['accuracy']:.3f}, F1 {metrics['f1']:.3f} "
+          f"({stats['extracted']} videos extracted, {stats['cached']} cached)")
+    return scorer, info
+
+
+def info_path():
+    """Training report saved next to the model"""
+    return os.path.splitext(config.SCORER_MODEL_PATH)[0] + '.json'
+
+
+def load_scorer():
+    """Trained scorer if enabled and one has been saved, else None (hand-tuned weights)"""
+    if not config.LEARNED_SCORER_ENABLED or not os.path.exists(config.SCORER_MODEL_PATH):
+        return None
+    return LogisticScorer.load()
+
+
+def model_info(loaded):
+    """Saved training report for /model_info"""
+    info = {'model_loaded': loaded is not None, 'architecture': LogisticScorer.architecture}
+    if os.path.exists(info_path()):
+        with open(info_path()) as f:
+            info.update(json.load(f))
+    info['training'] = training_status()
+    return info